@@ -0,0 +1,265 @@
+import json
+import struct
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Layout: MAGIC, uint32 header length, JSON header (padded to 8 bytes), then
+# little-endian arrays: float64 boxes[N x 4] as x, y, width, height,
+# int32 frames[F], int32 counts[F], int32 class_ids[N], uint8 integer_fields[N]
+MAGIC = b'ANB2'
+# Earlier shards: header padded to 4 bytes, int32 frames[F], counts[F],
+# class_ids[N], float32 boxes[N x 4]; still readable
+LEGACY_MAGIC = b'ANB1'
+BOX_FIELDS = ('x', 'y', 'width', 'height')
+LEGACY_COORDINATE_DECIMALS = 3  # ANB1 coordinates come back from float32 rounded to this many places
+MAX_EXACT_INTEGER = 2 ** 53  # Larger integers do not survive float64
+# Extras keyed by object row, renumbered when columns are concatenated
+ROW_EXTRAS = ('objects', 'bboxes', 'raw')
+YOLO_LINE = '%d %.6f %.6f %.6f %.6f\n'
+
+
+@dataclass
+class FrameColumns:
+    """Annotations of a set of frames as flat arrays, one row per object in frame order"""
+
+    frames: np.ndarray  # int32 [F]: annotated frame numbers, ascending
+    counts: np.ndarray  # int32 [F]: objects on each frame
+    class_ids: np.ndarray  # int32 [N]
+    boxes: np.ndarray  # float64 [N, 4]: x, y, width, height in video pixels
+    # Fields outside the schema above, kept so the JSON round-trips:
+    # {"objects": {row: {...}}, "bboxes": {row: {...}}, "frames": {frame: {...}},
+    #  "raw": {row: whole object, for objects the columns cannot hold exactly}}
+    extras: dict = field(default_factory=dict)
+    integer_fields: Optional[np.ndarray] = None  # uint8 [N]: bit i set if BOX_FIELDS[i] was a JSON integer
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    def integer_mask(self) -> np.ndarray:
+        if self.integer_fields is None:
+            return np.zeros(len(self), np.uint8)
+        return self.integer_fields
+
+    def object_frames(self) -> np.ndarray:
+        """Frame number of every object row"""
+        return np.repeat(self.frames, self.counts)
+
+    @classmethod
+    def empty(cls) -> 'FrameColumns':
+        return cls(np.empty(0, np.int32), np.empty(0, np.int32),
+                   np.empty(0, np.int32), np.empty((0, 4), np.float64))
+
+    @classmethod
+    def concat(cls, parts: List['FrameColumns']) -> 'FrameColumns':
+        """Join columns of disjoint frame sets, re-sorted by frame"""
+        parts = [part for part in parts if len(part.frames)]
+        if not parts:
+            return cls.empty()
+        parts.sort(key=lambda part: int(part.frames[0]))
+
+        extras: Dict[str, dict] = {}
+        offset = 0
+        for part in parts:
+            for kind in ROW_EXTRAS:
+                for row, values in part.extras.get(kind, {}).items():
+                    extras.setdefault(kind, {})[str(int(row) + offset)] = values
+            extras.setdefault('frames', {}).update(part.extras.get('frames', {}))
+            offset += len(part)
+        if not extras.get('frames'):
+            extras.pop('frames', None)
+
+        integer_fields = None
+        if any(part.integer_fields is not None for part in parts):
+            integer_fields = np.concatenate([part.integer_mask() for part in parts])
+        return cls(np.concatenate([part.frames for part in parts]),
+                   np.concatenate([part.counts for part in parts]),
+                   np.concatenate([part.class_ids for part in parts]),
+                   np.concatenate([part.boxes.astype(np.float64, copy=False) for part in parts]),
+                   extras, integer_fields)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) \
+        and not (isinstance(value, int) and abs(value) > MAX_EXACT_INTEGER)
+
+
+def _fits_columns(obj) -> bool:
+    """True if the columns can hold an object's class id and box exactly"""
+    bbox = obj.get('bbox')
+    class_id = obj.get('class_id')
+    return isinstance(class_id, int) and not isinstance(class_id, bool) and -2 ** 31 <= class_id < 2 ** 31 \
+        and isinstance(bbox, dict) and all(_is_number(bbox.get(name)) for name in BOX_FIELDS)
+
+
+def columns_from_frames(frames: dict) -> FrameColumns:
+    """Convert the JSON `frames` dict ({"12": {"objects": [...]}}) to columns"""
+    keys = sorted(frames, key=int)
+    counts = np.fromiter((len(frames[key].get('objects', [])) for key in keys), np.int32, len(keys))
+    total = int(counts.sum())
+    class_ids = np.empty(total, np.int32)
+    boxes = np.empty((total, 4), np.float64)
+    integer_fields = np.zeros(total, np.uint8)
+    extras: Dict[str, dict] = {}
+
+    row = 0
+    for key in keys:
+        frame = frames[key]
+        frame_extra = {k: v for k, v in frame.items() if k != 'objects'}
+        if frame_extra:
+            extras.setdefault('frames', {})[key] = frame_extra
+        for obj in frame.get('objects', []):
+            if _fits_columns(obj):
+                bbox = obj['bbox']
+                class_ids[row] = obj['class_id']
+                values = [bbox[name] for name in BOX_FIELDS]
+                boxes[row] = values
+                for bit, value in enumerate(values):
+                    if isinstance(value, int):
+                        integer_fields[row] |= 1 << bit
+                bbox_extra = {k: v for k, v in bbox.items() if k not in BOX_FIELDS}
+                if bbox_extra:
+                    extras.setdefault('bboxes', {})[str(row)] = bbox_extra
+                obj_extra = {k: v for k, v in obj.items() if k not in ('class_id', 'bbox')}
+                if obj_extra:
+                    extras.setdefault('objects', {})[str(row)] = obj_extra
+            else:
+                # Kept verbatim; the columns get a best-effort row so exports see every object
+                bbox = obj.get('bbox') if isinstance(obj.get('bbox'), dict) else {}
+                class_id = obj.get('class_id')
+                class_ids[row] = class_id if isinstance(class_id, int) and -2 ** 31 <= class_id < 2 ** 31 else 0
+                boxes[row] = [bbox[name] if _is_number(bbox.get(name)) else 0 for name in BOX_FIELDS]
+                extras.setdefault('raw', {})[str(row)] = obj
+            row += 1
+
+    return FrameColumns(np.array([int(key) for key in keys], np.int32), counts, class_ids, boxes, extras,
+                        integer_fields if integer_fields.any() else None)
+
+
+def columns_to_frames(columns: FrameColumns) -> dict:
+    """Convert columns back to the JSON `frames` dict"""
+    class_ids = columns.class_ids.tolist()
+    boxes = columns.boxes.astype(np.float64).tolist()
+    integer_fields = columns.integer_mask().tolist()
+    object_extras = columns.extras.get('objects', {})
+    bbox_extras = columns.extras.get('bboxes', {})
+    raw_objects = columns.extras.get('raw', {})
+    frame_extras = columns.extras.get('frames', {})
+
+    frames = {}
+    start = 0
+    for frame_number, count in zip(columns.frames.tolist(), columns.counts.tolist()):
+        objects = []
+        for row in range(start, start + count):
+            key = str(row)
+            if key in raw_objects:
+                objects.append(raw_objects[key])
+                continue
+            integers = integer_fields[row]
+            if integers:
+                bbox = {name: int(value) if integers >> bit & 1 else value
+                        for bit, (name, value) in enumerate(zip(BOX_FIELDS, boxes[row]))}
+            else:
+                bbox = dict(zip(BOX_FIELDS, boxes[row]))
+            bbox.update(bbox_extras.get(key, {}))
+            obj = {"class_id": class_ids[row], "bbox": bbox}
+            obj.update(object_extras.get(key, {}))
+            objects.append(obj)
+        start += count
+        key = str(frame_number)
+        frames[key] = {**frame_extras.get(key, {}), "objects": objects}
+    return frames
+
+
+def _padded(header: bytes) -> bytes:
+    return header + b' ' * (-(8 + len(header)) % 8)  # JSON whitespace keeps the boxes 8-byte aligned
+
+
+def encode_columns(columns: FrameColumns) -> bytes:
+    header = _padded(json.dumps({
+        "frames": len(columns.frames),
+        "objects": len(columns),
+        "extras": columns.extras
+    }, separators=(',', ':')).encode())
+    return b''.join([
+        MAGIC,
+        struct.pack('<I', len(header)),
+        header,
+        columns.boxes.astype('<f8').tobytes(),
+        columns.frames.astype('<i4').tobytes(),
+        columns.counts.astype('<i4').tobytes(),
+        columns.class_ids.astype('<i4').tobytes(),
+        columns.integer_mask().astype('u1').tobytes(),
+    ])
+
+
+def is_binary_shard(data: bytes) -> bool:
+    return data[:4] in (MAGIC, LEGACY_MAGIC)
+
+
+def decode_columns(data: bytes) -> FrameColumns:
+    """Parse encode_columns() output (or an ANB1 shard); the arrays are read-only views of data"""
+    if not is_binary_shard(data):
+        raise ValueError("Not a binary annotation shard")
+    (header_length,) = struct.unpack_from('<I', data, 4)
+    offset = 8 + header_length
+    header = json.loads(data[8:offset])
+    frame_count, object_count = header['frames'], header['objects']
+
+    def take(dtype, count):
+        nonlocal offset
+        array = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += array.nbytes
+        return array
+
+    if data[:4] == LEGACY_MAGIC:
+        frames = take('<i4', frame_count)
+        counts = take('<i4', frame_count)
+        class_ids = take('<i4', object_count)
+        boxes = np.round(take('<f4', object_count * 4).reshape(object_count, 4).astype(np.float64),
+                         LEGACY_COORDINATE_DECIMALS)
+        return FrameColumns(frames, counts, class_ids, boxes, header.get('extras', {}))
+
+    boxes = take('<f8', object_count * 4).reshape(object_count, 4)
+    frames = take('<i4', frame_count)
+    counts = take('<i4', frame_count)
+    class_ids = take('<i4', object_count)
+    integer_fields = take('u1', object_count)
+    return FrameColumns(frames, counts, class_ids, boxes, header.get('extras', {}), integer_fields)
+
+
+def encode_frames(frames: dict, binary: bool = False) -> bytes:
+    """Serialize a `frames` dict as a binary shard, or as compact JSON"""
+    if binary:
+        return encode_columns(columns_from_frames(frames))
+    return json.dumps({"frames": frames}, separators=(',', ':')).encode()
+
+
+def decode_frames(data: bytes) -> dict:
+    """`frames` dict from either shard encoding"""
+    if is_binary_shard(data):
+        return columns_to_frames(decode_columns(data))
+    return json.loads(data)['frames']
+
+
+def decode_frame_columns(data: bytes) -> FrameColumns:
+    """Columns from either shard encoding"""
+    if is_binary_shard(data):
+        return decode_columns(data)
+    return columns_from_frames(json.loads(data)['frames'])
+
+
+def yolo_rows(columns: FrameColumns, video_width: float, video_height: float) -> np.ndarray:
+    """[N, 5] float64 rows of class_id, x_center, y_center, width, height (normalized 0-1)"""
+    boxes = columns.boxes.astype(np.float64)
+    scale = np.array([video_width or 1, video_height or 1] * 2, np.float64)
+    return np.column_stack([
+        columns.class_ids,
+        np.hstack([boxes[:, :2] + boxes[:, 2:] / 2, boxes[:, 2:]]) / scale
+    ])
+
+
+def yolo_text(rows: np.ndarray) -> bytes:
+    """YOLO label lines for yolo_rows() output, formatted in one pass (about 2x np.savetxt)"""
+    return ((YOLO_LINE * len(rows)) % tuple(rows.ravel().tolist())).encode()
@@ -0,0 +1,501 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.core.exceptions import (HttpResponseError, ResourceExistsError,
+                                   ResourceModifiedError, ResourceNotFoundError)
+
+from app.annotation_format import (FrameColumns, columns_from_frames, decode_frame_columns,
+                                   decode_frames, encode_frames)
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'log_generation'
+MAX_PATCH_BYTES = 4 * 1024 * 1024  # One append block
+META_FIELDS = ('classes', 'video_width', 'video_height')
+DEFAULT_SHARD_SIZE = 1000
+
+
+class VersionConflict(Exception):
+    """The document changed since the version the client based its edit on"""
+
+
+def apply_ops(document: dict, ops: List[dict]) -> dict:
+    """
+    Apply patch operations to an annotations document in place.
+
+    add:    {"op": "add", "frame": 12, "object": {...}}
+    update: {"op": "update", "frame": 12, "index": 0, "expected": {...}, "object": {...}}
+    delete: {"op": "delete", "frame": 12, "index": 0, "expected": {...}}
+    set:    {"op": "set", "frame": 12, "expected": [...], "objects": [...]}  ([] clears the frame)
+    meta:   {"op": "meta", "classes": [...], "video_width": 1920, "video_height": 1080}
+
+    `expected` (optional) is what the client saw when it made the edit. An
+    update or delete then applies to that object wherever it now sits, and
+    a set only applies if the frame is unchanged; otherwise the op is
+    skipped, so an edit replayed after a conflict never lands on another
+    writer's objects.
+    """
+    frames = document.setdefault('frames', {})
+    for op in ops:
+        kind = op['op']
+        if kind == 'meta':
+            document.update({k: op[k] for k in META_FIELDS if k in op})
+            continue
+
+        key = str(op['frame'])
+        objects = frames.get(key, {}).get('objects', [])
+        if kind == 'add':
+            objects = objects + [op['object']]
+        elif kind == 'set':
+            if 'expected' in op and op['expected'] != objects:
+                continue  # Frame changed since the client saw it
+            objects = list(op['objects'])
+        elif kind in ('update', 'delete'):
+            index = _target_index(objects, op)
+            if index is None:
+                continue  # Object already gone or changed; nothing to change
+            objects = list(objects)
+            if kind == 'update':
+                objects[index] = op['object']
+            else:
+                del objects[index]
+
+        if objects:
+            frames[key] = {**frames.get(key, {}), 'objects': objects}
+        else:
+            frames.pop(key, None)
+    return document
+
+
+def _target_index(objects: List[dict], op: dict) -> Optional[int]:
+    """Position of the object an update/delete refers to, or None if it is gone"""
+    index = op['index']
+    if 'expected' not in op:
+        return index if 0 <= index < len(objects) else None
+    expected = op['expected']
+    if 0 <= index < len(objects) and objects[index] == expected:
+        return index
+    # Other writers' edits may have moved it
+    return objects.index(expected) if expected in objects else None
+
+
+def validate_ops(ops) -> List[dict]:
+    """Check patch operations are well formed; raises ValueError otherwise"""
+    if not isinstance(ops, list):
+        raise ValueError("ops must be a list")
+    for op in ops:
+        kind = op.get('op') if isinstance(op, dict) else None
+        if kind not in ('add', 'update', 'delete', 'set', 'meta'):
+            raise ValueError(f"Unknown op: {op!r}")
+        if kind != 'meta' and not isinstance(op.get('frame'), int):
+            raise ValueError(f"{kind} needs an integer frame")
+        if kind in ('update', 'delete') and not isinstance(op.get('index'), int):
+            raise ValueError(f"{kind} needs an integer index")
+        if kind in ('add', 'update') and not isinstance(op.get('object'), dict):
+            raise ValueError(f"{kind} needs an object")
+        if kind == 'set' and not isinstance(op.get('objects'), list):
+            raise ValueError("set needs an objects list")
+        if 'expected' in op and not isinstance(op['expected'], list if kind == 'set' else dict):
+            raise ValueError(f"{kind} expected must be {'a list' if kind == 'set' else 'an object'}")
+    return ops
+
+
+def _is_sealed(e: HttpResponseError) -> bool:
+    return getattr(e, 'error_code', None) == 'BlobIsSealed'
+
+
+class AnnotationStore:
+    """
+    Annotations as sharded base documents plus an append-only change log.
+
+    `{blob}.json` is a small manifest: the video's classes and size, the
+    shard size, and which blob holds each shard of `shard_size` frames
+    (`{blob}.json.shards/{index}.{tag}`). Reading a frame range only
+    fetches the shards it overlaps. Shards are written as compact JSON
+    (or, with binary_shards=True, in the columnar binary format of
+    app.annotation_format); readers accept either. Older single-file
+    documents are migrated to this layout the first time they are read.
+
+    The manifest's `log_generation` metadata names the log blob
+    (`{blob}.json.log.{generation}`, an append blob of JSON lines) whose
+    patches apply on top of the shards. A save appends one block to the
+    log, so its cost follows the size of the edit, not of the document.
+
+    Versions are "{generation}.{log ETag}". A patch made against a version
+    is a conditional append on that ETag, so concurrent editors get a
+    VersionConflict instead of overwriting each other.
+
+    Compaction first seals the log, with a marker block appended before it
+    so the version changes. It then rewrites only the shards the log
+    touched, under fresh blob names, and points the manifest at them under
+    generation + 1. Replaced shards and the previous generation's log are
+    kept for one more round so readers of the old manifest can still finish.
+    """
+
+    def __init__(self, container_client, compact_after: int = 200,
+                 shard_size: int = DEFAULT_SHARD_SIZE, binary_shards: bool = False, io_workers: int = 8):
+        self.container_client = container_client
+        self.binary_shards = binary_shards
+        self.compact_after = compact_after  # Log blocks before a background compaction
+        self.shard_size = shard_size  # For new and migrated documents; existing ones keep theirs
+        self._io = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='annotation-io')
+        self._compacting = set()
+        self._lock = threading.Lock()
+
+    def _doc_client(self, blob_name: str):
+        return self.container_client.get_blob_client(f"{blob_name}.json")
+
+    def _log_client(self, blob_name: str, generation: int):
+        return self.container_client.get_blob_client(f"{blob_name}.json.log.{generation}")
+
+    @staticmethod
+    def _shard_name(blob_name: str, index: int, tag: str) -> str:
+        # Tags carry their format's extension; JSON shards written before binary ones existed have none
+        return f"{blob_name}.json.shards/{index:06d}.{tag}" + ('' if '.' in tag else '.json')
+
+    @staticmethod
+    def parse_version(version: str) -> Tuple[int, str]:
+        generation, _, etag = version.strip('"').partition('.')
+        return int(generation), etag
+
+    def _generation(self, blob_name: str) -> int:
+        try:
+            properties = self._doc_client(blob_name).get_blob_properties()
+        except ResourceNotFoundError:
+            return 0
+        return int(properties.metadata.get(GENERATION_KEY, 0))
+
+    def _split(self, frames: dict, shard_size: int) -> Dict[int, dict]:
+        """Group a frames dict by shard index"""
+        shards: Dict[int, dict] = {}
+        for key, frame in frames.items():
+            shards.setdefault(int(key) // shard_size, {})[key] = frame
+        return shards
+
+    def _write_shards(self, blob_name: str, shards: Dict[int, dict], generation: int) -> Dict[str, str]:
+        """Upload shards under fresh names; returns the manifest entries ({index: tag}) for the non-empty ones"""
+        # Unique per writer, so racing writers never collide
+        tag = f"{generation}-{uuid.uuid4().hex[:8]}.{'bin' if self.binary_shards else 'json'}"
+
+        def upload(index):
+            self.container_client.get_blob_client(self._shard_name(blob_name, index, tag)).upload_blob(
+                encode_frames(shards[index], binary=self.binary_shards), overwrite=True)
+
+        written = [index for index, frames in shards.items() if frames]
+        list(self._io.map(upload, written))
+        return {str(index): tag for index in written}
+
+    def _download_shards(self, blob_name: str, manifest: dict, indexes: Iterable[int]) -> List[bytes]:
+        """Raw contents of the given shards (those that exist), fetched in parallel"""
+        names = [self._shard_name(blob_name, index, manifest['shards'][str(index)])
+                 for index in indexes if str(index) in manifest['shards']]
+        return list(self._io.map(
+            lambda name: self.container_client.get_blob_client(name).download_blob().readall(), names))
+
+    def _read_shards(self, blob_name: str, manifest: dict, indexes: Iterable[int]) -> dict:
+        """Frames of the given shards merged into one dict"""
+        frames = {}
+        for data in self._download_shards(blob_name, manifest, indexes):
+            frames.update(decode_frames(data))
+        return frames
+
+    def _delete_blobs(self, names: Iterable[str]):
+        def delete(name):
+            try:
+                self.container_client.get_blob_client(name).delete_blob()
+            except ResourceNotFoundError:
+                pass
+        list(self._io.map(delete, names))
+
+    def _write_manifest(self, blob_name: str, manifest: dict, generation: int, etag: Optional[str]):
+        """Upload the manifest for a generation (only over etag if given; '*' means only if none exists)"""
+        kwargs = {'overwrite': True}
+        if etag == '*':
+            kwargs = {'etag': '*', 'match_condition': MatchConditions.IfMissing}
+        elif etag is not None:
+            kwargs['etag'] = etag
+            kwargs['match_condition'] = MatchConditions.IfNotModified
+        self._doc_client(blob_name).upload_blob(
+            json.dumps(manifest, separators=(',', ':')),
+            metadata={GENERATION_KEY: str(generation)},
+            **kwargs
+        )
+
+    def _new_manifest(self, document: dict, shard_size: int) -> dict:
+        manifest = {k: document[k] for k in META_FIELDS if k in document}
+        manifest.update({"shard_size": shard_size, "shards": {}, "superseded": []})
+        return manifest
+
+    def _read_manifest(self, blob_name: str) -> Tuple[Optional[dict], int, Optional[str], Optional[dict]]:
+        """
+        (manifest, generation, manifest ETag, legacy frames). manifest is None
+        if nothing was ever saved. A single-file document is migrated to
+        shards here, and its frames are returned so the caller needn't
+        read them back.
+        """
+        try:
+            download_stream = self._doc_client(blob_name).download_blob()
+        except ResourceNotFoundError:
+            return None, 0, None, None
+        document = json.loads(download_stream.readall())
+        generation = int(download_stream.properties.metadata.get(GENERATION_KEY, 0))
+        etag = download_stream.properties.etag
+        if 'shards' in document:
+            return document, generation, etag, None
+
+        frames = document.get('frames', {})
+        manifest = self._new_manifest(document, self.shard_size)
+        manifest['shards'] = self._write_shards(blob_name, self._split(frames, self.shard_size), generation)
+        try:
+            self._write_manifest(blob_name, manifest, generation, etag)
+            logger.info(f"Migrated annotations for {blob_name} to {len(manifest['shards'])} shards")
+            etag = None  # Changed by the migration; callers writing conditionally must re-read
+        except ResourceModifiedError:
+            # Someone else migrated or saved first; drop our copy of the shards and read theirs
+            self._delete_blobs(self._shard_name(blob_name, int(i), tag) for i, tag in manifest['shards'].items())
+            return self._read_manifest(blob_name)
+        return manifest, generation, etag, frames
+
+    def _read_log(self, blob_name: str, generation: int) -> Tuple[List[List[dict]], str]:
+        """(patches, log ETag) for a generation; ETag "0" while the log does not exist"""
+        try:
+            download_stream = self._log_client(blob_name, generation).download_blob()
+        except ResourceNotFoundError:
+            return [], '0'
+        patches = [json.loads(line)['ops'] for line in download_stream.readall().splitlines() if line.strip()]
+        return patches, download_stream.properties.etag.strip('"')
+
+    def load(self, blob_name: str, first: Optional[int] = None,
+             last: Optional[int] = None) -> Tuple[Optional[dict], str]:
+        """
+        (document with pending patches applied, version), optionally limited
+        to frames first..last (inclusive). document is None if nothing was
+        ever saved.
+        """
+        manifest, generation, _, frames = self._read_manifest(blob_name)
+        log_read = self._io.submit(self._read_log, blob_name, generation)
+
+        if frames is None and manifest is not None:
+            size = manifest['shard_size']
+            if first is None and last is None:
+                indexes = [int(index) for index in manifest['shards']]
+            else:
+                first = 0 if first is None else first
+                top = max((int(index) for index in manifest['shards']), default=-1)
+                indexes = range(first // size, (last // size if last is not None else top) + 1)
+            frames = self._read_shards(blob_name, manifest, indexes)
+
+        patches, log_etag = log_read.result()
+        version = f"{generation}.{log_etag}"
+        if manifest is None and not patches:
+            return None, version
+
+        document = {k: manifest[k] for k in META_FIELDS if k in manifest} if manifest else {}
+        document['frames'] = frames or {}
+        for ops in patches:
+            apply_ops(document, ops)
+
+        if first is not None or last is not None:
+            low = first if first is not None else 0
+            high = last if last is not None else float('inf')
+            document['frames'] = {key: frame for key, frame in document['frames'].items()
+                                  if low <= int(key) <= high}
+        return document, version
+
+    def load_columns(self, blob_name: str) -> Tuple[Optional[dict], FrameColumns]:
+        """
+        (metadata, all objects as columns) for bulk readers such as export;
+        metadata is None if nothing was ever saved. Binary shards are used
+        as stored unless pending patches have to be applied first.
+        """
+        manifest, generation, _, frames = self._read_manifest(blob_name)
+        patches, _ = self._read_log(blob_name, generation)
+        if manifest is None and not patches:
+            return None, FrameColumns.empty()
+
+        if frames is None and not any(op['op'] != 'meta' for ops in patches for op in ops):
+            document = {k: manifest[k] for k in META_FIELDS if k in manifest}
+            for ops in patches:
+                apply_ops(document, ops)
+            shards = self._download_shards(blob_name, manifest, (int(index) for index in manifest['shards']))
+            return document, FrameColumns.concat([decode_frame_columns(data) for data in shards])
+
+        document, _ = self.load(blob_name)
+        frames = document.pop('frames')
+        return document, columns_from_frames(frames)
+
+    def is_current(self, blob_name: str, version: str) -> bool:
+        """True if version is still the latest (one or two metadata reads; used for If-None-Match)"""
+        try:
+            generation, etag = self.parse_version(version)
+        except ValueError:
+            return False
+        try:
+            properties = self._log_client(blob_name, generation).get_blob_properties()
+        except ResourceNotFoundError:
+            # No log yet for this generation, or one retired by a later compaction/replace():
+            # "N.0" is only current while generation N is still the manifest's
+            return etag == '0' and self._generation(blob_name) == generation
+        return properties.etag.strip('"') == etag
+
+    def patch(self, blob_name: str, ops: List[dict], if_match: Optional[str] = None) -> str:
+        """
+        Append a patch and return the new version.
+
+        With if_match the append only succeeds if the document is still at
+        that version (VersionConflict otherwise). Without it the patch is
+        applied to whatever the latest version is.
+        """
+        line = (json.dumps({"ops": ops, "at": time.time()}, separators=(',', ':')) + "\n").encode()
+        if len(line) > MAX_PATCH_BYTES:
+            raise ValueError(f"Patch too large ({len(line)} bytes, limit {MAX_PATCH_BYTES})")
+
+        for _ in range(5):
+            if if_match:
+                try:
+                    generation, etag = self.parse_version(if_match)
+                except ValueError:
+                    raise VersionConflict(f"Malformed version {if_match!r}")
+            else:
+                generation, etag = self._generation(blob_name), None
+
+            log_client = self._log_client(blob_name, generation)
+            try:
+                if etag == '0':
+                    # Client saw no log yet: creating it must not race another first writer
+                    log_client.create_append_blob(etag='*', match_condition=MatchConditions.IfMissing)
+                    result = log_client.append_block(line)
+                elif etag:
+                    result = log_client.append_block(
+                        line, etag=f'"{etag}"', match_condition=MatchConditions.IfNotModified)
+                else:
+                    try:
+                        result = log_client.append_block(line)
+                    except ResourceNotFoundError:
+                        try:
+                            log_client.create_append_blob(etag='*', match_condition=MatchConditions.IfMissing)
+                        except ResourceExistsError:
+                            pass
+                        result = log_client.append_block(line)
+            except (ResourceModifiedError, ResourceExistsError, ResourceNotFoundError):
+                raise VersionConflict(f"Annotations for {blob_name} changed since version {if_match}")
+            except HttpResponseError as e:
+                if not _is_sealed(e):
+                    raise
+                if if_match:
+                    raise VersionConflict(f"Annotations for {blob_name} were compacted since version {if_match}")
+                # Log was sealed by a compaction: make sure it finishes, then retry on the next generation
+                self.compact(blob_name)
+                continue
+
+            if result.get('blob_committed_block_count', 0) >= self.compact_after:
+                self.compact_in_background(blob_name)
+            return f"{generation}.{result['etag'].strip(chr(34))}"
+
+        raise VersionConflict(f"Could not append to the annotation log for {blob_name}")
+
+    def _seal(self, blob_name: str, generation: int):
+        """Close a generation's log to writers (created if missing, marker appended so its ETag changes)"""
+        log_client = self._log_client(blob_name, generation)
+        try:
+            log_client.create_append_blob(etag='*', match_condition=MatchConditions.IfMissing)
+        except ResourceExistsError:
+            pass
+        try:
+            log_client.append_block(b'{"ops":[]}\n')
+        except HttpResponseError as e:
+            if not _is_sealed(e):
+                raise
+        log_client.seal_append_blob()
+
+    def _retire(self, blob_name: str, previous: dict, generation: int):
+        """After a new manifest is in place: delete what the previous round superseded, and its log"""
+        self._delete_blobs(previous.get('superseded', []))
+        if generation > 0:
+            try:
+                self._log_client(blob_name, generation - 1).delete_blob()
+            except ResourceNotFoundError:
+                pass
+
+    def compact(self, blob_name: str):
+        """Fold the current log into the shards it touches and start a new generation (safe to run concurrently)"""
+        manifest, generation, manifest_etag, legacy_frames = self._read_manifest(blob_name)
+        if manifest is not None and manifest_etag is None:
+            # Just migrated: re-read so the conditional write below sees the current manifest
+            manifest, generation, manifest_etag, legacy_frames = self._read_manifest(blob_name)
+        self._seal(blob_name, generation)
+        patches, _ = self._read_log(blob_name, generation)
+
+        previous = manifest or {}
+        manifest = dict(manifest) if manifest is not None else self._new_manifest({}, self.shard_size)
+        manifest['shards'] = dict(manifest['shards'])
+        size = manifest['shard_size']
+        touched = {op['frame'] // size for ops in patches for op in ops if op['op'] != 'meta'}
+
+        document = {k: manifest[k] for k in META_FIELDS if k in manifest}
+        document['frames'] = self._read_shards(blob_name, manifest, touched)
+        for ops in patches:
+            apply_ops(document, ops)
+        manifest.update({k: document[k] for k in META_FIELDS if k in document})
+
+        shards = {index: {} for index in touched}
+        shards.update(self._split(document['frames'], size))
+        written = self._write_shards(blob_name, shards, generation + 1)
+        manifest['superseded'] = [self._shard_name(blob_name, index, manifest['shards'].pop(str(index)))
+                                  for index in touched if str(index) in manifest['shards']]
+        manifest['shards'].update(written)
+
+        try:
+            self._write_manifest(blob_name, manifest, generation + 1,
+                                 manifest_etag if manifest_etag is not None else '*')
+        except (ResourceModifiedError, ResourceExistsError):
+            # Another compaction or a replace() got there first
+            self._delete_blobs(self._shard_name(blob_name, int(i), tag) for i, tag in written.items())
+            return
+
+        self._retire(blob_name, previous, generation)
+        logger.info(f"Compacted {len(patches)} annotation patches for {blob_name} "
+                    f"into {len(touched)} shards (generation {generation + 1})")
+
+    def compact_in_background(self, blob_name: str):
+        with self._lock:
+            if blob_name in self._compacting:
+                return
+            self._compacting.add(blob_name)
+
+        def run():
+            try:
+                self.compact(blob_name)
+            except Exception as e:
+                logger.error(f"Error compacting annotations for {blob_name}: {e}")
+            finally:
+                with self._lock:
+                    self._compacting.discard(blob_name)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def replace(self, blob_name: str, document: dict) -> str:
+        """Overwrite the whole document (full save), discarding any pending patches"""
+        try:
+            download_stream = self._doc_client(blob_name).download_blob()
+            previous = json.loads(download_stream.readall())
+            generation = int(download_stream.properties.metadata.get(GENERATION_KEY, 0))
+        except ResourceNotFoundError:
+            previous, generation = {}, 0
+        self._seal(blob_name, generation)
+
+        manifest = self._new_manifest(document, self.shard_size)
+        manifest['shards'] = self._write_shards(
+            blob_name, self._split(document.get('frames', {}), self.shard_size), generation + 1)
+        manifest['superseded'] = [self._shard_name(blob_name, int(index), tag)
+                                  for index, tag in previous.get('shards', {}).items()]
+        self._write_manifest(blob_name, manifest, generation + 1, None)
+
+        self._retire(blob_name, previous, generation)
+        return f"{generation + 1}.0"
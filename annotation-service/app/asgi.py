@@ -0,0 +1,330 @@
+"""
+Async (ASGI) serving mode for the annotation API.
+
+The I/O-bound endpoints (classes, projects, SAS URLs and frames) are
+served natively on the event loop with the async storage SDK, so a slow
+blob read no longer holds a worker. Annotation reads and full saves go
+through main.annotation_store (in a thread) so they see the same patch log
+as the Flask PATCH endpoint. Frame extraction runs on the
+pinned worker processes of main.frame_processes, each video always on the
+same one so its decoder session stays warm. Every other route is served by
+the Flask app from app.main through a WSGI adapter (in a thread pool).
+
+Run with:
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 2 app.asgi:app
+"""
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceNotModifiedError
+from azure.identity.aio import DefaultAzureCredential
+from azure.storage.blob.aio import BlobServiceClient
+from starlette.applications import Starlette
+from starlette.convertors import Convertor, register_url_convertor
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, RedirectResponse, Response
+from starlette.routing import Mount, Route
+
+from app import main
+
+logger = logging.getLogger(__name__)
+
+blob_service_client = None  # Async client, created in lifespan()
+
+
+class VideoPathConvertor(Convertor):
+    """A video blob path, excluding the sub-resources Flask still serves (/info, /frames, ...)"""
+
+    regex = r"(?!.*/sprites/\d+/\d+$).+(?<!/info)(?<!/frames)(?<!/ingest)(?<!/prefetch)(?<!/export)(?<!/sprites)"
+
+    def convert(self, value: str) -> str:
+        return value
+
+    def to_string(self, value: str) -> str:
+        return value
+
+
+register_url_convertor('video', VideoPathConvertor())
+
+
+def extract_frame(blob_name, frame_number, variant=None):
+    """Runs in a pool process: decode, encode and store a frame, returning its image bytes"""
+    return main.extract_and_store_frame(blob_name, frame_number, variant)
+
+
+def client_etags(request):
+    header = request.headers.get('if-none-match', '')
+    return {tag.strip().removeprefix('W/').strip('"') for tag in header.split(',') if tag.strip()}
+
+
+def cache_headers(etag, cache_control, vary=None):
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': cache_control}
+    if vary:
+        headers['Vary'] = vary
+    return headers
+
+
+def not_modified(request, etag, cache_control, vary=None):
+    """A 304 response if the request's If-None-Match already names etag, otherwise None"""
+    tags = client_etags(request)
+    if etag in tags or '*' in tags:
+        return Response(status_code=304, headers=cache_headers(etag, cache_control, vary))
+    return None
+
+
+async def download_if_modified(request, blob_client):
+    """Async counterpart of main.download_if_modified: (data, etag), data None when the client is current"""
+    tags = client_etags(request)
+    try:
+        if len(tags) == 1:
+            download_stream = await blob_client.download_blob(
+                etag=f'"{next(iter(tags))}"', match_condition=MatchConditions.IfModified)
+        else:
+            download_stream = await blob_client.download_blob()
+    except ResourceNotModifiedError:
+        return None, next(iter(tags))
+    return await download_stream.readall(), download_stream.properties.etag.strip('"')
+
+
+def error_response(message, e):
+    logger.error(f"{message}: {str(e)}")
+    return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def get_video_frame(request):
+    """Get frame (memory cache, frame pack or frame blob, or extracted in the process pool) in the negotiated variant"""
+    blob_name = request.path_params['blob_name']
+    frame_number = request.path_params['frame_number']
+    try:
+        try:
+            variant = main.frame_variants.negotiate(request.query_params.get('tier'), request.headers.get('accept'))
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+        main.frame_stats.touch(blob_name)
+        etag = await asyncio.to_thread(main.frame_etag, blob_name, frame_number, *main.variant_etag_params(variant))
+        cached = not_modified(request, etag, main.FRAME_CACHE_CONTROL, vary='Accept')
+        if cached is not None:
+            return cached
+
+        key = main.frame_cache_key(blob_name, frame_number, variant)
+        frame_data = main.hot_frames.get(key)
+
+        if frame_data is None and main.FRAME_PACKS and variant == main.frame_variants.standard:
+            # Header lookups are cached, so a packed frame is one ranged read
+            frame_data = await asyncio.to_thread(main.frame_packs.read_frame, blob_name, frame_number)
+            if frame_data is not None:
+                main.hot_frames.put(key, frame_data)
+
+        if frame_data is None:
+            frame_blob_name = main.frame_blob_path(blob_name, frame_number, variant)
+            blob_client = blob_service_client.get_blob_client(
+                container=main.FRAMES_CONTAINER, blob=frame_blob_name)
+            if main.FRAME_SAS_REDIRECTS:
+                if await blob_client.exists():
+                    url, valid_for = await asyncio.to_thread(main.frame_sas_url, frame_blob_name, variant.mimetype)
+                    return RedirectResponse(url, status_code=302, headers={
+                        'Cache-Control': f"private, max-age={max(valid_for - 60, 0)}", 'Vary': 'Accept'})
+            else:
+                try:
+                    frame_data = await (await blob_client.download_blob()).readall()
+                    main.hot_frames.put(key, frame_data)
+                except ResourceNotFoundError:
+                    pass
+
+        if frame_data is None:
+            frame_data = await asyncio.wrap_future(main.frame_processes.submit_pinned(
+                blob_name, extract_frame, blob_name, frame_number, variant))
+            if frame_data is None:
+                return JSONResponse({"error": "Could not read frame"}, status_code=404)
+            main.hot_frames.put(key, frame_data)
+
+        return Response(frame_data, media_type=variant.mimetype,
+                        headers=cache_headers(etag, main.FRAME_CACHE_CONTROL, vary='Accept'))
+
+    except Exception as e:
+        return error_response("Error getting frame", e)
+
+
+async def get_annotations(request):
+    """Load annotations for a video, optionally only frames ?from=..&to=.. (inclusive)"""
+    blob_name = request.path_params['blob_name']
+    try:
+        try:
+            first, last = main.frame_range_args(request.query_params)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+        tags = client_etags(request) - {'*'}
+        if len(tags) == 1:
+            version = next(iter(tags))
+            if await asyncio.to_thread(main.annotation_store.is_current, blob_name, version):
+                return Response(status_code=304, headers=cache_headers(version, main.REVALIDATE_CACHE_CONTROL))
+
+        annotations, version = await asyncio.to_thread(main.annotation_store.load, blob_name, first, last)
+        headers = cache_headers(version, main.REVALIDATE_CACHE_CONTROL)
+        return JSONResponse(annotations or {"frames": {}}, headers=headers)
+
+    except Exception as e:
+        return error_response("Error loading annotations", e)
+
+
+async def save_annotations(request):
+    """Save a full annotations document for a video and update project classes"""
+    blob_name = request.path_params['blob_name']
+    try:
+        annotations = await request.json()
+        version = await asyncio.to_thread(main.replace_video_annotations, blob_name, annotations)
+        logger.info(f"Saved annotations for: {blob_name}")
+
+        return JSONResponse({"status": "success", "message": "Annotations saved", "version": version},
+                            headers={'ETag': f'"{version}"'})
+
+    except Exception as e:
+        return error_response("Error saving annotations", e)
+
+
+async def get_project_classes(request):
+    """Get class definitions for a project"""
+    project_name = request.path_params['project_name']
+    try:
+        blob_client = blob_service_client.get_blob_client(
+            container='annotations', blob=main.class_blob_path(project_name))
+        try:
+            data, etag = await download_if_modified(request, blob_client)
+        except ResourceNotFoundError:
+            return JSONResponse({"classes": main.DEFAULT_CLASSES})
+
+        headers = cache_headers(etag, main.REVALIDATE_CACHE_CONTROL)
+        if data is None:
+            return Response(status_code=304, headers=headers)
+        return Response(data, media_type='application/json', headers=headers)
+
+    except Exception as e:
+        return error_response("Error getting project classes", e)
+
+
+async def save_project_classes(request):
+    """Save class definitions for a project"""
+    project_name = request.path_params['project_name']
+    try:
+        classes = (await request.json()).get('classes', [])
+        await blob_service_client.get_blob_client(
+            container='annotations', blob=main.class_blob_path(project_name)
+        ).upload_blob(json.dumps({"classes": classes}, indent=2), overwrite=True)
+
+        logger.info(f"Saved {len(classes)} classes for project {project_name}")
+        return JSONResponse({"status": "success", "classes_count": len(classes)})
+
+    except Exception as e:
+        return error_response("Error saving project classes", e)
+
+
+async def list_projects(request):
+    """List projects and their videos from the catalog (paginated with limit/cursor, optionally filtered)"""
+    try:
+        try:
+            # In memory, except the first read of the catalog in this process
+            page = await asyncio.to_thread(main.projects_page, request.query_params)
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        return JSONResponse(page)
+
+    except Exception as e:
+        return error_response("Error listing projects", e)
+
+
+async def get_upload_url(request):
+    """Generate SAS URL for direct blob upload using the shared user delegation key"""
+    try:
+        data = await request.json()
+        project_name = data.get('projectName', '').strip()
+        file_name = data.get('fileName', '')
+
+        if not project_name or not file_name:
+            return JSONResponse({"error": "Missing projectName or fileName"}, status_code=400)
+
+        # Signing is local except when the cached key needs replacing
+        upload = await asyncio.to_thread(main.issue_upload_url, project_name, file_name)
+        logger.info(f"Generated SAS URL for: {upload['blobName']}")
+        return JSONResponse(upload)
+
+    except Exception as e:
+        return error_response("Error generating SAS URL", e)
+
+
+async def get_upload_urls(request):
+    """Generate upload SAS URLs for many files in one call (bulk uploads)"""
+    try:
+        data = await request.json()
+        project_name = data.get('projectName', '').strip()
+        file_names = data.get('fileNames', [])
+
+        if not project_name or not file_names:
+            return JSONResponse({"error": "Missing projectName or fileNames"}, status_code=400)
+        if len(file_names) > main.MAX_SAS_BATCH:
+            return JSONResponse({"error": f"At most {main.MAX_SAS_BATCH} files per request"}, status_code=400)
+
+        def issue_all():
+            return [{"fileName": file_name, **main.issue_upload_url(project_name, file_name)}
+                    for file_name in file_names]
+
+        uploads = await asyncio.to_thread(issue_all)
+        logger.info(f"Generated {len(uploads)} SAS URLs for project {project_name}")
+        return JSONResponse({"uploads": uploads})
+
+    except Exception as e:
+        return error_response("Error generating SAS URLs", e)
+
+
+async def get_video_url(request):
+    """Get temporary URL for video viewing"""
+    try:
+        video_url = await asyncio.to_thread(main.video_read_url, request.path_params['blob_name'])
+        return JSONResponse({"videoUrl": video_url})
+
+    except Exception as e:
+        return error_response("Error generating video URL", e)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global blob_service_client
+
+    credential = DefaultAzureCredential()
+    blob_service_client = BlobServiceClient(
+        account_url=f"https://{main.STORAGE_ACCOUNT_NAME}.blob.core.windows.net",
+        credential=credential
+    )
+    try:
+        yield
+    finally:
+        await blob_service_client.close()
+        await credential.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/get-upload-url', get_upload_url, methods=['POST']),
+        Route('/api/get-upload-urls', get_upload_urls, methods=['POST']),
+        Route('/api/projects', list_projects, methods=['GET']),
+        Route('/api/projects/{project_name}/classes', get_project_classes, methods=['GET']),
+        Route('/api/projects/{project_name}/classes', save_project_classes, methods=['POST']),
+        Route('/api/videos/{blob_name:path}/frame/{frame_number:int}', get_video_frame, methods=['GET']),
+        Route('/api/videos/{blob_name:video}', get_video_url, methods=['GET']),
+        Route('/api/annotations/{blob_name:video}', get_annotations, methods=['GET']),
+        Route('/api/annotations/{blob_name:video}', save_annotations, methods=['POST']),
+        # Everything else (annotation patches, frame batches, info, ingest, prefetch, export, sprites, stats, UI)
+        # stays on Flask
+        Mount('/', app=WSGIMiddleware(main.app)),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,396 @@
+import io
+import itertools
+import json
+import logging
+import os
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from azure.core.exceptions import ResourceExistsError
+from azure.storage.blob import ContentSettings
+
+from app.annotation_format import FrameColumns, yolo_rows, yolo_text
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_TYPES = {'tar': 'application/x-tar', 'zip': 'application/zip'}
+STATUS_BLOB_SUFFIX = 'status.json'
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable stream whose bytes are taken back out in chunks"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+class _TarStream:
+    """Minimal ustar writer for regular files; tarfile.addfile spends ~60us per header"""
+
+    BLOCK = 512
+    RECORD = 20 * 512
+
+    def __init__(self, sink: _ChunkSink, mtime: int):
+        self._sink = sink
+        self._mtime = mtime
+        self._written = 0
+        # Everything after name and size is the same for every member
+        self._tail = b''.join([
+            f"{mtime:011o}\0".encode(),
+            b' ' * 8,  # checksum, counted as spaces
+            b'0',  # regular file
+            b'\0' * 100,  # linkname
+            b'ustar\x0000',
+            b'\0' * 64,  # uname, gname
+            b'0000000\0' * 2,  # devmajor, devminor
+        ])
+        self._mode = b'0000644\0' + b'0000000\0' * 2  # mode, uid, gid
+
+    def _header(self, name: str, size: int) -> bytes:
+        encoded = name.encode()
+        prefix = b''
+        if len(encoded) > 100:
+            split = encoded.rfind(b'/', 0, 156)
+            if split <= 0 or len(encoded) - split - 1 > 100:
+                info = tarfile.TarInfo(name)  # GNU long-name member
+                info.size, info.mtime, info.mode = size, self._mtime, 0o644
+                return info.tobuf(tarfile.GNU_FORMAT, 'utf-8', 'surrogateescape')
+            prefix, encoded = encoded[:split], encoded[split + 1:]
+        header = b''.join([encoded.ljust(100, b'\0'), self._mode, f"{size:011o}\0".encode(),
+                           self._tail, prefix.ljust(155, b'\0'), b'\0' * 12])
+        checksum = f"{sum(header):06o}\0 ".encode()
+        return header[:148] + checksum + header[156:]
+
+    def add(self, name: str, data: bytes):
+        padding = -len(data) % self.BLOCK
+        header = self._header(name, len(data))
+        self._sink.write(header)
+        self._sink.write(data)
+        if padding:
+            self._sink.write(b'\0' * padding)
+        self._written += len(header) + len(data) + padding
+
+    def close(self):
+        end = self._written + 2 * self.BLOCK
+        self._sink.write(b'\0' * (2 * self.BLOCK + -end % self.RECORD))
+
+
+class _ArchiveWriter:
+    """tar or zip written front to back into a non-seekable sink"""
+
+    def __init__(self, kind: str, sink: _ChunkSink):
+        self.kind = kind
+        self._mtime = int(time.time())
+        if kind == 'zip':
+            self._archive = zipfile.ZipFile(sink, 'w', allowZip64=True)
+        else:
+            self._archive = _TarStream(sink, self._mtime)
+
+    def add(self, name: str, data: bytes, compress: bool = True):
+        if self.kind == 'zip':
+            info = zipfile.ZipInfo(name, time.localtime(self._mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            self._archive.writestr(info, data)
+        else:
+            self._archive.add(name, data)
+
+    def close(self):
+        self._archive.close()
+
+
+def dataset_yaml(classes: list) -> bytes:
+    """Ultralytics-style data.yaml naming the project's classes"""
+    lines = ['path: .', 'train: images', 'val: images', 'names:']
+    for index, cls in enumerate(classes):
+        class_id, name = (cls['id'], cls['name']) if isinstance(cls, dict) else (index, cls)
+        lines.append(f"  {class_id}: {json.dumps(str(name))}")
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def frame_labels(columns: FrameColumns, metadata: dict) -> Iterator[Tuple[int, bytes]]:
+    """(frame number, YOLO label file) for every annotated frame, all boxes normalized in one pass"""
+    lines = yolo_text(yolo_rows(columns, metadata.get('video_width'), metadata.get('video_height'))
+                      ).splitlines(keepends=True)
+    start = 0
+    for frame_number, end in zip(columns.frames.tolist(), np.cumsum(columns.counts).tolist()):
+        if end > start:
+            yield frame_number, b''.join(lines[start:end])
+        start = end
+
+
+class ExportJob:
+    """Progress of one project export to blob storage"""
+
+    def __init__(self, project: str, archive: str, images: bool, blob_name: str):
+        self.export_id = blob_name.rsplit('/', 1)[-1].split('.')[0]
+        self.project = project
+        self.archive = archive
+        self.images = images
+        self.blob_name = blob_name
+        self.status = 'queued'
+        self.total_videos = 0
+        self.videos = 0
+        self.frames = 0
+        self.boxes = 0
+        self.missing_images = 0
+        self.bytes = 0
+        self.download_url = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "exportId": self.export_id,
+                "project": self.project,
+                "format": self.archive,
+                "images": self.images,
+                "blobName": self.blob_name,
+                "status": self.status,
+                "totalVideos": self.total_videos,
+                "exportedVideos": self.videos,
+                "exportedFrames": self.frames,
+                "exportedBoxes": self.boxes,
+                "missingImages": self.missing_images,
+                "bytes": self.bytes,
+                "downloadUrl": self.download_url,
+                "error": self.error,
+                "createdAt": self.created_at,
+                "startedAt": self.started_at,
+                "finishedAt": self.finished_at
+            }
+
+
+class DatasetExporter:
+    """
+    Exports a project's annotations as a YOLO dataset archive:
+
+        data.yaml
+        images/{video}/{frame:06d}.jpg
+        labels/{video}/{frame:06d}.txt
+
+    The archive (tar, or zip) is produced front to back as a stream of
+    chunks, so it can go straight to an HTTP response or a blob upload
+    without being built in memory. Each video's boxes are read as columns
+    and normalized in one NumPy pass. Frame images are fetched through the
+    shared I/O pool, at most `image_lookahead` ahead of the writer. Memory
+    therefore stays flat in the size of the project: at most one video's
+    label text plus the lookahead window. A zip additionally keeps its
+    central directory, a small entry per file.
+
+    Exports to blob run as background jobs; their state is kept in memory
+    and mirrored to a status blob next to the archive, so any gunicorn
+    worker can report progress.
+    """
+
+    def __init__(self, list_videos: Callable[[str], List[str]],
+                 load_columns: Callable[[str], Tuple[Optional[dict], FrameColumns]],
+                 load_classes: Callable[[str], list],
+                 read_frame: Callable[[str, int], Optional[bytes]],
+                 exports_container_client, sign_url: Callable[[str], str], io_pool: Executor,
+                 image_lookahead: int = 32, chunk_bytes: int = 1024 * 1024,
+                 max_concurrent_jobs: int = 1, status_interval: float = 5.0):
+        self.list_videos = list_videos
+        self.load_columns = load_columns
+        self.load_classes = load_classes
+        self.read_frame = read_frame
+        self.exports_container_client = exports_container_client
+        self.sign_url = sign_url
+        self.io_pool = io_pool
+        self.image_lookahead = image_lookahead
+        self.chunk_bytes = chunk_bytes
+        self.status_interval = status_interval
+
+        self._jobs: Dict[str, ExportJob] = {}
+        self._jobs_lock = threading.Lock()
+        self._job_pool = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix='export-job')
+        self._container_ready = False
+
+    @staticmethod
+    def video_folder(project: str, blob_name: str) -> str:
+        """Folder for a video inside the archive (raw-videos/p/a/clip.mp4 -> a/clip)"""
+        relative = blob_name.split(f"raw-videos/{project}/", 1)[-1]
+        return os.path.splitext(relative)[0]
+
+    def _read_frame(self, blob_name: str, frame_number: int) -> Optional[bytes]:
+        try:
+            return self.read_frame(blob_name, frame_number)
+        except Exception as e:
+            logger.warning(f"Export could not read frame {frame_number} of {blob_name}: {e}")
+            return None
+
+    def _with_images(self, blob_name: str, labels: Iterator[Tuple[int, bytes]]):
+        """(frame number, labels, image bytes or None) in order, images read ahead in parallel"""
+        pending = deque()
+
+        def submit(count):
+            for frame_number, label in itertools.islice(labels, count):
+                pending.append((frame_number, label,
+                                self.io_pool.submit(self._read_frame, blob_name, frame_number)))
+
+        submit(self.image_lookahead)
+        while pending:
+            frame_number, label, image = pending.popleft()
+            submit(1)
+            yield frame_number, label, image.result()
+
+    def stream(self, project: str, archive: str = 'tar', images: bool = True,
+               job: Optional[ExportJob] = None) -> Iterator[bytes]:
+        """Archive bytes for a project's dataset, in chunks of about chunk_bytes"""
+        sink = _ChunkSink()
+        writer = _ArchiveWriter(archive, sink)
+        writer.add('data.yaml', dataset_yaml(self.load_classes(project)))
+
+        videos = self.list_videos(project)
+        if job is not None:
+            with job.lock:
+                job.total_videos = len(videos)
+
+        for blob_name in videos:
+            metadata, columns = self.load_columns(blob_name)
+            if metadata is None or not len(columns):
+                continue
+            folder = self.video_folder(project, blob_name)
+            labels = frame_labels(columns, metadata)
+            entries = self._with_images(blob_name, labels) if images else (
+                (frame_number, label, None) for frame_number, label in labels)
+
+            for frame_number, label, image in entries:
+                if images:
+                    if image is None:
+                        if job is not None:
+                            with job.lock:
+                                job.missing_images += 1
+                        continue
+                    writer.add(f"images/{folder}/{frame_number:06d}.jpg", image, compress=False)
+                writer.add(f"labels/{folder}/{frame_number:06d}.txt", label)
+                if job is not None:
+                    with job.lock:
+                        job.frames += 1
+                        job.boxes += label.count(b'\n')
+                if sink.size >= self.chunk_bytes:
+                    yield self._counted(sink.take(), job)
+
+            if job is not None:
+                with job.lock:
+                    job.videos += 1
+            logger.info(f"Exported {len(columns)} boxes from {blob_name}")
+
+        writer.close()
+        yield self._counted(sink.take(), job)
+
+    @staticmethod
+    def _counted(chunk: bytes, job: Optional[ExportJob]) -> bytes:
+        if job is not None:
+            with job.lock:
+                job.bytes += len(chunk)
+        return chunk
+
+    def submit(self, project: str, archive: str = 'tar', images: bool = True) -> ExportJob:
+        """Start exporting a project to the exports container"""
+        timestamp = time.strftime('%Y%m%d_%H%M%S', time.gmtime())
+        blob_name = f"projects/{project}/{timestamp}_{uuid.uuid4().hex[:8]}.{archive}"
+        job = ExportJob(project, archive, images, blob_name)
+        with self._jobs_lock:
+            self._jobs[job.export_id] = job
+
+        self._write_status(job)
+        self._job_pool.submit(self._run, job)
+        logger.info(f"Queued dataset export of {project} to {blob_name}")
+        return job
+
+    def get_status(self, project: str, export_id: str) -> Optional[dict]:
+        """Job status from this process, falling back to the shared status blob"""
+        with self._jobs_lock:
+            job = self._jobs.get(export_id)
+        if job is not None and job.project == project:
+            return job.to_dict()
+
+        for blob in self.exports_container_client.list_blobs(name_starts_with=f"projects/{project}/"):
+            if blob.name.endswith(f"{export_id}.{STATUS_BLOB_SUFFIX}"):
+                return json.loads(self.exports_container_client.get_blob_client(
+                    blob.name).download_blob().readall())
+        return None
+
+    def _ensure_container(self):
+        if not self._container_ready:
+            try:
+                self.exports_container_client.create_container()
+            except ResourceExistsError:
+                pass
+            self._container_ready = True
+
+    def _write_status(self, job: ExportJob):
+        try:
+            self._ensure_container()
+            self.exports_container_client.upload_blob(
+                f"{job.blob_name.rsplit('.', 1)[0]}.{STATUS_BLOB_SUFFIX}",
+                json.dumps(job.to_dict()),
+                overwrite=True
+            )
+        except Exception as e:
+            logger.warning(f"Could not write export status for {job.blob_name}: {e}")
+
+    def _run(self, job: ExportJob):
+        with job.lock:
+            job.status = 'running'
+            job.started_at = time.time()
+        self._write_status(job)
+
+        last_status = time.time()
+
+        def chunks():
+            nonlocal last_status
+            for chunk in self.stream(job.project, job.archive, job.images, job):
+                yield chunk
+                if time.time() - last_status > self.status_interval:
+                    self._write_status(job)
+                    last_status = time.time()
+
+        try:
+            self._ensure_container()
+            self.exports_container_client.get_blob_client(job.blob_name).upload_blob(
+                chunks(), overwrite=True,
+                content_settings=ContentSettings(content_type=ARCHIVE_TYPES[job.archive]))
+            with job.lock:
+                job.status = 'completed'
+                job.download_url = self.sign_url(job.blob_name)
+                job.finished_at = time.time()
+            logger.info(f"Exported {job.project}: {job.frames} frames, {job.boxes} boxes, "
+                        f"{job.bytes / (1024*1024):.1f} MB")
+        except Exception as e:
+            logger.error(f"Dataset export of {job.project} failed: {e}")
+            with job.lock:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = time.time()
+        self._write_status(job)
@@ -0,0 +1,393 @@
+import cv2
+import logging
+import threading
+import time
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import av
+except ImportError:  # PyAV is optional; without it seeks go through OpenCV
+    av = None
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # Pillow is optional; it only adds AVIF where OpenCV lacks it
+    PILImage = None
+
+logger = logging.getLogger(__name__)
+
+# OpenCV's CAP_PROP_POS_FRAMES seek lands this many frames before the target
+# and decodes forward, so a seek reads from the keyframe preceding that point
+SEEK_BACKOFF = 16
+
+
+# Image format -> (OpenCV extension, OpenCV quality flag); AVIF needs OpenCV >= 4.11 built with libavif
+IMAGE_WRITERS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+    'avif': ('.avif', getattr(cv2, 'IMWRITE_AVIF_QUALITY', None)),
+}
+
+
+def _opencv_writes(fmt: str) -> bool:
+    extension, flag = IMAGE_WRITERS[fmt]
+    try:
+        return flag is not None and cv2.haveImageWriter(extension)
+    except cv2.error:
+        return False
+
+
+def _pillow_writes_avif() -> bool:
+    if PILImage is None:
+        return False
+    PILImage.init()
+    return '.avif' in PILImage.registered_extensions()
+
+
+def encodable_formats() -> List[str]:
+    """Image formats this build can encode frames to (JPEG always; WebP/AVIF when the codecs are present)"""
+    return [fmt for fmt in IMAGE_WRITERS
+            if _opencv_writes(fmt) or (fmt == 'avif' and _pillow_writes_avif())]
+
+
+def encode_image(frame: np.ndarray, max_width: int, quality: int, fmt: str = 'jpeg') -> bytes:
+    """Downscale a frame to at most max_width (0: keep its size) and encode it as JPEG, WebP or AVIF"""
+    orig_height, orig_width = frame.shape[:2]
+
+    if max_width and orig_width > max_width:
+        scale = max_width / orig_width
+        frame = cv2.resize(frame, (max_width, int(orig_height * scale)),
+                           interpolation=cv2.INTER_AREA)
+
+    if fmt == 'avif' and not _opencv_writes('avif'):
+        buffer = BytesIO()
+        PILImage.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).save(buffer, 'AVIF', quality=quality)
+        return buffer.getvalue()
+
+    extension, flag = IMAGE_WRITERS[fmt]
+    _, buffer = cv2.imencode(extension, frame, [flag, quality])
+    return buffer.tobytes()
+
+
+def encode_jpeg(frame: np.ndarray, max_width: int, quality: int = 85) -> bytes:
+    """Downscale a frame to at most max_width (keeping aspect ratio) and JPEG-encode it"""
+    return encode_image(frame, max_width, quality, 'jpeg')
+
+
+ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE
+}
+
+
+class DecoderSession:
+    """An open VideoCapture that remembers where its decoder is positioned"""
+
+    seek_backoff = SEEK_BACKOFF
+
+    def __init__(self, video_path: str):
+        self.video_path = video_path
+        self.cap = cv2.VideoCapture(video_path)
+        self.next_frame = 0  # Frame number the next cap.read() will return
+        self.last_frame_number = -1
+        self.last_frame = None
+        self.last_used = time.time()
+        self.busy = False
+
+    def distance_to(self, frame_number: int) -> int:
+        """Number of frames to decode forward to reach frame_number (-1 if a seek is needed)"""
+        if frame_number == self.last_frame_number:
+            return 0
+        if 0 <= self.next_frame <= frame_number:
+            return frame_number - self.next_frame + 1
+        return -1
+
+    def read(self, frame_number: int, max_forward_skip: int,
+             prepare: Optional[Callable[[str, int, int], None]] = None) -> Optional[np.ndarray]:
+        """Return frame_number, decoding forward when close and seeking otherwise"""
+        self.last_used = time.time()
+
+        if frame_number == self.last_frame_number:
+            return self.last_frame
+
+        gap = frame_number - self.next_frame
+        seek = self.next_frame < 0 or gap < 0 or gap > max_forward_skip
+        if prepare is not None:
+            # Let lazily-filled sources fetch the bytes this read will touch
+            first = max(0, frame_number - self.seek_backoff) if seek else self.next_frame
+            prepare(self.video_path, first, frame_number)
+
+        if seek:
+            # Real jump: let the demuxer seek to the preceding keyframe
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+            self.next_frame = frame_number
+        else:
+            # Forward-adjacent: keep decoding, skip conversion for frames we don't need
+            for _ in range(gap):
+                if not self.cap.grab():
+                    self._invalidate()
+                    return None
+                self.next_frame += 1
+
+        ret, frame = self.cap.read()
+        if not ret:
+            self._invalidate()
+            return None
+
+        self.next_frame = frame_number + 1
+        self.last_frame_number = frame_number
+        self.last_frame = frame
+        return frame
+
+    def _invalidate(self):
+        # Position is unknown after a failed read; force a seek next time
+        self.next_frame = -1
+        self.last_frame_number = -1
+        self.last_frame = None
+
+    def release(self):
+        self.cap.release()
+        self.last_frame = None
+
+
+class KeyframeDecoderSession(DecoderSession):
+    """
+    PyAV decoder that seeks using a VideoIndex instead of OpenCV's frame-number seek.
+
+    A jump seeks straight to the indexed keyframe preceding the target and
+    decodes forward until the frame whose pts matches the index, so the work
+    is bounded by one GOP and variable frame rate input lands on the right
+    frame.
+    """
+
+    seek_backoff = 0  # We seek to the keyframe itself, nothing before it is read
+
+    def __init__(self, video_path: str, index):
+        self.video_path = video_path
+        self.index = index
+        self.container = av.open(video_path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = 'AUTO'
+        self.frames = self.container.decode(self.stream)
+        self.pending = None  # Frame decoded past a target, kept for the next read
+        self.shift = None  # Demuxer pts minus index pts (edit lists shift the timeline)
+        self.next_frame = 0
+        self.last_frame_number = -1
+        self.last_frame = None
+        self.last_used = time.time()
+        self.busy = False
+
+    def _next_decoded(self):
+        if self.pending is not None:
+            frame, self.pending = self.pending, None
+            return frame
+        return next(self.frames, None)
+
+    def read(self, frame_number: int, max_forward_skip: int,
+             prepare: Optional[Callable[[str, int, int], None]] = None) -> Optional[np.ndarray]:
+        self.last_used = time.time()
+
+        if frame_number == self.last_frame_number:
+            return self.last_frame
+        if frame_number >= len(self.index.pts):
+            return None
+
+        gap = frame_number - self.next_frame
+        seek = self.next_frame < 0 or gap < 0 or gap > max_forward_skip
+        if prepare is not None:
+            prepare(self.video_path, frame_number if seek else self.next_frame, frame_number)
+
+        try:
+            if self.shift is None:
+                # The first decoded frame pins the demuxer timeline to the index
+                first = self._next_decoded()
+                if first is None or first.pts is None:
+                    return None
+                self.shift = first.pts - self.index.pts[0]
+                self.pending = first
+
+            if seek:
+                keyframe, _ = self.index.keyframe_before(frame_number)
+                self.container.seek(self.index.pts[keyframe] + self.shift,
+                                    stream=self.stream, backward=True)
+                self.frames = self.container.decode(self.stream)
+                self.pending = None
+
+            target = self.index.pts[frame_number] + self.shift
+            while True:
+                frame = self._next_decoded()
+                if frame is None:
+                    self._invalidate()
+                    return None
+                if frame.pts is None or frame.pts < target:
+                    continue
+                if frame.pts > target:
+                    # Target missing from the stream: serve the next frame, keep it for later
+                    self.pending = frame
+                break
+        except av.AVError as e:
+            logger.warning(f"Keyframe seek failed in {self.video_path}: {e}")
+            self._invalidate()
+            return None
+
+        image = frame.to_ndarray(format='bgr24')
+        if self.index.rotation in ROTATIONS:
+            image = cv2.rotate(image, ROTATIONS[self.index.rotation])
+
+        self.next_frame = frame_number + 1
+        self.last_frame_number = frame_number
+        self.last_frame = image
+        return image
+
+    def release(self):
+        self.container.close()
+        self.last_frame = None
+        self.pending = None
+
+
+class DecoderPool:
+    """
+    Pool of positioned decoder sessions keyed by local video path.
+
+    Sequential requests are served by continuing to decode from the session
+    closest behind the requested frame; only real jumps pay for a seek.
+    An optional prepare(video_path, first, last) hook runs before each decode
+    so range-backed sources can fetch the bytes it will read.
+
+    At most max_sessions are open (or opening) at once; callers wait for a
+    session to free up rather than exceed it. Opening a session (which can
+    read a large or remote file) happens outside the pool lock, with its
+    slot reserved, so it never stalls other videos.
+    """
+
+    def __init__(self, max_sessions: int = 8, sessions_per_video: int = 2,
+                 max_forward_skip: int = 120, idle_ttl: int = 300,
+                 prepare: Optional[Callable[[str, int, int], None]] = None):
+        self.prepare = prepare
+        self.max_sessions = max_sessions
+        self.sessions_per_video = sessions_per_video
+        self.max_forward_skip = max_forward_skip
+        self.idle_ttl = idle_ttl
+        self._sessions: Dict[str, List[DecoderSession]] = {}
+        self._opening: Dict[str, int] = {}  # Sessions being opened outside the lock, per video
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def seeks_by_index(index) -> bool:
+        """True if sessions for a video with this index seek by keyframe and pts (PyAV) rather than OpenCV"""
+        return av is not None and index is not None and index.seekable
+
+    def read_frame(self, video_path: str, frame_number: int, index=None) -> Optional[np.ndarray]:
+        """
+        Decode a single frame, reusing an open session where possible.
+
+        With a seekable VideoIndex (and PyAV installed) new sessions seek by
+        keyframe and pts; otherwise they use OpenCV's frame-number seek.
+        """
+        session = self._acquire(video_path, frame_number, index)
+        try:
+            return session.read(frame_number, self.max_forward_skip, self.prepare)
+        finally:
+            self._release(session)
+
+    def _acquire(self, video_path: str, frame_number: int, index=None) -> DecoderSession:
+        with self._cond:
+            while True:
+                sessions = self._sessions.get(video_path, [])
+                idle = [s for s in sessions if not s.busy]
+
+                # Prefer the idle session that can reach the frame by decoding forward
+                best = None
+                best_distance = None
+                for s in idle:
+                    distance = s.distance_to(frame_number)
+                    if 0 <= distance <= self.max_forward_skip + 1:
+                        if best is None or distance < best_distance:
+                            best, best_distance = s, distance
+
+                if best is None and len(sessions) + self._opening.get(video_path, 0) < self.sessions_per_video \
+                        and self._make_room():
+                    # Reserve the slot, then open outside the lock
+                    self._opening[video_path] = self._opening.get(video_path, 0) + 1
+                    break
+
+                if best is None and idle:
+                    # All sessions are positioned elsewhere; take the least recently used
+                    best = min(idle, key=lambda s: s.last_used)
+
+                if best is not None:
+                    best.busy = True
+                    return best
+
+                self._cond.wait()
+
+        session = None
+        try:
+            if self.seeks_by_index(index):
+                session = KeyframeDecoderSession(video_path, index)
+            else:
+                session = DecoderSession(video_path)
+            session.busy = True
+            logger.info(f"Opened decoder session for {video_path}")
+            return session
+        finally:
+            with self._cond:
+                self._opening[video_path] -= 1
+                if not self._opening[video_path]:
+                    del self._opening[video_path]
+                if session is not None:
+                    self._sessions.setdefault(video_path, []).append(session)
+                self._cond.notify_all()
+
+    def _release(self, session: DecoderSession):
+        with self._cond:
+            session.busy = False
+            self._cond.notify_all()
+
+    def _make_room(self) -> bool:
+        """Close least recently used idle sessions until a new one fits; False if all are busy (lock held)"""
+        while sum(len(s) for s in self._sessions.values()) + sum(self._opening.values()) >= self.max_sessions:
+            idle = [s for sessions in self._sessions.values()
+                    for s in sessions if not s.busy]
+            if not idle:
+                return False
+            self._close(min(idle, key=lambda s: s.last_used))
+        return True
+
+    def _close(self, session: DecoderSession):
+        sessions = self._sessions.get(session.video_path, [])
+        if session in sessions:
+            sessions.remove(session)
+        if not sessions:
+            self._sessions.pop(session.video_path, None)
+        session.release()
+
+    def close_video(self, video_path: str):
+        """Close every idle session for a video (e.g. when its cached file is evicted)"""
+        with self._cond:
+            for session in list(self._sessions.get(video_path, [])):
+                if not session.busy:
+                    self._close(session)
+
+    def close_idle(self):
+        """Close sessions that have not been used within idle_ttl"""
+        with self._cond:
+            cutoff = time.time() - self.idle_ttl
+            for sessions in list(self._sessions.values()):
+                for session in list(sessions):
+                    if not session.busy and session.last_used < cutoff:
+                        self._close(session)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "videos": len(self._sessions),
+                "sessions": sum(len(s) for s in self._sessions.values()),
+                "opening": sum(self._opening.values()),
+                "busy": sum(1 for sessions in self._sessions.values()
+                            for s in sessions if s.busy)
+            }
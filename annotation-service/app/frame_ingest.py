@@ -0,0 +1,323 @@
+import cv2
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from azure.core.exceptions import ResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+STATUS_BLOB_SUFFIX = 'ingest.json'
+STALE_STATUS_SECONDS = 120  # A running job's status blob not updated for this long belongs to a stopped worker
+
+
+class IngestJob:
+    """Progress of one video's frame pre-extraction"""
+
+    def __init__(self, blob_name: str):
+        self.blob_name = blob_name
+        self.status = 'queued'
+        self.total_frames = 0
+        self.decoded = 0
+        self.uploaded = 0
+        self.skipped = 0
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            finished = self.uploaded + self.skipped
+            return {
+                "blobName": self.blob_name,
+                "status": self.status,
+                "totalFrames": self.total_frames,
+                "decodedFrames": self.decoded,
+                "uploadedFrames": self.uploaded,
+                "skippedFrames": self.skipped,
+                "progress": round(finished / self.total_frames, 4) if self.total_frames else 0,
+                "error": self.error,
+                "createdAt": self.created_at,
+                "startedAt": self.started_at,
+                "updatedAt": time.time(),
+                "finishedAt": self.finished_at
+            }
+
+
+class FrameIngestor:
+    """
+    Pre-extracts every frame of an uploaded video into the frames container.
+
+    The video is decoded once in a single linear pass; resize/JPEG encoding
+    runs on a worker pool (OpenCV releases the GIL) and uploads go through a
+    separate pool. A semaphore caps frames in flight so memory stays bounded
+    however far decoding runs ahead of storage.
+
+    With a pack_store, encoded frames are collected per pack and each pack
+    is uploaded as one blob once its last frame is encoded; packs already
+    in the container are skipped. A pack holds its frames until its upload
+    finishes, so a second semaphore caps packs being filled or uploaded at
+    `max_open_packs` and decoding waits at a pack boundary for storage.
+
+    Job state is kept in memory and mirrored to a small status blob so any
+    gunicorn worker can report progress.
+    """
+
+    def __init__(self, frames_container_client, get_video_path: Callable[[str], str],
+                 encode_frame: Callable, frame_blob_name: Callable[[str, int], str],
+                 encode_workers: int = 4, upload_concurrency: int = 16,
+                 max_concurrent_jobs: int = 1, status_interval: float = 5.0,
+                 on_frame_stored: Optional[Callable[..., None]] = None, pack_store=None,
+                 max_open_packs: int = 3):
+        self.frames_container_client = frames_container_client
+        self.get_video_path = get_video_path
+        self.encode_frame = encode_frame
+        self.frame_blob_name = frame_blob_name
+        self.status_interval = status_interval
+        self.on_frame_stored = on_frame_stored
+        self.pack_store = pack_store
+        self.max_in_flight = (encode_workers + upload_concurrency) * 2
+        self.max_open_packs = max_open_packs
+
+        self._jobs: Dict[str, IngestJob] = {}
+        self._jobs_lock = threading.Lock()
+        self._job_pool = ThreadPoolExecutor(
+            max_workers=max_concurrent_jobs, thread_name_prefix='ingest-job')
+        self._encode_pool = ThreadPoolExecutor(
+            max_workers=encode_workers, thread_name_prefix='ingest-encode')
+        self._upload_pool = ThreadPoolExecutor(
+            max_workers=upload_concurrency, thread_name_prefix='ingest-upload')
+
+    def submit(self, blob_name: str) -> IngestJob:
+        """Queue a video for pre-extraction (no-op if it is already queued or running)"""
+        with self._jobs_lock:
+            job = self._jobs.get(blob_name)
+            if job is not None and not job.done:
+                return job
+            job = IngestJob(blob_name)
+            self._jobs[blob_name] = job
+
+        self._write_status(job)
+        self._job_pool.submit(self._run, job)
+        logger.info(f"Queued frame ingestion for {blob_name}")
+        return job
+
+    def get_status(self, blob_name: str) -> Optional[dict]:
+        """Job status from this process, falling back to the shared status blob ('interrupted' if its worker stopped)"""
+        with self._jobs_lock:
+            job = self._jobs.get(blob_name)
+        if job is not None:
+            return job.to_dict()
+
+        try:
+            status = json.loads(self.frames_container_client.get_blob_client(
+                f"{blob_name}/{STATUS_BLOB_SUFFIX}").download_blob().readall())
+        except ResourceNotFoundError:
+            return None
+        updated_at = status.get('updatedAt') or status['createdAt']
+        if status['status'] not in ('completed', 'failed') \
+                and time.time() - updated_at > max(STALE_STATUS_SECONDS, 4 * self.status_interval):
+            status['status'] = 'interrupted'
+        return status
+
+    def _write_status(self, job: IngestJob):
+        try:
+            self.frames_container_client.upload_blob(
+                f"{job.blob_name}/{STATUS_BLOB_SUFFIX}",
+                json.dumps(job.to_dict()),
+                overwrite=True
+            )
+        except Exception as e:
+            logger.warning(f"Could not write ingest status for {job.blob_name}: {e}")
+
+    def _heartbeat(self, job: IngestJob, stop: threading.Event):
+        """Keep the status blob fresh while the job waits on something that reports no progress"""
+        while not stop.wait(self.status_interval):
+            self._write_status(job)
+
+    def _existing_frames(self, blob_name: str) -> set:
+        """Frame blob names already cached, from one listing instead of per-frame HEADs"""
+        return {
+            blob.name for blob in
+            self.frames_container_client.list_blobs(name_starts_with=f"{blob_name}/")
+        }
+
+    def _run(self, job: IngestJob):
+        with job.lock:
+            job.status = 'downloading'
+            job.started_at = time.time()
+        self._write_status(job)
+
+        try:
+            # Downloading a large video can outlast the staleness threshold
+            downloaded = threading.Event()
+            threading.Thread(target=self._heartbeat, args=(job, downloaded), daemon=True,
+                             name='ingest-heartbeat').start()
+            try:
+                video_path = self.get_video_path(job.blob_name)
+            finally:
+                downloaded.set()
+            existing = self._existing_frames(job.blob_name)
+
+            cap = cv2.VideoCapture(video_path)
+            with job.lock:
+                job.status = 'extracting'
+                job.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            self._write_status(job)
+
+            in_flight = threading.BoundedSemaphore(self.max_in_flight)
+            open_packs = threading.BoundedSemaphore(self.max_open_packs)
+            errors = []
+            # Pack index -> frames encoded so far, encodes outstanding, and whether decoding has moved past it
+            packs: Dict[int, dict] = {}
+            packs_lock = threading.Lock()
+            pack_uploads = []
+            frame_number = 0
+            last_status = time.time()
+
+            def upload(frame_name, frame_bytes):
+                try:
+                    self.frames_container_client.upload_blob(
+                        frame_name, frame_bytes, overwrite=True)
+                    if self.on_frame_stored is not None:
+                        self.on_frame_stored(frame_name, len(frame_bytes))
+                    with job.lock:
+                        job.uploaded += 1
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    in_flight.release()
+
+            def encode(frame_name, frame):
+                try:
+                    frame_bytes = self.encode_frame(frame)
+                    self._upload_pool.submit(upload, frame_name, frame_bytes)
+                except Exception as e:
+                    errors.append(e)
+                    in_flight.release()
+
+            def upload_pack(index, frames):
+                try:
+                    pack_name, size, held = self.pack_store.write_pack(job.blob_name, index, frames)
+                    if self.on_frame_stored is not None:
+                        self.on_frame_stored(pack_name, size, held)
+                    with job.lock:
+                        job.uploaded += held
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    open_packs.release()
+
+            def close_pack(index):
+                """Mark a pack as fully decoded; uploads it once its encodes are done (packs_lock held)"""
+                pack = packs.get(index)
+                if pack is None:
+                    return
+                pack['closed'] = True
+                if pack['pending'] == 0:
+                    del packs[index]
+                    if pack['frames']:
+                        pack_uploads.append(self._upload_pool.submit(upload_pack, index, pack['frames']))
+                    else:
+                        open_packs.release()
+
+            def encode_into_pack(index, frame_number, frame):
+                try:
+                    frame_bytes = self.encode_frame(frame)
+                    with packs_lock:
+                        packs[index]['frames'][frame_number] = frame_bytes
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    with packs_lock:
+                        packs[index]['pending'] -= 1
+                        if packs[index]['closed']:
+                            close_pack(index)
+                    in_flight.release()
+
+            pack_size = self.pack_store.pack_size if self.pack_store is not None else 0
+            try:
+                while not errors:
+                    if pack_size:
+                        index = frame_number // pack_size
+                        if frame_number % pack_size == 0 and index:
+                            with packs_lock:
+                                close_pack(index - 1)
+                        frame_name = self.pack_store.pack_name(job.blob_name, index)
+                    else:
+                        frame_name = self.frame_blob_name(job.blob_name, frame_number)
+                    if frame_name in existing:
+                        # Advance the decoder without paying for colour conversion
+                        if not cap.grab():
+                            break
+                        with job.lock:
+                            job.decoded += 1
+                            job.skipped += 1
+                    else:
+                        ret, frame = cap.read()
+                        if not ret:
+                            break
+                        if pack_size:
+                            with packs_lock:
+                                new_pack = index not in packs
+                            if new_pack:
+                                # Only this thread adds packs; wait here for an earlier pack's upload
+                                open_packs.acquire()
+                                with packs_lock:
+                                    packs[index] = {'frames': {}, 'pending': 0, 'closed': False}
+                        in_flight.acquire()
+                        if pack_size:
+                            with packs_lock:
+                                pack = packs[index]
+                                pack['pending'] += 1
+                            self._encode_pool.submit(encode_into_pack, index, frame_number, frame)
+                        else:
+                            self._encode_pool.submit(encode, frame_name, frame)
+                        with job.lock:
+                            job.decoded += 1
+
+                    frame_number += 1
+                    if time.time() - last_status > self.status_interval:
+                        self._write_status(job)
+                        last_status = time.time()
+            finally:
+                cap.release()
+
+            # Wait for the remaining encodes/uploads to drain
+            with packs_lock:
+                for index in list(packs):
+                    close_pack(index)
+            for _ in range(self.max_in_flight):
+                in_flight.acquire()
+            for pack_upload in pack_uploads:
+                pack_upload.result()
+
+            if errors:
+                raise errors[0]
+
+            with job.lock:
+                # Container frame counts are estimates; report what was actually decoded
+                job.total_frames = job.decoded
+                job.status = 'completed'
+                job.finished_at = time.time()
+            logger.info(
+                f"Ingested {job.uploaded} frames for {job.blob_name} "
+                f"({job.skipped} already cached) in {job.finished_at - job.started_at:.1f}s")
+
+        except Exception as e:
+            logger.error(f"Frame ingestion failed for {job.blob_name}: {e}")
+            with job.lock:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = time.time()
+
+        self._write_status(job)
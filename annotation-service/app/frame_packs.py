@@ -0,0 +1,317 @@
+import argparse
+import logging
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceModifiedError, ResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+# Layout: MAGIC, uint32 first frame, uint32 slots, uint32 offsets[slots + 1]
+# (relative to the end of the header), then the JPEGs back to back. A slot
+# with a zero-length range is a frame the pack does not hold.
+MAGIC = b'FPK1'
+FRAMES_METADATA_KEY = 'frames'
+MISSING_PACK_TTL = 60.0  # Seconds a "no pack here" answer is trusted
+DELETE_BATCH_SIZE = 256  # Most subrequests one blob batch request may carry
+STANDARD_FRAME_NAME = re.compile(r'frame_(\d+)\.jpg')  # Other tiers/formats are not packed
+
+
+def header_size(slots: int) -> int:
+    return 12 + 4 * (slots + 1)
+
+
+def encode_pack(first_frame: int, frames: List[Optional[bytes]]) -> bytes:
+    """Pack JPEGs for frames first_frame, first_frame + 1, ... (None for frames not held)"""
+    offsets = [0]
+    for data in frames:
+        offsets.append(offsets[-1] + len(data or b''))
+    return b''.join([MAGIC, struct.pack(f'<II{len(offsets)}I', first_frame, len(frames), *offsets)]
+                    + [data for data in frames if data])
+
+
+def decode_header(data: bytes) -> Tuple[int, Tuple[int, ...]]:
+    """(first frame, offsets) from the start of a pack"""
+    if data[:4] != MAGIC:
+        raise ValueError("Not a frame pack")
+    first_frame, slots = struct.unpack_from('<II', data, 4)
+    if len(data) < header_size(slots):
+        raise ValueError(f"Frame pack header needs {header_size(slots)} bytes, got {len(data)}")
+    return first_frame, struct.unpack_from(f'<{slots + 1}I', data, 12)
+
+
+def pack_frames(data: bytes) -> Dict[int, bytes]:
+    """Every frame held in a whole pack"""
+    first_frame, offsets = decode_header(data)
+    base = header_size(len(offsets) - 1)
+    return {first_frame + slot: data[base + offsets[slot]:base + offsets[slot + 1]]
+            for slot in range(len(offsets) - 1) if offsets[slot + 1] > offsets[slot]}
+
+
+def is_pack_blob(name: str) -> bool:
+    file_name = name.rsplit('/', 1)[-1]
+    return file_name.startswith('pack_') and file_name.endswith('.bin')
+
+
+class FramePackStore:
+    """
+    Frames stored `pack_size` to a blob ({video}/pack_000012.bin holds
+    frames 3072-3327 at the default size) instead of one blob per JPEG.
+
+    Pack headers are cached per process (LRU), so a frame costs one ranged
+    read and a window of frames in the same pack one ranged read in total.
+    Reads are conditional on the ETag the header came from. A pack
+    rewritten since (migration merging in more frames) gets its header
+    read again. A pack written with another pack size (its first frame or
+    slot count does not fit this store's) is treated as missing, so its
+    frames fall back to per-frame blobs or extraction.
+    """
+
+    def __init__(self, container_client, pack_size: int = 256, max_cached_headers: int = 4096):
+        self.container_client = container_client
+        self.pack_size = pack_size
+        self.max_cached_headers = max_cached_headers
+        # (video, pack) -> (etag, header length, offsets, first frame), or (None, expiry, None, None) for no pack
+        self._headers: "OrderedDict[Tuple[str, int], tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pack_index(self, frame_number: int) -> int:
+        return frame_number // self.pack_size
+
+    def pack_name(self, blob_name: str, index: int) -> str:
+        """Name of a video's pack in the frames container"""
+        return f"{blob_name}/pack_{index:06d}.bin"
+
+    def _remember(self, key: Tuple[str, int], entry: tuple):
+        with self._lock:
+            self._headers[key] = entry
+            self._headers.move_to_end(key)
+            while len(self._headers) > self.max_cached_headers:
+                self._headers.popitem(last=False)
+
+    def fits(self, index: int, first_frame: int, offsets: Tuple[int, ...]) -> bool:
+        """True if a pack header matches this store's pack size at that index"""
+        return first_frame == index * self.pack_size and len(offsets) - 1 <= self.pack_size
+
+    def _header(self, blob_name: str, index: int, refresh: bool = False) -> Optional[tuple]:
+        """(etag, header length, offsets, first frame) of a pack, or None if the video has no usable pack"""
+        key = (blob_name, index)
+        if not refresh:
+            with self._lock:
+                entry = self._headers.get(key)
+            if entry is not None:
+                if entry[0] is not None:
+                    return entry
+                if entry[1] > time.monotonic():
+                    return None
+
+        try:
+            download_stream = self.container_client.get_blob_client(self.pack_name(blob_name, index)).download_blob(
+                offset=0, length=header_size(self.pack_size))
+        except ResourceNotFoundError:
+            self._remember(key, (None, time.monotonic() + MISSING_PACK_TTL, None, None))
+            return None
+        try:
+            first_frame, offsets = decode_header(download_stream.readall())
+        except (ValueError, struct.error):
+            first_frame, offsets = None, ()
+        if not self.fits(index, first_frame, offsets):
+            logger.warning(f"Ignoring {self.pack_name(blob_name, index)}: not a pack of {self.pack_size} frames")
+            self._remember(key, (None, time.monotonic() + MISSING_PACK_TTL, None, None))
+            return None
+        entry = (download_stream.properties.etag, header_size(len(offsets) - 1), offsets, first_frame)
+        self._remember(key, entry)
+        return entry
+
+    def _read_range(self, blob_name: str, index: int, first_slot: int, last_slot: int) -> Optional[Dict[int, bytes]]:
+        """Frames in slots first_slot..last_slot of a pack, in one ranged read"""
+        for refresh in (False, True):
+            entry = self._header(blob_name, index, refresh)
+            if entry is None:
+                return None
+            etag, base, offsets, first_frame = entry
+            last_slot = min(last_slot, len(offsets) - 2)
+            if first_slot > last_slot or offsets[last_slot + 1] == offsets[first_slot]:
+                return {}
+            start, end = offsets[first_slot], offsets[last_slot + 1]
+            try:
+                data = self.container_client.get_blob_client(self.pack_name(blob_name, index)).download_blob(
+                    offset=base + start, length=end - start,
+                    etag=etag, match_condition=MatchConditions.IfNotModified).readall()
+            except (ResourceModifiedError, ResourceNotFoundError):
+                continue  # Rewritten or deleted since the header was cached
+            return {first_frame + slot: data[offsets[slot] - start:offsets[slot + 1] - start]
+                    for slot in range(first_slot, last_slot + 1) if offsets[slot + 1] > offsets[slot]}
+        return None
+
+    def contains(self, blob_name: str, frame_number: int) -> bool:
+        """True if the frame is held in a pack (header lookup only)"""
+        index = self.pack_index(frame_number)
+        entry = self._header(blob_name, index)
+        if entry is None:
+            return False
+        _, _, offsets, first_frame = entry
+        slot = frame_number - first_frame
+        return 0 <= slot < len(offsets) - 1 and offsets[slot + 1] > offsets[slot]
+
+    def read_frame(self, blob_name: str, frame_number: int) -> Optional[bytes]:
+        """A frame's JPEG from its pack, or None if it is not packed"""
+        index = self.pack_index(frame_number)
+        slot = frame_number - index * self.pack_size
+        frames = self._read_range(blob_name, index, slot, slot)
+        return frames.get(frame_number) if frames else None
+
+    def read_frames(self, blob_name: str, frame_numbers: Iterable[int], io_pool: Optional[Executor] = None) -> Dict[int, bytes]:
+        """Packed frames among frame_numbers: one ranged read per pack touched (in parallel with io_pool)"""
+        by_pack: Dict[int, List[int]] = {}
+        for n in frame_numbers:
+            by_pack.setdefault(self.pack_index(n), []).append(n - self.pack_index(n) * self.pack_size)
+
+        def read(item):
+            index, slots = item
+            return self._read_range(blob_name, index, min(slots), max(slots)) or {}
+
+        wanted = set(frame_numbers)
+        results = {}
+        for frames in (io_pool.map(read, by_pack.items()) if io_pool else map(read, by_pack.items())):
+            results.update((n, data) for n, data in frames.items() if n in wanted)
+        return results
+
+    def write_pack(self, blob_name: str, index: int, frames: Dict[int, bytes]) -> Tuple[str, int, int]:
+        """Upload a pack holding frames (frame number -> JPEG); returns (name, bytes, frames held)"""
+        first_frame = index * self.pack_size
+        held = [n for n in frames if frames[n] and self.pack_index(n) == index]
+        slots = max(held) - first_frame + 1 if held else 0
+        data = encode_pack(first_frame, [frames.get(first_frame + slot) for slot in range(slots)])
+        name = self.pack_name(blob_name, index)
+        result = self.container_client.get_blob_client(name).upload_blob(
+            data, overwrite=True, metadata={FRAMES_METADATA_KEY: str(len(held))})
+        _, offsets = decode_header(data)
+        self._remember((blob_name, index), (result['etag'], header_size(slots), offsets, first_frame))
+        return name, len(data), len(held)
+
+    def _read_blob(self, name: str) -> Optional[bytes]:
+        try:
+            return self.container_client.get_blob_client(name).download_blob().readall()
+        except ResourceNotFoundError:
+            return None
+
+    def migrate_video(self, blob_name: str, io_pool: Executor, delete_frames: bool = True,
+                      stats=None) -> dict:
+        """
+        Fold a video's per-frame blobs into packs (merged with any packs
+        already there), then delete the per-frame blobs in batches.
+        """
+        frame_blobs: Dict[int, List[Tuple[int, str, int]]] = {}
+        existing_packs = set()
+        for blob in self.container_client.list_blobs(name_starts_with=f"{blob_name}/"):
+            match = STANDARD_FRAME_NAME.fullmatch(blob.name.rsplit('/', 1)[-1])
+            if match:
+                frame_number = int(match.group(1))
+                frame_blobs.setdefault(self.pack_index(frame_number), []).append(
+                    (frame_number, blob.name, blob.size))
+            elif is_pack_blob(blob.name):
+                existing_packs.add(blob.name)
+
+        summary = {"video": blob_name, "packs": 0, "framesPacked": 0, "frameBlobsDeleted": 0}
+        for index, blobs in sorted(frame_blobs.items()):
+            frames: Dict[int, bytes] = {}
+            previous_frames = 0
+            pack_name = self.pack_name(blob_name, index)
+            if pack_name in existing_packs:
+                previous = self.container_client.get_blob_client(pack_name).download_blob()
+                previous_size = previous.properties.size
+                data = previous.readall()
+                first_frame, offsets = decode_header(data)
+                if not self.fits(index, first_frame, offsets):
+                    # Rewriting it at this size would drop the frames outside this pack
+                    logger.warning(f"Skipping {pack_name}: packed with another pack size than {self.pack_size}")
+                    continue
+                frames.update(pack_frames(data))
+                previous_frames = len(frames)
+
+            for (frame_number, _, _), data in zip(blobs, io_pool.map(self._read_blob, [name for _, name, _ in blobs])):
+                if data:
+                    frames.setdefault(frame_number, data)
+
+            _, size, held = self.write_pack(blob_name, index, frames)
+            if stats is not None:
+                if previous_frames:
+                    stats.record_delete(blob_name, previous_frames, previous_size)
+                stats.record_write(pack_name, size, held)
+
+            if delete_frames:
+                deleted, deleted_bytes = 0, 0
+                for start in range(0, len(blobs), DELETE_BATCH_SIZE):
+                    batch = blobs[start:start + DELETE_BATCH_SIZE]
+                    responses = self.container_client.delete_blobs(*[name for _, name, _ in batch],
+                                                                  raise_on_any_failure=False)
+                    for (_, _, size), response in zip(batch, responses):
+                        if response.status_code in (200, 202):
+                            deleted += 1
+                            deleted_bytes += size
+                if stats is not None:
+                    stats.record_delete(blob_name, deleted, deleted_bytes)
+                summary["frameBlobsDeleted"] += deleted
+
+            summary["packs"] += 1
+            summary["framesPacked"] += len(blobs)
+        logger.info(f"Packed {summary['framesPacked']} frames of {blob_name} into {summary['packs']} packs")
+        return summary
+
+
+def main():
+    """Migration tool: fold existing per-frame blobs into packs"""
+    from azure.identity import DefaultAzureCredential
+    from azure.storage.blob import BlobServiceClient
+
+    from app.frame_retention import FrameStats
+
+    parser = argparse.ArgumentParser(
+        prog='python -m app.frame_packs',
+        description="Fold per-frame blobs in the frames container into frame packs")
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument('--video', action='append', help='video blob name (repeatable)')
+    scope.add_argument('--project', help='every video of a project')
+    scope.add_argument('--all', action='store_true', help='every video in the videos container')
+    parser.add_argument('--keep-frames', action='store_true', help='keep the per-frame blobs after packing')
+    parser.add_argument('--pack-size', type=int, default=int(os.getenv('FRAME_PACK_SIZE', 256)))
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    blob_service_client = BlobServiceClient(
+        account_url=f"https://{os.environ['AZURE_STORAGE_ACCOUNT_NAME']}.blob.core.windows.net",
+        credential=DefaultAzureCredential()
+    )
+    frames_container_client = blob_service_client.get_container_client('frames')
+    store = FramePackStore(frames_container_client, pack_size=args.pack_size)
+    stats = FrameStats(frames_container_client)
+
+    if args.video:
+        videos = args.video
+    else:
+        prefix = f"raw-videos/{args.project}/" if args.project else 'raw-videos/'
+        videos = [blob.name for blob in
+                  blob_service_client.get_container_client('videos').list_blobs(name_starts_with=prefix)]
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as io_pool:
+        for blob_name in videos:
+            try:
+                summary = store.migrate_video(blob_name, io_pool, delete_frames=not args.keep_frames, stats=stats)
+                print(f"{blob_name}: {summary['framesPacked']} frames -> {summary['packs']} packs, "
+                      f"{summary['frameBlobsDeleted']} frame blobs deleted")
+            except HttpResponseError as e:
+                print(f"{blob_name}: failed ({e})")
+    stats.flush()
+
+
+if __name__ == '__main__':
+    main()
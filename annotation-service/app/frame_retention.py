@@ -0,0 +1,552 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+
+from app.frame_packs import FRAMES_METADATA_KEY, is_pack_blob
+
+logger = logging.getLogger(__name__)
+
+STATS_BLOB = '_retention/stats.json'
+JOB_BLOB_PREFIX = '_retention/jobs/'
+EVICTION_CLAIM_BLOB = '_retention/eviction.json'
+DELETE_BATCH_SIZE = 256  # Most subrequests one blob batch request may carry
+MAX_WRITE_ATTEMPTS = 10
+FRAME_EXTENSIONS = ('.jpg', '.webp', '.avif')
+
+
+def is_frame_blob(name: str) -> bool:
+    """
+    True for extracted frames: images ({video}/frame_000123.jpg, variants such
+    as frame_000123.thumbnail.webp) and frame packs ({video}/pack_000000.bin),
+    not sidecars or retention state
+    """
+    file_name = name.rsplit('/', 1)[-1]
+    return ((file_name.startswith('frame_') and file_name.endswith(FRAME_EXTENSIONS)) or is_pack_blob(name)) \
+        and not name.startswith('_retention/')
+
+
+def frames_in(blob) -> int:
+    """Frames a listed frame blob holds (a pack's count is in its metadata)"""
+    if is_pack_blob(blob.name):
+        return int((blob.metadata or {}).get(FRAMES_METADATA_KEY, 0))
+    return 1
+
+
+def video_of(frame_blob_name: str) -> str:
+    """Video blob name a frame belongs to"""
+    return frame_blob_name.rsplit('/', 1)[0]
+
+
+class FrameStats:
+    """
+    Per-video frame counts, bytes and last access time, kept in one blob
+    in the frames container so stats never need a listing:
+
+        {"videos": {video: [frames, bytes, lastAccessed]}, "updatedAt": 1768500943.2}
+
+    Each process records frame writes, deletions and reads as deltas in
+    memory. The deltas are merged onto the stored counters at most every
+    `flush_delay` seconds in one ETag-conditional write, retried on
+    conflict. Counts and bytes add up and access times take the latest, so
+    the merge does not depend on write order. A concurrent overwrite of
+    the same frame counts twice; a recount job (FrameRetention) repairs
+    such drift.
+    """
+
+    def __init__(self, container_client, flush_delay: float = 10.0,
+                 on_flush: Optional[Callable[[dict], None]] = None):
+        self.container_client = container_client
+        self.flush_delay = flush_delay
+        self.on_flush = on_flush
+
+        # Video -> [frames delta, bytes delta, last access]
+        self._deltas: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._flush_scheduled = False
+
+    def _blob_client(self):
+        return self.container_client.get_blob_client(STATS_BLOB)
+
+    def _record(self, video: str, frames: int, size: int, accessed: Optional[float] = None):
+        with self._lock:
+            delta = self._deltas.setdefault(video, [0, 0, 0.0])
+            delta[0] += frames
+            delta[1] += size
+            if accessed is not None:
+                delta[2] = max(delta[2], accessed)
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        timer = threading.Timer(self.flush_delay, self._flush_in_background)
+        timer.daemon = True
+        timer.start()
+
+    def record_write(self, frame_blob_name: str, size: int, frames: int = 1):
+        """A frame (or a pack of `frames` frames) was stored"""
+        self._record(video_of(frame_blob_name), frames, size, time.time())
+
+    def record_delete(self, video: str, frames: int, size: int):
+        """Frames of a video were deleted"""
+        self._record(video, -frames, -size)
+
+    def touch(self, video: str):
+        """A video's frames were read; recent access protects them from budget eviction"""
+        self._record(video, 0, 0, time.time())
+
+    def _read(self) -> Tuple[Dict[str, List[float]], Optional[str]]:
+        """(stored counters, ETag); ETag None if nothing was stored yet"""
+        try:
+            download_stream = self._blob_client().download_blob()
+        except ResourceNotFoundError:
+            return {}, None
+        return json.loads(download_stream.readall()).get('videos', {}), download_stream.properties.etag
+
+    def _write(self, videos: Dict[str, List[float]], etag: Optional[str]):
+        if etag is None:
+            kwargs = {'etag': '*', 'match_condition': MatchConditions.IfMissing}
+        else:
+            kwargs = {'etag': etag, 'match_condition': MatchConditions.IfNotModified}
+        self._blob_client().upload_blob(
+            json.dumps({"videos": videos, "updatedAt": time.time()}, separators=(',', ':')),
+            overwrite=True, **kwargs)
+
+    @staticmethod
+    def _merge(videos: Dict[str, List[float]], deltas: Dict[str, List[float]]) -> Dict[str, List[float]]:
+        videos = dict(videos)
+        for video, (frames, size, accessed) in deltas.items():
+            stored = videos.get(video, [0, 0, 0.0])
+            merged = [max(stored[0] + frames, 0), max(stored[1] + size, 0), max(stored[2], accessed)]
+            if merged[0]:
+                videos[video] = merged
+            else:
+                videos.pop(video, None)
+        return videos
+
+    def _flush_in_background(self):
+        with self._lock:
+            self._flush_scheduled = False
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error writing frame cache stats: {e}")
+            with self._lock:
+                retry = bool(self._deltas) and not self._flush_scheduled
+                self._flush_scheduled = self._flush_scheduled or retry
+            if retry:
+                timer = threading.Timer(self.flush_delay, self._flush_in_background)
+                timer.daemon = True
+                timer.start()
+
+    def flush(self):
+        """Merge this process's deltas into the stored counters"""
+        with self._write_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, {}
+            if not deltas:
+                return
+            try:
+                for _ in range(MAX_WRITE_ATTEMPTS):
+                    stored, etag = self._read()
+                    videos = self._merge(stored, deltas)
+                    try:
+                        self._write(videos, etag)
+                        break
+                    except (ResourceModifiedError, ResourceExistsError):
+                        continue  # Another process flushed in between; merge onto its counters
+                else:
+                    raise RuntimeError(f"Frame cache stats still changing after {MAX_WRITE_ATTEMPTS} attempts")
+            except Exception:
+                # Put the deltas back so the next flush carries them
+                with self._lock:
+                    self._deltas = self._merge_deltas(deltas, self._deltas)
+                raise
+
+        if self.on_flush is not None:
+            self.on_flush(self.totals(videos))
+
+    @staticmethod
+    def _merge_deltas(first: Dict[str, List[float]], second: Dict[str, List[float]]) -> Dict[str, List[float]]:
+        merged = {video: list(delta) for video, delta in first.items()}
+        for video, (frames, size, accessed) in second.items():
+            delta = merged.setdefault(video, [0, 0, 0.0])
+            delta[0] += frames
+            delta[1] += size
+            delta[2] = max(delta[2], accessed)
+        return merged
+
+    def videos(self) -> Dict[str, dict]:
+        """Per-video counters: stored values plus this process's unflushed deltas"""
+        stored, _ = self._read()
+        with self._lock:
+            videos = self._merge(stored, self._deltas)
+        return {video: {"frames": int(frames), "bytes": int(size), "lastAccessed": accessed}
+                for video, (frames, size, accessed) in videos.items()}
+
+    @staticmethod
+    def totals(videos: Dict[str, List[float]]) -> dict:
+        return {
+            "videos": len(videos),
+            "frames": int(sum(counters[0] for counters in videos.values())),
+            "bytes": int(sum(counters[1] for counters in videos.values()))
+        }
+
+    def replace(self, counted: Dict[str, List[float]]):
+        """Install recounted counters, keeping access times recorded since"""
+        with self._write_lock:
+            for _ in range(MAX_WRITE_ATTEMPTS):
+                stored, etag = self._read()
+                videos = {video: [frames, size, max(accessed, stored.get(video, [0, 0, 0.0])[2])]
+                          for video, (frames, size, accessed) in counted.items() if frames}
+                try:
+                    self._write(videos, etag)
+                    return
+                except (ResourceModifiedError, ResourceExistsError):
+                    continue
+            raise RuntimeError(f"Frame cache stats still changing after {MAX_WRITE_ATTEMPTS} attempts")
+
+
+class RetentionJob:
+    """Progress of one frame cleanup, eviction or recount, resumable from its status blob"""
+
+    def __init__(self, kind: str, video: Optional[str] = None, older_than_days: Optional[float] = None,
+                 max_bytes: Optional[int] = None, job_id: Optional[str] = None):
+        self.job_id = job_id or f"{time.strftime('%Y%m%d_%H%M%S', time.gmtime())}_{uuid.uuid4().hex[:8]}"
+        self.kind = kind
+        self.video = video
+        self.older_than_days = older_than_days
+        self.max_bytes = max_bytes
+        self.status = 'queued'
+        self.scanned = 0
+        self.deleted = 0
+        self.deleted_bytes = 0
+        self.failed = 0
+        self.videos_done: List[str] = []  # evict: videos cleared
+        self.counted: Dict[str, List[float]] = {}  # recount: tally so far
+        self.continuation: Optional[str] = None  # Listing position reached
+        self.current_video: Optional[str] = None  # evict: video being cleared
+        self.cutoff: Optional[str] = None  # cleanup: frames last modified before this are deleted
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.updated_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self, state: bool = False) -> dict:
+        """Status for the API; state=True adds what a resumed run needs"""
+        with self.lock:
+            status = {
+                "jobId": self.job_id,
+                "kind": self.kind,
+                "video": self.video,
+                "olderThanDays": self.older_than_days,
+                "maxBytes": self.max_bytes,
+                "status": self.status,
+                "scannedFrames": self.scanned,
+                "deletedFrames": self.deleted,
+                "deletedBytes": self.deleted_bytes,
+                "failedDeletes": self.failed,
+                "evictedVideos": len(self.videos_done),
+                "countedVideos": len(self.counted),
+                "error": self.error,
+                "createdAt": self.created_at,
+                "startedAt": self.started_at,
+                "updatedAt": self.updated_at,
+                "finishedAt": self.finished_at
+            }
+            if state:
+                status["state"] = {
+                    "continuation": self.continuation,
+                    "currentVideo": self.current_video,
+                    "cutoff": self.cutoff,
+                    "videosDone": self.videos_done,
+                    "counted": self.counted
+                }
+            return status
+
+    @classmethod
+    def from_dict(cls, status: dict) -> 'RetentionJob':
+        job = cls(status['kind'], status.get('video'), status.get('olderThanDays'),
+                  status.get('maxBytes'), status['jobId'])
+        state = status.get('state', {})
+        job.status = status['status']
+        job.scanned = status.get('scannedFrames', 0)
+        job.deleted = status.get('deletedFrames', 0)
+        job.deleted_bytes = status.get('deletedBytes', 0)
+        job.failed = status.get('failedDeletes', 0)
+        job.videos_done = state.get('videosDone', [])
+        job.counted = state.get('counted', {})
+        job.continuation = state.get('continuation')
+        job.current_video = state.get('currentVideo')
+        job.cutoff = state.get('cutoff')
+        job.error = status.get('error')
+        job.created_at = status.get('createdAt', job.created_at)
+        job.started_at = status.get('startedAt')
+        job.updated_at = status.get('updatedAt')
+        job.finished_at = status.get('finishedAt')
+        return job
+
+
+class FrameRetention:
+    """
+    Background jobs that delete cached frames without visiting them one at
+    a time:
+
+    - cleanup: a video's frames and/or frames older than a number of days
+    - evict: whole videos, least recently accessed first, until the cache
+      is within `max_bytes` (started automatically when a stats flush sees
+      the budget exceeded)
+    - recount: rebuilds FrameStats from a full listing
+
+    Jobs list the container a page at a time and delete with the blob batch
+    API, DELETE_BATCH_SIZE frames per request. After each page the listing
+    position is saved in the job's status blob, so an interrupted job
+    (worker restart, failure) can be resumed where it stopped. Videos read
+    in the last `min_idle` seconds are never evicted.
+    """
+
+    def __init__(self, container_client, stats: FrameStats, max_bytes: int = 0,
+                 min_idle: float = 600.0, status_interval: float = 5.0, max_concurrent_jobs: int = 1):
+        self.container_client = container_client
+        self.stats = stats
+        self.max_bytes = max_bytes
+        self.min_idle = min_idle
+        self.status_interval = status_interval
+
+        self._jobs: Dict[str, RetentionJob] = {}
+        self._jobs_lock = threading.Lock()
+        self._job_pool = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix='frame-retention')
+
+    # Status
+
+    def _job_client(self, job_id: str):
+        return self.container_client.get_blob_client(f"{JOB_BLOB_PREFIX}{job_id}.json")
+
+    def _write_status(self, job: RetentionJob):
+        with job.lock:
+            job.updated_at = time.time()
+        try:
+            self._job_client(job.job_id).upload_blob(json.dumps(job.to_dict(state=True)), overwrite=True)
+        except Exception as e:
+            logger.warning(f"Could not write frame retention status for {job.job_id}: {e}")
+
+    def _read_status(self, job_id: str) -> Optional[dict]:
+        try:
+            return json.loads(self._job_client(job_id).download_blob().readall())
+        except ResourceNotFoundError:
+            return None
+
+    def _stale(self, status: dict) -> bool:
+        """A job whose runner stopped updating it (its worker restarted or died)"""
+        return status['status'] in ('queued', 'running') and \
+            time.time() - (status.get('updatedAt') or status['createdAt']) > 10 * self.status_interval
+
+    def get_status(self, job_id: str) -> Optional[dict]:
+        """Job status from this process, falling back to the status blob"""
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        status = self._read_status(job_id)
+        if status is None:
+            return None
+        status.pop('state', None)
+        if self._stale(status):
+            status['status'] = 'interrupted'
+        return status
+
+    # Starting and resuming
+
+    def _start(self, job: RetentionJob) -> RetentionJob:
+        with self._jobs_lock:
+            self._jobs[job.job_id] = job
+        self._write_status(job)
+        self._job_pool.submit(self._run, job)
+        return job
+
+    def submit_cleanup(self, video: Optional[str] = None, older_than_days: Optional[float] = None) -> RetentionJob:
+        """Delete a video's frames, frames older than a number of days, or both conditions together"""
+        if video is None and older_than_days is None:
+            raise ValueError("Specify a video, a number of days, or both")
+        job = RetentionJob('cleanup', video=video, older_than_days=older_than_days)
+        if older_than_days is not None:
+            job.cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
+        logger.info(f"Queued frame cleanup {job.job_id} (video: {video}, older than {older_than_days} days)")
+        return self._start(job)
+
+    def submit_evict(self, max_bytes: int) -> RetentionJob:
+        """Evict least recently accessed videos until the frame cache is within max_bytes"""
+        logger.info(f"Queued frame eviction down to {max_bytes / (1024**3):.2f} GB")
+        return self._start(RetentionJob('evict', max_bytes=max_bytes))
+
+    def submit_recount(self) -> RetentionJob:
+        """Rebuild the frame counters from a full listing"""
+        logger.info("Queued frame cache recount")
+        return self._start(RetentionJob('recount'))
+
+    def resume(self, job_id: str) -> Optional[RetentionJob]:
+        """Continue an interrupted or failed job from its last saved position"""
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job is not None and not job.done:
+            return job  # Still running here
+
+        status = self._read_status(job_id)
+        if status is None:
+            return None
+        if status['status'] == 'completed' or (status['status'] in ('queued', 'running') and not self._stale(status)):
+            return RetentionJob.from_dict(status)  # Nothing to do, or running in another worker
+
+        job = RetentionJob.from_dict(status)
+        job.status = 'queued'
+        job.error = None
+        job.finished_at = None
+        logger.info(f"Resuming frame {job.kind} {job_id}")
+        return self._start(job)
+
+    def check_budget(self, totals: dict):
+        """After a stats flush: start an eviction if the cache is over budget and none is running"""
+        if not self.max_bytes or totals['bytes'] <= self.max_bytes:
+            return
+        claim = self.container_client.get_blob_client(EVICTION_CLAIM_BLOB)
+        try:
+            download_stream = claim.download_blob()
+            last = self._read_status(json.loads(download_stream.readall())['jobId'])
+            if last is not None and last['status'] in ('queued', 'running') and not self._stale(last):
+                return
+            if last is not None and time.time() - (last.get('finishedAt') or 0) < self.min_idle:
+                return  # Evicted recently; what is left was in use
+            kwargs = {'etag': download_stream.properties.etag, 'match_condition': MatchConditions.IfNotModified}
+        except ResourceNotFoundError:
+            kwargs = {'etag': '*', 'match_condition': MatchConditions.IfMissing}
+
+        job = RetentionJob('evict', max_bytes=self.max_bytes)
+        try:
+            # Only the process whose conditional write wins starts the eviction
+            claim.upload_blob(json.dumps({"jobId": job.job_id}), overwrite=True, **kwargs)
+        except (ResourceModifiedError, ResourceExistsError):
+            return
+        logger.info(f"Frame cache over budget ({totals['bytes'] / (1024**3):.2f} GB); starting eviction {job.job_id}")
+        self._start(job)
+
+    # Running
+
+    def _delete(self, job: RetentionJob, blobs: list):
+        """Delete listed frame blobs in blob batches, updating job progress and the counters"""
+        for start in range(0, len(blobs), DELETE_BATCH_SIZE):
+            batch = blobs[start:start + DELETE_BATCH_SIZE]
+            responses = self.container_client.delete_blobs(*[blob.name for blob in batch],
+                                                          raise_on_any_failure=False)
+            removed: Dict[str, List[int]] = {}
+            failed = 0
+            for blob, response in zip(batch, responses):
+                if response.status_code in (200, 202):
+                    counters = removed.setdefault(video_of(blob.name), [0, 0])
+                    counters[0] += frames_in(blob)
+                    counters[1] += blob.size
+                elif response.status_code != 404:  # Already gone is fine
+                    failed += 1
+            for video, (frames, size) in removed.items():
+                self.stats.record_delete(video, frames, size)
+            with job.lock:
+                job.deleted += sum(frames for frames, _ in removed.values())
+                job.deleted_bytes += sum(size for _, size in removed.values())
+                job.failed += failed
+
+    def _pages(self, job: RetentionJob, prefix: Optional[str]) -> Iterable[list]:
+        """Listing pages from the job's saved position; the position advances once a page is processed"""
+        pages = self.container_client.list_blobs(name_starts_with=prefix, include=['metadata']).by_page(
+            continuation_token=job.continuation)
+        for page in pages:
+            yield list(page)
+            with job.lock:
+                job.continuation = pages.continuation_token
+            self._write_status(job)
+            if pages.continuation_token is None:
+                return
+
+    def _cleanup(self, job: RetentionJob):
+        cutoff = datetime.fromisoformat(job.cutoff) if job.cutoff else None
+        prefix = f"{job.video}/" if job.video else None
+        for page in self._pages(job, prefix):
+            frames = [blob for blob in page if is_frame_blob(blob.name)]
+            with job.lock:
+                job.scanned += sum(frames_in(blob) for blob in frames)
+            self._delete(job, [blob for blob in frames if cutoff is None or blob.last_modified < cutoff])
+
+    def _evict(self, job: RetentionJob):
+        while True:
+            videos = self.stats.videos()
+            total = sum(counters['bytes'] for counters in videos.values())
+            if total <= job.max_bytes:
+                return
+            if job.current_video is None:
+                idle_before = time.time() - self.min_idle
+                candidates = sorted((counters['lastAccessed'], video) for video, counters in videos.items()
+                                    if counters['lastAccessed'] < idle_before and video not in job.videos_done)
+                if not candidates:
+                    logger.warning(f"Frame cache still {total / (1024**3):.2f} GB over a "
+                                   f"{job.max_bytes / (1024**3):.2f} GB budget; every video was read recently")
+                    return
+                with job.lock:
+                    job.current_video = candidates[0][1]
+                    job.continuation = None
+
+            for page in self._pages(job, f"{job.current_video}/"):
+                frames = [blob for blob in page if is_frame_blob(blob.name)]
+                with job.lock:
+                    job.scanned += sum(frames_in(blob) for blob in frames)
+                self._delete(job, frames)
+            logger.info(f"Evicted cached frames of {job.current_video}")
+            with job.lock:
+                job.videos_done.append(job.current_video)
+                job.current_video = None
+                job.continuation = None
+            self.stats.flush()  # So the next round sees the freed bytes
+
+    def _recount(self, job: RetentionJob):
+        for page in self._pages(job, None):
+            with job.lock:
+                for blob in page:
+                    if is_frame_blob(blob.name):
+                        counters = job.counted.setdefault(video_of(blob.name), [0, 0, 0.0])
+                        counters[0] += frames_in(blob)
+                        counters[1] += blob.size
+                        counters[2] = max(counters[2], blob.last_modified.timestamp())
+                        job.scanned += frames_in(blob)
+        self.stats.replace(job.counted)
+
+    def _run(self, job: RetentionJob):
+        with job.lock:
+            job.status = 'running'
+            job.started_at = job.started_at or time.time()
+        self._write_status(job)
+
+        try:
+            {'cleanup': self._cleanup, 'evict': self._evict, 'recount': self._recount}[job.kind](job)
+            self.stats.flush()
+            with job.lock:
+                job.status = 'completed'
+                job.finished_at = time.time()
+            logger.info(f"Frame {job.kind} {job.job_id} finished: {job.deleted} frames "
+                        f"({job.deleted_bytes / (1024*1024):.1f} MB) deleted, {job.failed} failed")
+        except Exception as e:
+            logger.error(f"Frame {job.kind} {job.job_id} failed: {e}")
+            with job.lock:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = time.time()
+        self._write_status(job)
@@ -0,0 +1,107 @@
+import logging
+from typing import Dict, Iterable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+TIERS = ('thumbnail', 'standard', 'full')
+# Format -> (file extension, MIME type)
+FORMATS = {
+    'jpeg': ('jpg', 'image/jpeg'),
+    'webp': ('webp', 'image/webp'),
+    'avif': ('avif', 'image/avif'),
+}
+# Encoder quality per tier and format; the standard JPEG quality is FRAME_JPEG_QUALITY
+QUALITY = {
+    'thumbnail': {'jpeg': 70, 'webp': 60, 'avif': 50},
+    'standard': {'webp': 80, 'avif': 60},
+    'full': {'jpeg': 95, 'webp': 90, 'avif': 75},
+}
+
+
+class FrameVariant(NamedTuple):
+    """One encoding of a frame: resolution tier, image format and the encoder settings they map to"""
+
+    tier: str
+    format: str
+    max_width: int  # 0 keeps the source resolution
+    quality: int
+
+    @property
+    def extension(self) -> str:
+        return FORMATS[self.format][0]
+
+    @property
+    def mimetype(self) -> str:
+        return FORMATS[self.format][1]
+
+
+def parse_accept(header: Optional[str]) -> Dict[str, float]:
+    """Media ranges of an Accept header with their q-values"""
+    accepted = {}
+    for item in (header or '').split(','):
+        media_type, *params = [part.strip() for part in item.split(';')]
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[media_type.lower()] = quality
+    return accepted
+
+
+class FrameVariants:
+    """
+    Resolution tiers (thumbnail, standard, full) and format negotiation
+    for frame responses.
+
+    The standard JPEG is the variant the service always produced; it is
+    what pre-extraction, frame packs and exports use. Other variants are
+    encoded on demand from the same decode and cached under their own
+    names. WebP/AVIF are only served to clients that list them in Accept:
+    wildcards (*/*, image/*) get JPEG, since a browser fetch() sends */*
+    whatever it can decode. Among the formats a client accepts, the
+    highest q-value wins, with ties going to the first in `formats`.
+    """
+
+    def __init__(self, standard_width: int, standard_quality: int, thumbnail_width: int = 320,
+                 formats: Iterable[str] = ('webp', 'jpeg'), encodable: Iterable[str] = ('jpeg',)):
+        self.widths = {'thumbnail': thumbnail_width, 'standard': standard_width, 'full': 0}
+        self.standard_quality = standard_quality
+        encodable = set(encodable)
+        self.formats = [fmt for fmt in formats if fmt in FORMATS and fmt in encodable]
+        skipped = [fmt for fmt in formats if fmt not in self.formats]
+        if skipped:
+            logger.warning(f"Frame formats not available in this build: {', '.join(skipped)}")
+        if 'jpeg' not in self.formats:
+            self.formats.append('jpeg')
+        self.standard = self.variant('standard', 'jpeg')
+
+    def variant(self, tier: Optional[str] = None, fmt: str = 'jpeg') -> FrameVariant:
+        """The variant for a tier (default standard) and format; ValueError for an unknown tier"""
+        tier = tier or 'standard'
+        if tier not in self.widths:
+            raise ValueError(f"tier must be one of {', '.join(TIERS)}")
+        if tier == 'standard' and fmt == 'jpeg':
+            quality = self.standard_quality
+        else:
+            quality = QUALITY[tier][fmt]
+        return FrameVariant(tier, fmt, self.widths[tier], quality)
+
+    def negotiate(self, tier: Optional[str], accept: Optional[str]) -> FrameVariant:
+        """Variant for a requested tier and an Accept header"""
+        accepted = parse_accept(accept)
+        best, best_quality = 'jpeg', 0.0
+        for fmt in self.formats:
+            mimetype = FORMATS[fmt][1]
+            if fmt == 'jpeg':
+                quality = accepted.get(mimetype, accepted.get('image/*', accepted.get('*/*', 0.0 if accepted else 1.0)))
+            else:
+                quality = accepted.get(mimetype, 0.0)
+            if quality > best_quality:
+                best, best_quality = fmt, quality
+        return self.variant(tier, best)
@@ -0,0 +1,163 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.frame_decoder import encode_image
+
+logger = logging.getLogger(__name__)
+
+# Shared memory per pool. /dev/shm is 64 MB by default in Docker and every
+# gunicorn worker has its own pool, so stay well under half of it
+DEFAULT_SHM_BYTES = 24 * 1024 * 1024
+SHM_DIR = '/dev/shm'
+
+_attached: Dict[str, SharedMemory] = {}  # Worker side: slots mapped so far, by name
+
+
+def _attach(name: str) -> SharedMemory:
+    shm = _attached.get(name)
+    if shm is None:
+        shm = SharedMemory(name=name)
+        # The parent owns the segment; stop this process's tracker from unlinking it on exit
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        _attached[name] = shm
+    return shm
+
+
+def _encode_slot(name: str, shape: tuple, dtype: str, max_width: int, quality: int, fmt: str) -> bytes:
+    """Worker side: resize and encode a frame read in place from a shared memory slot"""
+    frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attach(name).buf)
+    return encode_image(frame, max_width, quality, fmt)
+
+
+class FrameProcessPool:
+    """
+    Process pools for CPU-bound frame work, so extraction scales with cores
+    instead of contending for one interpreter's GIL.
+
+    encode() hands a decoded frame to any of `workers` processes through a
+    ring of shared memory slots: the frame is copied once into a slot and
+    the worker resizes/encodes it in place, so only the encoded bytes are
+    pickled. Slots double as backpressure: callers wait when all are busy.
+
+    Slots are sized on first use to the frame being encoded, and as many
+    are created as fit in `max_shm_bytes` (at most `slots`, default
+    2 x workers) and in the free space of /dev/shm, since writing past a
+    full /dev/shm kills the process with SIGBUS. Frames larger than a
+    slot, or every frame if no slot fits, are encoded inline.
+
+    submit_pinned() runs arbitrary work (e.g. a full decode) on one of
+    `pinned_workers` single-process executors chosen by key, so the same
+    video always lands in the same process and its decoder stays positioned.
+
+    Processes are spawned, and only on first use.
+    """
+
+    def __init__(self, workers: int, pinned_workers: int = 0,
+                 slots: Optional[int] = None, max_shm_bytes: int = DEFAULT_SHM_BYTES):
+        self.workers = workers
+        self.pinned_workers = pinned_workers
+        self.slot_count = slots or workers * 2
+        self.max_shm_bytes = max_shm_bytes
+        self.slot_bytes = 0
+
+        self._context = multiprocessing.get_context('spawn')
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pinned: List[ProcessPoolExecutor] = []
+        self._slots: List[SharedMemory] = []
+        self._free: "queue.Queue[SharedMemory]" = queue.Queue()
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    @staticmethod
+    def _shm_free_bytes() -> Optional[int]:
+        try:
+            st = os.statvfs(SHM_DIR)
+        except OSError:
+            return None
+        return st.f_bavail * st.f_frsize
+
+    def _start(self, frame_bytes: int):
+        """Create the slots, sized for frame_bytes, and the worker pool; encoding stays inline if none fit"""
+        with self._lock:
+            if self._executor is not None or self.workers <= 0:
+                return
+            slot_bytes = -(-frame_bytes // (1024 * 1024)) * 1024 * 1024  # Whole MB, for nearby resolutions
+            budget = self.max_shm_bytes
+            free = self._shm_free_bytes()
+            if free is not None:
+                budget = min(budget, free // 2)  # Leave room for other processes' segments
+            count = min(self.slot_count, budget // slot_bytes)
+            try:
+                for _ in range(count):
+                    self._slots.append(SharedMemory(create=True, size=slot_bytes))
+            except OSError as e:
+                logger.warning(f"Could not create shared memory slots: {e}")
+            if not self._slots:
+                logger.warning(f"No room for {slot_bytes / (1024*1024):.0f} MB frame slots in shared memory "
+                               f"(budget {budget / (1024*1024):.0f} MB); encoding frames inline")
+                self.workers = 0
+                return
+            self.slot_bytes = slot_bytes
+            for shm in self._slots:
+                self._free.put(shm)
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context)
+            logger.info(f"Started {self.workers} frame encode processes "
+                        f"({len(self._slots)} x {slot_bytes / (1024*1024):.0f} MB shared slots)")
+
+    def encode(self, frame: np.ndarray, max_width: int, quality: int = 85, fmt: str = 'jpeg') -> bytes:
+        """Resize/encode a frame (JPEG by default, or WebP/AVIF) in a worker process"""
+        if self.workers > 0 and self._executor is None:
+            self._start(frame.nbytes)
+        if self.workers <= 0 or frame.nbytes > self.slot_bytes:
+            return encode_image(frame, max_width, quality, fmt)
+
+        shm = self._free.get()
+        try:
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=shm.buf)[...] = frame
+            return self._executor.submit(
+                _encode_slot, shm.name, frame.shape, frame.dtype.str, max_width, quality, fmt
+            ).result()
+        finally:
+            self._free.put(shm)
+
+    def submit_pinned(self, key: str, fn: Callable, *args) -> Future:
+        """Run fn(*args) on the pinned process for key (fn must be a picklable module-level function)"""
+        with self._lock:
+            if not self._pinned:
+                self._pinned = [ProcessPoolExecutor(max_workers=1, mp_context=self._context)
+                                for _ in range(max(self.pinned_workers, 1))]
+        return self._pinned[zlib.crc32(key.encode()) % len(self._pinned)].submit(fn, *args)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pinnedWorkers": len(self._pinned),
+            "slots": len(self._slots),
+            "slotsInUse": len(self._slots) - self._free.qsize()
+        }
+
+    def close(self):
+        with self._lock:
+            for executor in self._pinned + ([self._executor] if self._executor else []):
+                executor.shutdown(wait=False, cancel_futures=True)
+            self._pinned = []
+            self._executor = None
+            for shm in self._slots:
+                shm.close()
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
+            self._slots = []
+            self._free = queue.Queue()
@@ -1,17 +1,41 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, Response, redirect, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceNotModifiedError
+from azure.storage.blob import BlobServiceClient, BlobSasPermissions
 from azure.identity import DefaultAzureCredential
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import os
+import hashlib
 import logging
 import cv2
 import numpy as np
 from io import BytesIO
 import json
-import tempfile
+import multiprocessing
 import time
 import threading
+import uuid
+from urllib.parse import unquote
+from app.annotation_format import yolo_rows, yolo_text
+from app.annotation_store import META_FIELDS, AnnotationStore, VersionConflict, validate_ops
+from app.dataset_export import ARCHIVE_TYPES, DatasetExporter
+from app.frame_cache import FrameCache
+from app.frame_decoder import DecoderPool, encodable_formats
+from app.frame_ingest import FrameIngestor
+from app.frame_packs import FramePackStore
+from app.frame_retention import FrameRetention, FrameStats
+from app.frame_variants import FrameVariants
+from app.frame_workers import FrameProcessPool
+from app.mp4_index import parse_mp4_file
+from app.prefetch import PrefetchScheduler
+from app.project_catalog import ProjectCatalog
+from app.range_source import RangeVideoSources
+from app.sas import DelegationKeyCache, SasIssuer
+from app.sprite_sheets import SpriteSheets
+from app.video_cache import VideoCache
+from app.video_index import VideoIndex, VideoIndexStore, probe_packets
 
 app = Flask(__name__, static_folder='static')
 CORS(app)
@@ -19,68 +43,106 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Video cache: {blob_name: {'path': temp_path, 'last_accessed': timestamp}}
-video_cache = {}
-cache_lock = threading.Lock()
-CACHE_TTL = 900  # 15 minutes in seconds
+# Open decoders positioned where annotators are working, so stepping forward
+# continues decoding instead of seeking (and re-decoding the GOP) per frame
+decoder_pool = DecoderPool(
+    max_sessions=int(os.getenv('DECODER_MAX_SESSIONS', 8)),
+    max_forward_skip=int(os.getenv('DECODER_MAX_FORWARD_SKIP', 120)),
+    prepare=lambda path, first, last: range_sources.prepare(path, first, last)
+)
+
+# Resize/encode runs in worker processes (0 = inline). Each gunicorn worker has its own pool, so the
+# default is capped. Pool children never start pools of their own.
+FRAME_ENCODE_PROCESSES = int(os.getenv('FRAME_ENCODE_PROCESSES', min(os.cpu_count() or 1, 4))) \
+    if multiprocessing.parent_process() is None else 0
+frame_processes = FrameProcessPool(
+    workers=FRAME_ENCODE_PROCESSES,
+    pinned_workers=int(os.getenv('FRAME_PROCESS_WORKERS', 2)),
+    max_shm_bytes=int(os.getenv('FRAME_SHM_MB', 24)) * 1024 * 1024
+)
 
 
-def cleanup_expired_cache():
-    """Remove cached videos older than TTL"""
-    with cache_lock:
-        current_time = time.time()
-        expired_keys = []
+def get_cached_video(blob_name):
+    """Get local path of a video from the shared disk cache, downloading if not cached"""
+    return video_cache.get_path(blob_name)
 
-        for blob_name, cache_entry in video_cache.items():
-            if current_time - cache_entry['last_accessed'] > CACHE_TTL:
-                expired_keys.append(blob_name)
 
-        for key in expired_keys:
-            cache_entry = video_cache[key]
+def get_range_source(blob_name):
+    """Range-backed source for a faststart video, or None to fall back to a full download"""
+    if not RANGE_READS:
+        return None
+    try:
+        return range_sources.get(blob_name)
+    except Exception as e:
+        logger.warning(f"Range reads unavailable for {blob_name}: {e}")
+        return None
+
+
+def probe_video(blob_name, etag):
+    """Build a video's metadata index from its moov box, or from the downloaded file"""
+    source = get_range_source(blob_name)
+    if source is not None:
+        return VideoIndex.from_mp4(etag, source.index)
+
+    temp_path = get_cached_video(blob_name)
+    mp4 = parse_mp4_file(temp_path)
+    if mp4 is not None:
+        return VideoIndex.from_mp4(etag, mp4)
+
+    # Other containers: packet-level keyframe scan with ffprobe
+    index = probe_packets(temp_path, etag)
+    if index is not None:
+        return index
+
+    # No ffprobe: OpenCV properties only, no keyframe positions
+    cap = cv2.VideoCapture(temp_path)
+    index = VideoIndex(
+        etag=etag,
+        fps=cap.get(cv2.CAP_PROP_FPS),
+        frame_count=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    )
+    cap.release()
+    return index
+
+
+def get_video_index(blob_name):
+    """Metadata/keyframe index for a video, or None if it cannot be probed"""
+    try:
+        return video_index.get(blob_name)
+    except Exception as e:
+        logger.warning(f"Video index unavailable for {blob_name}: {e}")
+        return None
+
+
+def decode_frame(blob_name, frame_number):
+    """
+    Decode a frame from the fully cached video if present, otherwise from a
+    range-backed partial copy (fetching only the GOPs needed), falling back
+    to a full download for non-faststart files. Seeks use the keyframe index
+    when one is available.
+
+    Partial copies are only decoded by index-driven (PyAV) sessions, whose
+    reads stay within the fetched keyframe-to-reorder window. OpenCV's
+    frame-number seek can re-seek further back into unfetched holes, which
+    read as zeros and would decode (and be cached) as garbage.
+    """
+    index = get_video_index(blob_name)
+    video_path = video_cache.peek(blob_name)
+    if video_path is None:
+        source = get_range_source(blob_name) if decoder_pool.seeks_by_index(index) else None
+        if source is not None:
             try:
-                if os.path.exists(cache_entry['path']):
-                    os.unlink(cache_entry['path'])
-                logger.info(f"Cleaned up cached video: {key}")
+                frame = decoder_pool.read_frame(source.path, frame_number, index)
+                if frame is not None:
+                    return frame
             except Exception as e:
-                logger.error(f"Error cleaning up cache: {e}")
-            del video_cache[key]
+                logger.warning(f"Range-backed decode failed for {blob_name}: {e}")
+            decoder_pool.close_video(source.path)
+        video_path = get_cached_video(blob_name)
 
-
-def get_cached_video(blob_name):
-    """Get video from cache or download if not cached"""
-    with cache_lock:
-        # Check if video is in cache and not expired
-        if blob_name in video_cache:
-            cache_entry = video_cache[blob_name]
-            if time.time() - cache_entry['last_accessed'] < CACHE_TTL:
-                cache_entry['last_accessed'] = time.time()
-                logger.info(f"Cache hit for {blob_name}")
-                return cache_entry['path']
-            else:
-                # Expired, clean it up
-                try:
-                    if os.path.exists(cache_entry['path']):
-                        os.unlink(cache_entry['path'])
-                except Exception as e:
-                    logger.error(f"Error cleaning expired cache: {e}")
-                del video_cache[blob_name]
-
-        # Download video to cache
-        logger.info(f"Cache miss for {blob_name}, downloading...")
-        blob_client = blob_service_client.get_blob_client(
-            container=CONTAINER_NAME, blob=blob_name)
-
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-        download_stream = blob_client.download_blob()
-        temp_file.write(download_stream.readall())
-        temp_file.close()
-
-        video_cache[blob_name] = {
-            'path': temp_file.name,
-            'last_accessed': time.time()
-        }
-
-        return temp_file.name
+    return decoder_pool.read_frame(video_path, frame_number, index)
 
 # Start background cleanup thread
 
@@ -88,65 +150,256 @@ def get_cached_video(blob_name):
 def background_cleanup():
     while True:
         time.sleep(300)  # Run cleanup every 5 minutes
-        cleanup_expired_cache()
+        video_cache.evict()
+        range_sources.evict()
+        decoder_pool.close_idle()
 
 
 cleanup_thread = threading.Thread(target=background_cleanup, daemon=True)
 cleanup_thread.start()
 
 
-def get_or_create_frame(blob_name, frame_number):
-    """Get frame from blob storage or extract and save if not exists"""
-    # Generate frame blob name
-    frame_blob_name = f"{blob_name}/frame_{frame_number:06d}.jpg"
+def encode_frame(frame, variant=None):
+    """Resize and encode a decoded frame (standard JPEG unless a variant is given) in a worker process"""
+    variant = variant or frame_variants.standard
+    return frame_processes.encode(frame, variant.max_width, variant.quality, variant.format)
 
-    try:
-        # Check if frame already exists in blob storage
-        frame_blob_client = blob_service_client.get_blob_client(
-            container=FRAMES_CONTAINER, blob=frame_blob_name)
 
-        if frame_blob_client.exists():
-            logger.info(f"Frame cache hit: {frame_blob_name}")
-            # Download and return existing frame
-            frame_data = frame_blob_client.download_blob().readall()
-            return BytesIO(frame_data)
+def frame_blob_path(blob_name, frame_number, variant=None):
+    """Name of a cached frame in the frames container (frame_000123.thumbnail.webp for non-standard variants)"""
+    if variant is None or variant == frame_variants.standard:
+        return f"{blob_name}/frame_{frame_number:06d}.jpg"
+    return f"{blob_name}/frame_{frame_number:06d}.{variant.tier}.{variant.extension}"
 
-        logger.info(f"Frame cache miss: {frame_blob_name}, extracting...")
 
-        # Frame doesn't exist, extract it
-        temp_path = get_cached_video(blob_name)
+def frame_cache_key(blob_name, frame_number, variant=None):
+    """Hot frame cache key: the frame plus the encode parameters its bytes depend on"""
+    return (blob_name, frame_number, variant or frame_variants.standard)
 
-        cap = cv2.VideoCapture(temp_path)
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-        ret, frame = cap.read()
 
-        if not ret:
-            cap.release()
-            return None
+def variant_etag_params(variant):
+    """Extra frame_etag parameters for a variant (none for the standard JPEG, so its ETags are unchanged)"""
+    return () if variant == frame_variants.standard else tuple(variant)
+
+
+def request_variant():
+    """Frame variant for this request's ?tier= and Accept header; ValueError for an unknown tier"""
+    return frame_variants.negotiate(request.args.get('tier'), request.headers.get('Accept'))
+
+
+def frame_etag(blob_name, *params):
+    """Strong ETag for frame bytes: the source video's version plus everything that shapes the encoding"""
+    video_etag = video_cache.blob_version(blob_name)[0]
+    key = repr((video_etag, *params, FRAME_MAX_WIDTH, FRAME_JPEG_QUALITY))
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def with_cache_headers(response, etag, cache_control, vary=None):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    if vary:
+        response.headers['Vary'] = vary
+    return response
+
+
+def not_modified(etag, cache_control, vary=None):
+    """A 304 response if the request's If-None-Match already names etag, otherwise None"""
+    if request.if_none_match.contains_weak(etag):
+        return with_cache_headers(Response(status=304), etag, cache_control, vary)
+    return None
+
+
+def download_if_modified(blob_client):
+    """
+    Download a blob unless it still matches the request's If-None-Match.
+
+    Returns (data, etag), with data None when the client's copy is current.
+    The check is a conditional GET, so a revalidation costs one storage call.
+    """
+    client_etags = request.if_none_match.as_set()
+    try:
+        if len(client_etags) == 1:
+            download_stream = blob_client.download_blob(
+                etag=f'"{next(iter(client_etags))}"', match_condition=MatchConditions.IfModified)
+        else:
+            download_stream = blob_client.download_blob()
+    except ResourceNotModifiedError:
+        return None, next(iter(client_etags))
+    return download_stream.readall(), download_stream.properties.etag.strip('"')
+
+
+def frame_sas_url(frame_blob_name, content_type='image/jpeg'):
+    """
+    Short-lived read SAS URL for a stored frame, plus the seconds it stays valid.
+
+    Expiry is rounded up to a FRAME_SAS_TTL boundary, so every request in
+    the same window gets an identical URL and the browser's cached copy of
+    the storage response is reused.
+    """
+    now = time.time()
+    expiry_ts = (int(now) // FRAME_SAS_TTL + 2) * FRAME_SAS_TTL
+    url = sas_issuer.sas_url(
+        FRAMES_CONTAINER, frame_blob_name,
+        permission=BlobSasPermissions(read=True),
+        expiry=datetime.utcfromtimestamp(expiry_ts),
+        cache_control=FRAME_CACHE_CONTROL,
+        content_type=content_type
+    )
+    return url, int(expiry_ts - now)
+
+
+def store_frame(frame_blob_name, frame_bytes):
+    """Upload a frame JPEG to the frames container and count it in the frame cache stats"""
+    blob_service_client.get_blob_client(
+        container=FRAMES_CONTAINER, blob=frame_blob_name).upload_blob(frame_bytes, overwrite=True)
+    frame_stats.record_write(frame_blob_name, len(frame_bytes))
+
+
+def read_stored_frame(blob_name, frame_number, variant=None):
+    """Download a cached frame (one ranged read of its pack, else its own blob), or None if not extracted"""
+    if FRAME_PACKS and variant in (None, frame_variants.standard):
+        frame_data = frame_packs.read_frame(blob_name, frame_number)
+        if frame_data is not None:
+            return frame_data
+    try:
+        return blob_service_client.get_blob_client(
+            container=FRAMES_CONTAINER, blob=frame_blob_path(blob_name, frame_number, variant)
+        ).download_blob().readall()
+    except ResourceNotFoundError:
+        return None
+
+
+def get_or_create_frames(blob_name, frame_numbers, variant=None):
+    """
+    Resolve several frames at once: cached frames are read in parallel (one
+    ranged read per pack when frames are packed), and misses are extracted
+    in one ascending decode pass (forward decoding in a
+    single session) and uploaded in parallel. Frames past the end of the
+    video are omitted from the result.
+    """
+    variant = variant or frame_variants.standard
+    names = {n: frame_blob_path(blob_name, n, variant) for n in frame_numbers}
+    results = {n: hot_frames.get(frame_cache_key(blob_name, n, variant)) for n in frame_numbers}
+
+    stored = [n for n, data in results.items() if data is None]
+    if FRAME_PACKS and stored and variant == frame_variants.standard:
+        for n, data in frame_packs.read_frames(blob_name, stored, frame_io_pool).items():
+            results[n] = data
+            hot_frames.put(frame_cache_key(blob_name, n), data)
+        stored = [n for n in stored if results[n] is None]
+    for n, data in zip(stored, frame_io_pool.map(lambda n: read_stored_frame(blob_name, n, variant), stored)):
+        if data is not None:
+            results[n] = data
+            hot_frames.put(frame_cache_key(blob_name, n, variant), data)
+
+    misses = sorted(n for n, data in results.items() if data is None)
+    if misses:
+        logger.info(f"Batch frame cache misses for {blob_name}: {len(misses)}/{len(frame_numbers)}")
+
+    uploads = []
+    for n in misses:
+        frame = decode_frame(blob_name, n)
+        if frame is None:
+            continue
+        frame_bytes = encode_frame(frame, variant)
+        results[n] = frame_bytes
+        hot_frames.put(frame_cache_key(blob_name, n, variant), frame_bytes)
+        uploads.append(frame_io_pool.submit(store_frame, names[n], frame_bytes))
+
+    for upload in uploads:
+        try:
+            upload.result()
+        except Exception as e:
+            logger.error(f"Error saving batch frame for {blob_name}: {e}")
+
+    return {n: data for n, data in results.items() if data is not None}
+
+
+def prefetch_frame(blob_name, frame_number):
+    """Extract a frame into the frames container unless it is already there; True if it was extracted"""
+    key = frame_cache_key(blob_name, frame_number)
+    if key in hot_frames:
+        return False
+
+    if FRAME_PACKS and frame_packs.contains(blob_name, frame_number):
+        return False
+    frame_blob_name = frame_blob_path(blob_name, frame_number)
+    if blob_service_client.get_blob_client(container=FRAMES_CONTAINER, blob=frame_blob_name).exists():
+        return False
+
+    frame = decode_frame(blob_name, frame_number)
+    if frame is None:
+        return False
+    frame_bytes = encode_frame(frame)
+    store_frame(frame_blob_name, frame_bytes)
+    hot_frames.put(key, frame_bytes)
+    logger.info(f"Pre-fetched frame {frame_number}")
+    return True
+
+
+def extract_and_store_frame(blob_name, frame_number, variant=None):
+    """Decode and encode a frame, save it to the frames container and return the image bytes (None past the end)"""
+    frame = decode_frame(blob_name, frame_number)
+    if frame is None:
+        return None
+
+    frame_bytes = encode_frame(frame, variant)
+
+    # Save to blob storage for future use
+    frame_blob_name = frame_blob_path(blob_name, frame_number, variant)
+    store_frame(frame_blob_name, frame_bytes)
+    logger.info(f"Saved frame to blob storage: {frame_blob_name}")
+    return frame_bytes
+
+
+def export_frame(blob_name, frame_number):
+    """Frame JPEG for a dataset export: stored copy, else extracted (bypasses the hot cache)"""
+    return read_stored_frame(blob_name, frame_number) or \
+        extract_and_store_frame(blob_name, frame_number)
+
+
+def list_project_videos(project_name):
+    """Blob names of a project's videos"""
+    return project_catalog.videos(project_name)
+
+
+def load_project_classes(project_name):
+    """A project's class definitions (defaults if none were saved)"""
+    try:
+        class_data = blob_service_client.get_blob_client(
+            container='annotations', blob=class_blob_path(project_name)).download_blob().readall()
+    except ResourceNotFoundError:
+        return DEFAULT_CLASSES
+    return json.loads(class_data).get('classes', DEFAULT_CLASSES)
 
-        # Get original dimensions
-        orig_height, orig_width = frame.shape[:2]
 
-        # Resize if wider than max width
-        if orig_width > FRAME_MAX_WIDTH:
-            scale = FRAME_MAX_WIDTH / orig_width
-            new_width = FRAME_MAX_WIDTH
-            new_height = int(orig_height * scale)
-            frame = cv2.resize(frame, (new_width, new_height),
-                               interpolation=cv2.INTER_AREA)
-            logger.info(
-                f"Resized frame from {orig_width}x{orig_height} to {new_width}x{new_height}")
+def get_or_create_frame(blob_name, frame_number, variant=None):
+    """Get frame from the in-memory cache, blob storage, or extract and save if not exists"""
+    # Generate frame blob name
+    frame_blob_name = frame_blob_path(blob_name, frame_number, variant)
+    key = frame_cache_key(blob_name, frame_number, variant)
+
+    try:
+        # Hot frames are served without touching storage
+        frame_data = hot_frames.get(key)
+        if frame_data is not None:
+            return BytesIO(frame_data)
 
-        cap.release()
+        # One GET: a missing blob raises instead of needing an exists() round trip
+        frame_data = read_stored_frame(blob_name, frame_number, variant)
+        if frame_data is not None:
+            logger.info(f"Frame cache hit: {frame_blob_name}")
+            hot_frames.put(key, frame_data)
+            return BytesIO(frame_data)
 
-        # Encode as JPEG
-        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        frame_bytes = buffer.tobytes()
+        logger.info(f"Frame cache miss: {frame_blob_name}, extracting...")
 
-        # Save to blob storage for future use
-        frame_blob_client.upload_blob(frame_bytes, overwrite=True)
-        logger.info(f"Saved frame to blob storage: {frame_blob_name}")
+        # Frame doesn't exist, extract it
+        frame_bytes = extract_and_store_frame(blob_name, frame_number, variant)
+        if frame_bytes is None:
+            return None
 
+        hot_frames.put(key, frame_bytes)
         return BytesIO(frame_bytes)
 
     except Exception as e:
@@ -159,6 +412,32 @@ STORAGE_ACCOUNT_NAME = os.getenv('AZURE_STORAGE_ACCOUNT_NAME')
 CONTAINER_NAME = 'videos'
 FRAMES_CONTAINER = 'frames'  # Persistent frame cache
 FRAME_MAX_WIDTH = 1280  # Resize to 720p for storage efficiency
+FRAME_JPEG_QUALITY = 85
+# Resolution tiers (?tier=thumbnail|standard|full) and Accept-negotiated formats, each cached separately
+frame_variants = FrameVariants(
+    standard_width=FRAME_MAX_WIDTH,
+    standard_quality=FRAME_JPEG_QUALITY,
+    thumbnail_width=int(os.getenv('FRAME_THUMBNAIL_WIDTH', 320)),
+    formats=[fmt.strip() for fmt in os.getenv('FRAME_FORMATS', 'webp,jpeg').split(',') if fmt.strip()],
+    encodable=encodable_formats()
+)
+# Frame URLs always name the same bytes for a given video version; JSON must be revalidated
+FRAME_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+MAX_BATCH_FRAMES = int(os.getenv('MAX_BATCH_FRAMES', 120))
+
+# Answer stored-frame requests with a 302 to a read SAS instead of proxying the bytes
+FRAME_SAS_REDIRECTS = os.getenv('FRAME_SAS_REDIRECTS', 'false').lower() == 'true'
+FRAME_SAS_TTL = int(os.getenv('FRAME_SAS_TTL', 300))
+
+# Recently served frames, so repeat views cost no storage calls
+hot_frames = FrameCache(max_bytes=int(os.getenv('FRAME_MEMORY_CACHE_BYTES', 256 * 1024 * 1024)))
+
+# Shared pool for parallel frame blob reads/writes
+frame_io_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('FRAME_IO_CONCURRENCY', 16)),
+    thread_name_prefix='frame-io'
+)
 
 # Initialize blob service client with managed identity
 # No connection strings or shared keys needed!
@@ -168,6 +447,151 @@ blob_service_client = BlobServiceClient(
     credential=credential
 )
 
+# One user delegation key shared by every SAS this worker issues
+delegation_keys = DelegationKeyCache(blob_service_client)
+sas_issuer = SasIssuer(STORAGE_ACCOUNT_NAME, delegation_keys)
+MAX_SAS_BATCH = int(os.getenv('MAX_SAS_BATCH', 500))
+
+# Video downloads stream to disk in ranged chunks; peak memory per download is
+# roughly VIDEO_DOWNLOAD_CONCURRENCY * VIDEO_DOWNLOAD_CHUNK_SIZE
+VIDEO_DOWNLOAD_CHUNK_SIZE = int(os.getenv('VIDEO_DOWNLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+video_download_client = BlobServiceClient(
+    account_url=f"https://{STORAGE_ACCOUNT_NAME}.blob.core.windows.net",
+    credential=credential,
+    max_single_get_size=VIDEO_DOWNLOAD_CHUNK_SIZE,
+    max_chunk_get_size=VIDEO_DOWNLOAD_CHUNK_SIZE
+)
+
+# Video cache shared by all gunicorn workers, bounded by a byte budget (LRU)
+video_cache = VideoCache(
+    container_client=video_download_client.get_container_client(CONTAINER_NAME),
+    cache_dir=os.getenv('VIDEO_CACHE_DIR', '/tmp/video-cache'),
+    max_bytes=int(os.getenv('VIDEO_CACHE_MAX_BYTES', 10 * 1024**3)),
+    download_concurrency=int(os.getenv('VIDEO_DOWNLOAD_CONCURRENCY', 4)),
+    on_evict=decoder_pool.close_video
+)
+
+# Range-backed partial copies let /info and the first frames of a faststart
+# video be served without waiting for the whole file to download
+RANGE_READS = os.getenv('RANGE_READS', 'true').lower() == 'true'
+range_sources = RangeVideoSources(
+    container_client=video_download_client.get_container_client(CONTAINER_NAME),
+    video_cache=video_cache,
+    cache_dir=os.path.join(video_cache.cache_dir, 'ranges'),
+    max_bytes=int(os.getenv('RANGE_CACHE_MAX_BYTES', 2 * 1024**3)),
+    download_concurrency=int(os.getenv('VIDEO_DOWNLOAD_CONCURRENCY', 4)),
+    on_close=decoder_pool.close_video
+)
+
+# Video metadata (fps, frame count, keyframes, timestamps) probed once per
+# blob version and kept as a sidecar in the frames container
+video_index = VideoIndexStore(
+    frames_container_client=blob_service_client.get_container_client(FRAMES_CONTAINER),
+    get_etag=lambda blob_name: video_cache.blob_version(blob_name)[0],
+    probe=probe_video
+)
+
+# Project/video catalog: one index blob, updated on upload-complete and
+# deletion and periodically reconciled against the container
+project_catalog = ProjectCatalog(
+    container_client=blob_service_client.get_container_client(CONTAINER_NAME),
+    refresh_interval=float(os.getenv('CATALOG_REFRESH_SECONDS', 5)),
+    reconcile_interval=float(os.getenv('CATALOG_RECONCILE_MINUTES', 60)) * 60
+)
+PROJECTS_PAGE_SIZE = 200
+MAX_PROJECTS_PAGE_SIZE = 1000
+
+# Frame cache counters (per video) and retention jobs: batched deletes,
+# resumable from their status blobs, and least-recently-accessed eviction
+# whenever the cache grows past FRAME_CACHE_MAX_BYTES. Pool children only
+# count; they never start evictions.
+FRAME_CACHE_MAX_BYTES = int(os.getenv('FRAME_CACHE_MAX_BYTES', 0)) \
+    if multiprocessing.parent_process() is None else 0
+frame_stats = FrameStats(
+    container_client=blob_service_client.get_container_client(FRAMES_CONTAINER),
+    flush_delay=float(os.getenv('FRAME_STATS_FLUSH_SECONDS', 10)),
+    on_flush=lambda totals: frame_retention.check_budget(totals)
+)
+frame_retention = FrameRetention(
+    container_client=blob_service_client.get_container_client(FRAMES_CONTAINER),
+    stats=frame_stats,
+    max_bytes=FRAME_CACHE_MAX_BYTES,
+    min_idle=float(os.getenv('FRAME_EVICT_MIN_IDLE_MINUTES', 10)) * 60
+)
+
+# Frame packs: FRAME_PACK_SIZE frames to a blob behind an offset index, so a
+# frame is one ranged read and a window in the same pack is one GET. Reads
+# fall back to per-frame blobs (on-demand extractions and unmigrated videos);
+# `python -m app.frame_packs` folds existing per-frame blobs into packs.
+FRAME_PACKS = os.getenv('FRAME_PACKS', 'false').lower() == 'true'
+frame_packs = FramePackStore(
+    container_client=blob_service_client.get_container_client(FRAMES_CONTAINER),
+    pack_size=int(os.getenv('FRAME_PACK_SIZE', 256))
+)
+
+# Timeline sprite sheets (SPRITE_COLUMNS x SPRITE_ROWS tiles per JPEG, every
+# SPRITE_STRIDE-th frame by default), built in one decode pass per video
+SPRITE_STRIDE = int(os.getenv('SPRITE_STRIDE', 30))
+SPRITES_ON_UPLOAD = os.getenv('SPRITES_ON_UPLOAD', 'true').lower() == 'true'
+SPRITE_RETRY_SECONDS = int(os.getenv('SPRITE_RETRY_SECONDS', 600))  # Before a GET re-runs a failed job
+sprite_sheets = SpriteSheets(
+    container_client=blob_service_client.get_container_client(FRAMES_CONTAINER),
+    get_video_path=get_cached_video,
+    get_video_etag=lambda blob_name: video_cache.blob_version(blob_name)[0],
+    columns=int(os.getenv('SPRITE_COLUMNS', 10)),
+    rows=int(os.getenv('SPRITE_ROWS', 10)),
+    tile_width=int(os.getenv('SPRITE_TILE_WIDTH', 160))
+)
+
+# Frames around the annotator's position, extracted ahead of navigation
+prefetch_scheduler = PrefetchScheduler(
+    prefetch_frame,
+    workers=int(os.getenv('PREFETCH_WORKERS', 2)),
+    window=int(os.getenv('PREFETCH_WINDOW', 30))
+)
+
+# Annotations: per-video documents sharded by frame range plus an append-only
+# patch log, compacted into the shards every ANNOTATION_COMPACT_AFTER patches
+annotation_store = AnnotationStore(
+    blob_service_client.get_container_client('annotations'),
+    compact_after=int(os.getenv('ANNOTATION_COMPACT_AFTER', 200)),
+    shard_size=int(os.getenv('ANNOTATION_SHARD_SIZE', 1000)),
+    binary_shards=os.getenv('ANNOTATION_SHARD_FORMAT', 'json').lower() == 'binary'
+)
+
+# YOLO dataset exports of whole projects, streamed or written to the exports container
+EXPORTS_CONTAINER = 'exports'
+dataset_exporter = DatasetExporter(
+    list_videos=list_project_videos,
+    load_columns=annotation_store.load_columns,
+    load_classes=load_project_classes,
+    read_frame=export_frame,
+    exports_container_client=blob_service_client.get_container_client(EXPORTS_CONTAINER),
+    sign_url=lambda blob_name: sas_issuer.sas_url(
+        EXPORTS_CONTAINER, blob_name,
+        permission=BlobSasPermissions(read=True),
+        expiry=datetime.utcnow() + timedelta(hours=24)
+    ),
+    io_pool=frame_io_pool,
+    image_lookahead=int(os.getenv('EXPORT_IMAGE_LOOKAHEAD', 32))
+)
+# Sync gunicorn workers are killed after --timeout, truncating a long streamed archive,
+# so by default only uvicorn workers (SERVER_MODE=asgi) stream; the GET becomes a background job
+STREAM_EXPORTS = os.getenv('STREAM_EXPORTS', str(os.getenv('SERVER_MODE') == 'asgi')).lower() == 'true'
+
+# Bulk frame pre-extraction, triggered when an upload completes
+PREEXTRACT_FRAMES = os.getenv('PREEXTRACT_FRAMES', 'true').lower() == 'true'
+frame_ingestor = FrameIngestor(
+    frames_container_client=blob_service_client.get_container_client(FRAMES_CONTAINER),
+    get_video_path=get_cached_video,
+    encode_frame=encode_frame,
+    frame_blob_name=frame_blob_path,
+    encode_workers=int(os.getenv('INGEST_ENCODE_WORKERS', os.cpu_count() or 2)),
+    upload_concurrency=int(os.getenv('INGEST_UPLOAD_CONCURRENCY', 16)),
+    on_frame_stored=frame_stats.record_write,
+    pack_store=frame_packs if FRAME_PACKS else None
+)
+
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -175,6 +599,24 @@ def health():
     return jsonify({"status": "healthy", "service": "annotation-api"}), 200
 
 
+def issue_upload_url(project_name, file_name):
+    """Write SAS for a new video under raw-videos/{project-name}/{timestamp}_{filename}"""
+    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+    blob_name = f"raw-videos/{project_name}/{timestamp}_{file_name}"
+
+    sas_url = sas_issuer.sas_url(
+        CONTAINER_NAME, blob_name,
+        permission=BlobSasPermissions(write=True, create=True),
+        expiry=datetime.utcnow() + timedelta(hours=1)
+    )
+
+    return {
+        "sasUrl": sas_url,
+        "blobUrl": sas_issuer.blob_url(CONTAINER_NAME, blob_name),
+        "blobName": blob_name
+    }
+
+
 @app.route('/api/get-upload-url', methods=['POST'])
 def get_upload_url():
     """Generate SAS URL for direct blob upload using user delegation key"""
@@ -186,47 +628,39 @@ def get_upload_url():
         if not project_name or not file_name:
             return jsonify({"error": "Missing projectName or fileName"}), 400
 
-        # Create blob path: raw-videos/{project-name}/{timestamp}_{filename}
-        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-        blob_name = f"raw-videos/{project_name}/{timestamp}_{file_name}"
+        upload = issue_upload_url(project_name, file_name)
+        blob_name = upload["blobName"]
 
-        # Get blob client
-        blob_client = blob_service_client.get_blob_client(
-            container=CONTAINER_NAME, blob=blob_name)
+        logger.info(f"Generated SAS URL for: {blob_name}")
 
-        # Generate user delegation key (valid for Azure AD authentication)
-        # Get user delegation key
-        start_time = datetime.utcnow()
-        expiry_time = start_time + timedelta(hours=1)
+        return jsonify(upload), 200
 
-        user_delegation_key = blob_service_client.get_user_delegation_key(
-            key_start_time=start_time,
-            key_expiry_time=expiry_time
-        )
+    except Exception as e:
+        logger.error(f"Error generating SAS URL: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Generate SAS token with user delegation key
-        sas_token = generate_blob_sas(
-            account_name=STORAGE_ACCOUNT_NAME,
-            container_name=CONTAINER_NAME,
-            blob_name=blob_name,
-            user_delegation_key=user_delegation_key,
-            permission=BlobSasPermissions(write=True, create=True),
-            expiry=expiry_time
-        )
 
-        sas_url = f"https://{STORAGE_ACCOUNT_NAME}.blob.core.windows.net/{CONTAINER_NAME}/{blob_name}?{sas_token}"
-        blob_url = f"https://{STORAGE_ACCOUNT_NAME}.blob.core.windows.net/{CONTAINER_NAME}/{blob_name}"
+@app.route('/api/get-upload-urls', methods=['POST'])
+def get_upload_urls():
+    """Generate upload SAS URLs for many files in one call (bulk uploads)"""
+    try:
+        data = request.json
+        project_name = data.get('projectName', '').strip()
+        file_names = data.get('fileNames', [])
+
+        if not project_name or not file_names:
+            return jsonify({"error": "Missing projectName or fileNames"}), 400
+        if len(file_names) > MAX_SAS_BATCH:
+            return jsonify({"error": f"At most {MAX_SAS_BATCH} files per request"}), 400
 
-        logger.info(f"Generated SAS URL for: {blob_name}")
+        uploads = [{"fileName": file_name, **issue_upload_url(project_name, file_name)}
+                   for file_name in file_names]
 
-        return jsonify({
-            "sasUrl": sas_url,
-            "blobUrl": blob_url,
-            "blobName": blob_name
-        }), 200
+        logger.info(f"Generated {len(uploads)} SAS URLs for project {project_name}")
+        return jsonify({"uploads": uploads}), 200
 
     except Exception as e:
-        logger.error(f"Error generating SAS URL: {str(e)}")
+        logger.error(f"Error generating SAS URLs: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
@@ -238,19 +672,37 @@ def upload_complete():
         project_name = data.get('projectName')
         file_name = data.get('fileName')
         blob_url = data.get('blobUrl')
+        blob_name = data.get('blobName')
+
+        # Older clients only send the blob URL
+        container_prefix = f"/{CONTAINER_NAME}/"
+        if not blob_name and blob_url and container_prefix in blob_url:
+            blob_name = unquote(blob_url.split(container_prefix, 1)[1].split('?')[0])
 
         logger.info(f"Upload completed: {project_name} - {file_name}")
 
-        # Here you could:
-        # - Update database with upload metadata
-        # - Trigger video processing pipeline
-        # - Send notifications
+        if blob_name:
+            try:
+                project_catalog.put(blob_service_client.get_blob_client(
+                    container=CONTAINER_NAME, blob=blob_name).get_blob_properties())
+            except ResourceNotFoundError:
+                return jsonify({"error": "Uploaded video not found"}), 404
+
+        ingest_status = None
+        if PREEXTRACT_FRAMES and blob_name:
+            ingest_status = frame_ingestor.submit(blob_name).to_dict()
+        sprites_status = None
+        if SPRITES_ON_UPLOAD and blob_name:
+            sprites_status = sprite_sheets.submit(blob_name, SPRITE_STRIDE).to_dict()
 
         return jsonify({
             "status": "success",
             "message": "Upload registered successfully",
             "projectName": project_name,
-            "fileName": file_name
+            "fileName": file_name,
+            "blobName": blob_name,
+            "ingest": ingest_status,
+            "sprites": sprites_status
         }), 200
 
     except Exception as e:
@@ -258,99 +710,99 @@ def upload_complete():
         return jsonify({"error": str(e)}), 500
 
 
+def projects_page(args):
+    """Project catalog query for /api/projects args, paginated if limit or cursor is given; ValueError if invalid"""
+    paginated = 'limit' in args or 'cursor' in args
+    limit = int(args.get('limit', PROJECTS_PAGE_SIZE)) if paginated else None
+    if paginated and not 0 < limit <= MAX_PROJECTS_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PROJECTS_PAGE_SIZE}")
+    page = project_catalog.query(
+        project=args.get('project') or None,
+        search=args.get('search') or None,
+        limit=limit,
+        cursor=args.get('cursor') or None
+    )
+    if paginated:
+        return page
+    # Unpaginated requests keep the original response shape for existing clients
+    return {"projects": [{"name": entry['name'], "videos": entry['videos']} for entry in page['projects']]}
+
+
 @app.route('/api/projects', methods=['GET'])
 def list_projects():
-    """List all projects (video folders)"""
+    """List projects and their videos from the catalog (paginated with limit/cursor, optionally filtered)"""
     try:
-        container_client = blob_service_client.get_container_client(
-            CONTAINER_NAME)
+        try:
+            page = projects_page(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # List all blobs with prefix 'raw-videos/'
-        blobs = container_client.list_blobs(name_starts_with='raw-videos/')
-
-        projects = {}
-        for blob in blobs:
-            # Extract project name from path
-            parts = blob.name.split('/')
-            if len(parts) >= 2:
-                project_name = parts[1]
-                if project_name not in projects:
-                    projects[project_name] = []
-
-                projects[project_name].append({
-                    'fileName': parts[-1],
-                    'blobName': blob.name,
-                    'size': blob.size,
-                    'lastModified': blob.last_modified.isoformat()
-                })
-
-        return jsonify({
-            "projects": [
-                {"name": name, "videos": videos}
-                for name, videos in projects.items()
-            ]
-        }), 200
+        return jsonify(page), 200
 
     except Exception as e:
         logger.error(f"Error listing projects: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/catalog/reconcile', methods=['POST'])
+def reconcile_catalog():
+    """Rebuild the project catalog from a full listing of the videos container"""
+    try:
+        return jsonify(project_catalog.reconcile()), 200
+
+    except Exception as e:
+        logger.error(f"Error reconciling project catalog: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def video_read_url(blob_name):
+    """Read-only SAS URL (2 hours) for video playback, signed with the shared user delegation key"""
+    return sas_issuer.sas_url(
+        CONTAINER_NAME, blob_name,
+        permission=BlobSasPermissions(read=True),
+        expiry=datetime.utcnow() + timedelta(hours=2)
+    )
+
+
 @app.route('/api/videos/<path:blob_name>', methods=['GET'])
 def get_video_url(blob_name):
     """Get temporary URL for video viewing"""
     try:
-        # Get user delegation key
-        start_time = datetime.utcnow()
-        expiry_time = start_time + timedelta(hours=2)
+        video_url = video_read_url(blob_name)
 
-        user_delegation_key = blob_service_client.get_user_delegation_key(
-            key_start_time=start_time,
-            key_expiry_time=expiry_time
-        )
+        return jsonify({"videoUrl": video_url}), 200
 
-        # Generate read-only SAS token with user delegation
-        sas_token = generate_blob_sas(
-            account_name=STORAGE_ACCOUNT_NAME,
-            container_name=CONTAINER_NAME,
-            blob_name=blob_name,
-            user_delegation_key=user_delegation_key,
-            permission=BlobSasPermissions(read=True),
-            expiry=expiry_time
-        )
+    except Exception as e:
+        logger.error(f"Error generating video URL: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        video_url = f"https://{STORAGE_ACCOUNT_NAME}.blob.core.windows.net/{CONTAINER_NAME}/{blob_name}?{sas_token}"
 
-        return jsonify({"videoUrl": video_url}), 200
+@app.route('/api/videos/<path:blob_name>', methods=['DELETE'])
+def delete_video(blob_name):
+    """Delete a video and remove it from the project catalog (frames and annotations are kept)"""
+    try:
+        try:
+            blob_service_client.get_blob_client(
+                container=CONTAINER_NAME, blob=blob_name).delete_blob(delete_snapshots='include')
+        except ResourceNotFoundError:
+            return jsonify({"error": "Video not found"}), 404
+
+        project_catalog.remove(blob_name)
+        video_index.invalidate(blob_name)
+        logger.info(f"Deleted video {blob_name}")
+
+        return jsonify({"status": "deleted", "blobName": blob_name}), 200
 
     except Exception as e:
-        logger.error(f"Error generating video URL: {str(e)}")
+        logger.error(f"Error deleting video: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/api/videos/<path:blob_name>/info', methods=['GET'])
 def get_video_info(blob_name):
-    """Get video metadata (duration, fps, frame count) - uses caching"""
+    """Get video metadata (duration, fps, frame count) from the metadata index"""
     try:
-        # Get cached video path
-        temp_path = get_cached_video(blob_name)
-
-        # Get video info with OpenCV
-        cap = cv2.VideoCapture(temp_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        duration = frame_count / fps if fps > 0 else 0
-        cap.release()
-
-        return jsonify({
-            "fps": fps,
-            "frameCount": frame_count,
-            "duration": duration,
-            "width": width,
-            "height": height
-        }), 200
+        return jsonify(video_index.get(blob_name).info()), 200
 
     except Exception as e:
         logger.error(f"Error getting video info: {str(e)}")
@@ -359,24 +811,199 @@ def get_video_info(blob_name):
 
 @app.route('/api/videos/<path:blob_name>/frame/<int:frame_number>', methods=['GET'])
 def get_video_frame(blob_name, frame_number):
-    """Get frame (from blob storage cache or extract on-demand)"""
+    """Get frame (from blob storage cache or extract on-demand), as ?tier= and the Accept header ask"""
     try:
-        frame_data = get_or_create_frame(blob_name, frame_number)
+        try:
+            variant = request_variant()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        frame_stats.touch(blob_name)
+        etag = frame_etag(blob_name, frame_number, *variant_etag_params(variant))
+        cached = not_modified(etag, FRAME_CACHE_CONTROL, vary='Accept')
+        if cached is not None:
+            return cached
+
+        if FRAME_SAS_REDIRECTS and frame_cache_key(blob_name, frame_number, variant) not in hot_frames \
+                and not (FRAME_PACKS and variant == frame_variants.standard
+                         and frame_packs.contains(blob_name, frame_number)):
+            # Stored frames are fetched by the browser straight from storage (packed ones are served here)
+            frame_blob_name = frame_blob_path(blob_name, frame_number, variant)
+            if blob_service_client.get_blob_client(
+                    container=FRAMES_CONTAINER, blob=frame_blob_name).exists():
+                url, valid_for = frame_sas_url(frame_blob_name, variant.mimetype)
+                response = redirect(url, code=302)
+                # Let the browser reuse the redirect while the SAS is still valid
+                response.headers['Cache-Control'] = f"private, max-age={max(valid_for - 60, 0)}"
+                response.headers['Vary'] = 'Accept'
+                return response
+
+        frame_data = get_or_create_frame(blob_name, frame_number, variant)
 
         if frame_data is None:
             return jsonify({"error": "Could not read frame"}), 404
 
-        return send_file(
+        return with_cache_headers(send_file(
             frame_data,
-            mimetype='image/jpeg',
+            mimetype=variant.mimetype,
             as_attachment=False
-        )
+        ), etag, FRAME_CACHE_CONTROL, vary='Accept')
 
     except Exception as e:
         logger.error(f"Error getting frame: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/videos/<path:blob_name>/frames', methods=['GET'])
+def get_video_frames(blob_name):
+    """Get a range of frames in one multipart/form-data response (one part per frame)"""
+    try:
+        start = request.args.get('start', 0, type=int)
+        count = request.args.get('count', 10, type=int)
+        stride = request.args.get('stride', 1, type=int)
+
+        if start < 0 or count < 1 or stride < 1:
+            return jsonify({"error": "start must be >= 0, count and stride >= 1"}), 400
+        try:
+            variant = request_variant()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        count = min(count, MAX_BATCH_FRAMES)
+        frame_stats.touch(blob_name)
+
+        etag = frame_etag(blob_name, 'batch', start, count, stride, *variant_etag_params(variant))
+        cached = not_modified(etag, FRAME_CACHE_CONTROL, vary='Accept')
+        if cached is not None:
+            return cached
+
+        frame_numbers = [start + i * stride for i in range(count)]
+        index = get_video_index(blob_name)
+        if index is not None and index.frame_count > 0:
+            frame_numbers = [n for n in frame_numbers if n < index.frame_count]
+        frames = get_or_create_frames(blob_name, frame_numbers, variant)
+
+        boundary = uuid.uuid4().hex
+        parts = []
+        for n in sorted(frames):
+            parts.append(
+                f"--{boundary}\r\n"
+                f"Content-Disposition: form-data; name=\"{n}\"; filename=\"frame_{n:06d}.{variant.extension}\"\r\n"
+                f"Content-Type: {variant.mimetype}\r\n\r\n".encode())
+            parts.append(frames[n])
+            parts.append(b"\r\n")
+        parts.append(f"--{boundary}--\r\n".encode())
+
+        return with_cache_headers(Response(
+            b"".join(parts),
+            mimetype=f"multipart/form-data; boundary={boundary}"
+        ), etag, FRAME_CACHE_CONTROL, vary='Accept')
+
+    except Exception as e:
+        logger.error(f"Error getting frames: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/videos/<path:blob_name>/ingest', methods=['GET'])
+def get_ingest_status(blob_name):
+    """Get progress of bulk frame pre-extraction for a video"""
+    try:
+        status = frame_ingestor.get_status(blob_name)
+        if status is None:
+            return jsonify({"blobName": blob_name, "status": "not_started"}), 404
+        return jsonify(status), 200
+
+    except Exception as e:
+        logger.error(f"Error getting ingest status: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/videos/<path:blob_name>/ingest', methods=['POST'])
+def start_ingest(blob_name):
+    """Start (or re-run) bulk frame pre-extraction for a video"""
+    try:
+        job = frame_ingestor.submit(blob_name)
+        return jsonify(job.to_dict()), 202
+
+    except Exception as e:
+        logger.error(f"Error starting ingest: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+def sprite_version(blob_name, stride):
+    """Version of a video's sprite set: changes with the video and the sheet layout"""
+    return frame_etag(blob_name, 'sprites', stride, sprite_sheets.tile_width,
+                      sprite_sheets.columns, sprite_sheets.rows)
+
+
+@app.route('/api/videos/<path:blob_name>/sprites', methods=['GET'])
+def get_sprite_index(blob_name):
+    """Sprite sheet index for timeline scrubbing; queues generation (202) if the sheets are not built yet"""
+    try:
+        stride = request.args.get('stride', SPRITE_STRIDE, type=int)
+        if stride < 1:
+            return jsonify({"error": "stride must be >= 1"}), 400
+
+        index = sprite_sheets.load_index(blob_name, stride)
+        if index is None:
+            status = sprite_sheets.get_status(blob_name, stride)
+            # A failed job is only re-run after a backoff (or by POST), not on every poll
+            if status is None or status['status'] in ('completed', 'interrupted') or (
+                    status['status'] == 'failed'
+                    and time.time() - (status['finishedAt'] or 0) > SPRITE_RETRY_SECONDS):
+                status = sprite_sheets.submit(blob_name, stride).to_dict()
+            return jsonify(status), 202
+
+        version = sprite_version(blob_name, stride)
+        cached = not_modified(version, REVALIDATE_CACHE_CONTROL)
+        if cached is not None:
+            return cached
+        for sheet in index['sheets']:
+            # Versioned URLs, so sheets can be cached as immutable
+            sheet['url'] = f"/api/videos/{blob_name}/sprites/{stride}/{sheet['sheet']}?v={version}"
+        return with_cache_headers(jsonify(index), version, REVALIDATE_CACHE_CONTROL)
+
+    except Exception as e:
+        logger.error(f"Error getting sprite sheets: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/videos/<path:blob_name>/sprites', methods=['POST'])
+def start_sprites(blob_name):
+    """Start (or re-run) sprite sheet generation for a video"""
+    try:
+        stride = request.args.get('stride', SPRITE_STRIDE, type=int)
+        if stride < 1:
+            return jsonify({"error": "stride must be >= 1"}), 400
+        job = sprite_sheets.submit(blob_name, stride)
+        return jsonify(job.to_dict()), 202
+
+    except Exception as e:
+        logger.error(f"Error starting sprite sheets: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/videos/<path:blob_name>/sprites/<int:stride>/<int:sheet>', methods=['GET'])
+def get_sprite_sheet(blob_name, stride, sheet):
+    """One sprite sheet image (JPEG); immutable when requested with the current ?v= version"""
+    try:
+        etag = frame_etag(blob_name, 'sprite', stride, sheet, sprite_sheets.tile_width,
+                          sprite_sheets.columns, sprite_sheets.rows)
+        cache_control = FRAME_CACHE_CONTROL if request.args.get('v') == sprite_version(blob_name, stride) \
+            else REVALIDATE_CACHE_CONTROL
+        cached = not_modified(etag, cache_control)
+        if cached is not None:
+            return cached
+
+        data = sprite_sheets.read_sheet(blob_name, stride, sheet)
+        if data is None:
+            return jsonify({"error": "Sprite sheet not found"}), 404
+        return with_cache_headers(Response(data, mimetype='image/jpeg'), etag, cache_control)
+
+    except Exception as e:
+        logger.error(f"Error getting sprite sheet: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/videos/<path:blob_name>/prefetch', methods=['POST'])
 def prefetch_frames(blob_name):
     """Pre-fetch multiple frames in background (non-blocking)"""
@@ -401,29 +1028,12 @@ def prefetch_frames(blob_name):
             if prev_frame >= 0:
                 frames_to_fetch.append(prev_frame)
 
-        # Start background thread to prefetch
-        def prefetch_worker():
-            for frame_num in frames_to_fetch:
-                try:
-                    # Check if frame already exists
-                    frame_blob_name = f"{blob_name}/frame_{frame_num:06d}.jpg"
-                    frame_blob_client = blob_service_client.get_blob_client(
-                        container=FRAMES_CONTAINER, blob=frame_blob_name)
-
-                    if not frame_blob_client.exists():
-                        # Extract and save frame
-                        get_or_create_frame(blob_name, frame_num)
-                        logger.info(f"Pre-fetched frame {frame_num}")
-                except Exception as e:
-                    logger.error(f"Error prefetching frame {frame_num}: {e}")
-
-        # Run prefetch in background thread
-        thread = threading.Thread(target=prefetch_worker, daemon=True)
-        thread.start()
+        # Queue on the shared scheduler (deduplicated, stale work dropped)
+        queued = prefetch_scheduler.schedule(blob_name, current_frame, frames_to_fetch)
 
         return jsonify({
             "status": "prefetching",
-            "frames": frames_to_fetch
+            "frames": queued
         }), 200
 
     except Exception as e:
@@ -431,26 +1041,89 @@ def prefetch_frames(blob_name):
         return jsonify({"error": str(e)}), 500
 
 
+def project_from_blob(blob_name):
+    """Project name from a video blob path (raw-videos/project1/video.mp4 -> project1), or None"""
+    parts = blob_name.split('/')
+    return parts[1] if len(parts) >= 2 else None
+
+
+DEFAULT_CLASSES = [
+    {"id": 0, "name": "Person", "color": "#ff0000"},
+    {"id": 1, "name": "Vehicle", "color": "#00ff00"},
+    {"id": 2, "name": "Object", "color": "#0000ff"}
+]
+
+
+def class_blob_path(project_name):
+    """Name of a project's class definitions in the annotations container"""
+    return f"projects/{project_name}/classes.json"
+
+
+def frame_range_args(args):
+    """(from, to) frame numbers of a range query (inclusive, either may be None); ValueError if invalid"""
+    first = int(args['from']) if args.get('from') else None
+    last = int(args['to']) if args.get('to') else None
+    if (first is not None and first < 0) or (last is not None and last < (first or 0)):
+        raise ValueError("from must be >= 0 and to >= from")
+    return first, last
+
+
+def requested_version(etags):
+    """The single version named by an If-Match/If-None-Match header, or None"""
+    tags = etags.as_set(include_weak=True)
+    return next(iter(tags)) if len(tags) == 1 and '*' not in tags else None
+
+
+def update_project_classes(blob_name, classes):
+    """Save a video's classes as its project's class definitions"""
+    project_name = project_from_blob(blob_name)
+    if classes and project_name:
+        class_blob_client = blob_service_client.get_blob_client(
+            container='annotations', blob=class_blob_path(project_name))
+
+        class_data = json.dumps({"classes": classes}, indent=2)
+        class_blob_client.upload_blob(class_data, overwrite=True)
+        logger.info(f"Updated project classes for {project_name}")
+
+
+def patch_video_annotations(blob_name, data, if_match=None):
+    """Append a patch ({"ops": [...], plus optional classes/video size}) and return the new version"""
+    ops = validate_ops(data.get('ops', []))
+    meta = {field: data[field] for field in META_FIELDS if field in data}
+    if meta:
+        ops = ops + [{"op": "meta", **meta}]
+    if not ops:
+        raise ValueError("Nothing to patch")
+
+    version = annotation_store.patch(blob_name, ops, if_match=if_match)
+    update_project_classes(blob_name, meta.get('classes'))
+    return version
+
+
+def replace_video_annotations(blob_name, annotations):
+    """Overwrite a video's annotations with a full document and return the new version"""
+    version = annotation_store.replace(blob_name, annotations)
+    update_project_classes(blob_name, annotations.get('classes', []))
+    return version
+
+
 @app.route('/api/annotations/<path:blob_name>', methods=['GET'])
 def get_annotations(blob_name):
-    """Load annotations for a video"""
+    """Load annotations for a video, optionally only frames ?from=..&to=.. (inclusive)"""
     try:
-        annotation_blob_name = f"{blob_name}.json"
-        annotation_container = 'annotations'
+        try:
+            first, last = frame_range_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        blob_client = blob_service_client.get_blob_client(
-            container=annotation_container,
-            blob=annotation_blob_name
-        )
-
-        if not blob_client.exists():
-            return jsonify({"frames": {}}), 200
-
-        download_stream = blob_client.download_blob()
-        annotations = json.loads(download_stream.readall())
+        version = requested_version(request.if_none_match)
+        if version and annotation_store.is_current(blob_name, version):
+            return not_modified(version, REVALIDATE_CACHE_CONTROL)
 
+        annotations, version = annotation_store.load(blob_name, first, last)
         logger.info(f"Loaded annotations for: {blob_name}")
-        return jsonify(annotations), 200
+        return with_cache_headers(
+            jsonify(annotations or {"frames": {}}), version, REVALIDATE_CACHE_CONTROL)
 
     except Exception as e:
         logger.error(f"Error loading annotations: {str(e)}")
@@ -459,45 +1132,37 @@ def get_annotations(blob_name):
 
 @app.route('/api/annotations/<path:blob_name>', methods=['POST'])
 def save_annotations(blob_name):
-    """Save annotations for a video and update project classes"""
+    """Save a full annotations document for a video and update project classes"""
     try:
-        annotations = request.json
-
-        # Save annotations as {blob_name}.json in 'annotations' container
-        annotation_blob_name = f"{blob_name}.json"
-        annotation_container = 'annotations'
-
-        blob_client = blob_service_client.get_blob_client(
-            container=annotation_container,
-            blob=annotation_blob_name
-        )
+        version = replace_video_annotations(blob_name, request.json)
+        logger.info(f"Saved annotations for: {blob_name}")
 
-        blob_client.upload_blob(
-            json.dumps(annotations, indent=2),
-            overwrite=True
-        )
+        response = jsonify({"status": "success", "message": "Annotations saved", "version": version})
+        response.set_etag(version)
+        return response, 200
 
-        logger.info(f"Saved annotations for: {blob_name}")
+    except Exception as e:
+        logger.error(f"Error saving annotations: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        # Also save classes to project level
-        classes = annotations.get('classes', [])
-        if classes:
-            # Extract project name from blob_name (e.g., raw-videos/project1/video.mp4 -> project1)
-            parts = blob_name.split('/')
-            if len(parts) >= 2:
-                project_name = parts[1]
-                class_blob_name = f"projects/{project_name}/classes.json"
-                class_blob_client = blob_service_client.get_blob_client(
-                    container='annotations', blob=class_blob_name)
 
-                class_data = json.dumps({"classes": classes}, indent=2)
-                class_blob_client.upload_blob(class_data, overwrite=True)
-                logger.info(f"Updated project classes for {project_name}")
+@app.route('/api/annotations/<path:blob_name>', methods=['PATCH'])
+def patch_annotations(blob_name):
+    """Apply incremental edits to a video's annotations (If-Match: version guards against lost updates)"""
+    try:
+        version = patch_video_annotations(
+            blob_name, request.json or {}, if_match=requested_version(request.if_match))
 
-        return jsonify({"status": "success", "message": "Annotations saved"}), 200
+        response = jsonify({"status": "success", "version": version})
+        response.set_etag(version)
+        return response, 200
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except VersionConflict as e:
+        return jsonify({"error": str(e)}), 412
     except Exception as e:
-        logger.error(f"Error saving annotations: {str(e)}")
+        logger.error(f"Error patching annotations: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
@@ -505,21 +1170,21 @@ def save_annotations(blob_name):
 def get_project_classes(project_name):
     """Get class definitions for a project"""
     try:
-        class_blob_name = f"projects/{project_name}/classes.json"
         class_blob_client = blob_service_client.get_blob_client(
-            container='annotations', blob=class_blob_name)
-
-        if class_blob_client.exists():
-            class_data = class_blob_client.download_blob().readall()
-            return jsonify(json.loads(class_data)), 200
+            container='annotations', blob=class_blob_path(project_name))
+
+        try:
+            class_data, etag = download_if_modified(class_blob_client)
+        except ResourceNotFoundError:
+            class_data, etag = None, None
+
+        if etag is not None:
+            if class_data is None:
+                return not_modified(etag, REVALIDATE_CACHE_CONTROL)
+            return with_cache_headers(
+                Response(class_data, mimetype='application/json'), etag, REVALIDATE_CACHE_CONTROL)
         else:
-            # Return default classes
-            default_classes = [
-                {"id": 0, "name": "Person", "color": "#ff0000"},
-                {"id": 1, "name": "Vehicle", "color": "#00ff00"},
-                {"id": 2, "name": "Object", "color": "#0000ff"}
-            ]
-            return jsonify({"classes": default_classes}), 200
+            return jsonify({"classes": DEFAULT_CLASSES}), 200
 
     except Exception as e:
         logger.error(f"Error getting project classes: {str(e)}")
@@ -533,9 +1198,8 @@ def save_project_classes(project_name):
         data = request.json
         classes = data.get('classes', [])
 
-        class_blob_name = f"projects/{project_name}/classes.json"
         class_blob_client = blob_service_client.get_blob_client(
-            container='annotations', blob=class_blob_name)
+            container='annotations', blob=class_blob_path(project_name))
 
         class_data = json.dumps({"classes": classes}, indent=2)
         class_blob_client.upload_blob(class_data, overwrite=True)
@@ -548,63 +1212,188 @@ def save_project_classes(project_name):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/frames/cleanup', methods=['POST'])
-def cleanup_frames():
-    """Clean up cached frames older than specified days (default 30)"""
+def export_options(options):
+    """(archive format, include images) from export request options; ValueError if invalid"""
+    archive = options.get('format', 'tar')
+    if archive not in ARCHIVE_TYPES:
+        raise ValueError(f"format must be one of {', '.join(ARCHIVE_TYPES)}")
+    images = str(options.get('images', 'true')).lower() not in ('false', '0', 'no')
+    return archive, images
+
+
+@app.route('/api/projects/<project_name>/export', methods=['GET'])
+def export_project(project_name):
+    """Stream a project's annotations (and frames) as a YOLO dataset archive, or start a background export"""
+    try:
+        archive, images = export_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        if not STREAM_EXPORTS:
+            job = dataset_exporter.submit(project_name, archive, images)
+            resp = jsonify(job.to_dict())
+            resp.headers['Location'] = f"/api/projects/{project_name}/exports/{job.export_id}"
+            return resp, 202
+
+        logger.info(f"Streaming {archive} dataset export of {project_name} (images: {images})")
+        return Response(
+            dataset_exporter.stream(project_name, archive, images),
+            mimetype=ARCHIVE_TYPES[archive],
+            headers={'Content-Disposition': f'attachment; filename="{project_name}_yolo.{archive}"'}
+        )
+
+    except Exception as e:
+        logger.error(f"Error exporting project: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/projects/<project_name>/export', methods=['POST'])
+def start_project_export(project_name):
+    """Export a project's YOLO dataset to the exports container in the background"""
     try:
-        days = request.json.get('days', 30) if request.json else 30
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        archive, images = export_options(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        frames_container_client = blob_service_client.get_container_client(
-            FRAMES_CONTAINER)
+    try:
+        job = dataset_exporter.submit(project_name, archive, images)
+        return jsonify(job.to_dict()), 202
+
+    except Exception as e:
+        logger.error(f"Error starting project export: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        deleted_count = 0
-        deleted_size = 0
 
-        # List all blobs in frames container
-        blobs = frames_container_client.list_blobs()
+@app.route('/api/projects/<project_name>/exports/<export_id>', methods=['GET'])
+def get_project_export(project_name, export_id):
+    """Get progress (and, when done, a download URL) of a background project export"""
+    try:
+        status = dataset_exporter.get_status(project_name, export_id)
+        if status is None:
+            return jsonify({"error": "Export not found"}), 404
+        return jsonify(status), 200
 
-        for blob in blobs:
-            if blob.last_modified < cutoff_date:
-                blob_client = frames_container_client.get_blob_client(
-                    blob.name)
-                deleted_size += blob.size
-                blob_client.delete_blob()
-                deleted_count += 1
+    except Exception as e:
+        logger.error(f"Error getting export status: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        logger.info(
-            f"Cleaned up {deleted_count} frames ({deleted_size / (1024*1024):.2f} MB)")
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Get statistics about the local video and frame caches, open decoders and prefetch queue"""
+    try:
         return jsonify({
-            "deleted_count": deleted_count,
-            "deleted_size_mb": round(deleted_size / (1024*1024), 2),
-            "cutoff_days": days
+            "videoCache": video_cache.stats(),
+            "frameMemoryCache": hot_frames.stats(),
+            "decoders": decoder_pool.stats(),
+            "frameProcesses": frame_processes.stats(),
+            "prefetch": prefetch_scheduler.stats(),
+            "delegationKey": delegation_keys.stats(),
+            "catalog": project_catalog.stats()
         }), 200
 
     except Exception as e:
-        logger.error(f"Error cleaning up frames: {str(e)}")
+        logger.error(f"Error getting cache stats: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/frames/stats', methods=['GET'])
-def frame_stats():
-    """Get statistics about cached frames"""
+@app.route('/api/frames/cleanup', methods=['POST'])
+def cleanup_frames():
+    """Start a background cleanup of one video's cached frames and/or frames older than some days"""
     try:
-        frames_container_client = blob_service_client.get_container_client(
-            FRAMES_CONTAINER)
+        data = request.get_json(silent=True) or {}
+        video = data.get('video') or None
+        days = data.get('days', None if video else 30)
+
+        try:
+            job = frame_retention.submit_cleanup(video=video, older_than_days=float(days) if days is not None else None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        total_count = 0
-        total_size = 0
+        return jsonify(job.to_dict()), 202
 
-        blobs = frames_container_client.list_blobs()
-        for blob in blobs:
-            total_count += 1
-            total_size += blob.size
+    except Exception as e:
+        logger.error(f"Error starting frame cleanup: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/frames/evict', methods=['POST'])
+def evict_frames():
+    """Start evicting least recently accessed videos' frames until the cache fits a byte budget"""
+    try:
+        data = request.get_json(silent=True) or {}
+        max_bytes = int(data.get('maxBytes', FRAME_CACHE_MAX_BYTES))
+        if max_bytes <= 0:
+            return jsonify({"error": "maxBytes must be positive (or set FRAME_CACHE_MAX_BYTES)"}), 400
+
+        return jsonify(frame_retention.submit_evict(max_bytes).to_dict()), 202
+
+    except Exception as e:
+        logger.error(f"Error starting frame eviction: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/frames/recount', methods=['POST'])
+def recount_frames():
+    """Rebuild the frame cache counters from a full listing (background)"""
+    try:
+        return jsonify(frame_retention.submit_recount().to_dict()), 202
+
+    except Exception as e:
+        logger.error(f"Error starting frame recount: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/frames/jobs/<job_id>', methods=['GET'])
+def get_frame_job(job_id):
+    """Get progress of a frame cleanup, eviction or recount"""
+    try:
+        status = frame_retention.get_status(job_id)
+        if status is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(status), 200
+
+    except Exception as e:
+        logger.error(f"Error getting frame job status: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/frames/jobs/<job_id>/resume', methods=['POST'])
+def resume_frame_job(job_id):
+    """Continue an interrupted or failed frame job from where it stopped"""
+    try:
+        job = frame_retention.resume(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job.to_dict()), 202
+
+    except Exception as e:
+        logger.error(f"Error resuming frame job: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/frames/stats', methods=['GET'])
+def frame_stats_summary():
+    """Get statistics about cached frames from the maintained counters (?video= for one video)"""
+    try:
+        videos = frame_stats.videos()
+        video = request.args.get('video')
+        if video:
+            counters = videos.get(video, {"frames": 0, "bytes": 0, "lastAccessed": None})
+            return jsonify({"video": video, **counters}), 200
+
+        total_count = sum(counters['frames'] for counters in videos.values())
+        total_size = sum(counters['bytes'] for counters in videos.values())
+        largest = sorted(videos.items(), key=lambda item: item[1]['bytes'], reverse=True)[:10]
 
         return jsonify({
             "total_frames": total_count,
             "total_size_mb": round(total_size / (1024*1024), 2),
-            "total_size_gb": round(total_size / (1024*1024*1024), 2)
+            "total_size_gb": round(total_size / (1024*1024*1024), 2),
+            "videos": len(videos),
+            "budget_gb": round(FRAME_CACHE_MAX_BYTES / (1024*1024*1024), 2) if FRAME_CACHE_MAX_BYTES else None,
+            "largest_videos": [{"video": name, **counters} for name, counters in largest]
         }), 200
 
     except Exception as e:
@@ -616,40 +1405,16 @@ def frame_stats():
 def export_annotations(blob_name):
     """Export annotations in YOLO format"""
     try:
-        # Get annotations
-        annotation_blob_name = f"{blob_name}.json"
-        annotation_container = 'annotations'
-
-        blob_client = blob_service_client.get_blob_client(
-            container=annotation_container,
-            blob=annotation_blob_name
-        )
-
-        if not blob_client.exists():
+        metadata, columns = annotation_store.load_columns(blob_name)
+        if metadata is None:
             return jsonify({"error": "No annotations found"}), 404
 
-        download_stream = blob_client.download_blob()
-        annotations = json.loads(download_stream.readall())
-
-        # Convert to YOLO format (one line per object: class x_center y_center width height)
-        yolo_data = []
-        for frame_num, frame_data in annotations.get('frames', {}).items():
-            for obj in frame_data.get('objects', []):
-                class_id = obj.get('class_id', 0)
-                bbox = obj.get('bbox', {})
-                # YOLO format: normalized coordinates
-                x_center = (bbox['x'] + bbox['width'] / 2) / \
-                    annotations.get('video_width', 1)
-                y_center = (bbox['y'] + bbox['height'] / 2) / \
-                    annotations.get('video_height', 1)
-                width = bbox['width'] / annotations.get('video_width', 1)
-                height = bbox['height'] / annotations.get('video_height', 1)
-
-                yolo_data.append(
-                    f"{class_id} {x_center} {y_center} {width} {height}")
+        # YOLO format: one line per object, class x_center y_center width height (normalized)
+        yolo_data = BytesIO(yolo_text(
+            yolo_rows(columns, metadata.get('video_width'), metadata.get('video_height'))))
 
         return send_file(
-            BytesIO('\n'.join(yolo_data).encode()),
+            yolo_data,
             mimetype='text/plain',
             as_attachment=True,
             download_name=f"{blob_name.replace('/', '_')}_annotations.txt"
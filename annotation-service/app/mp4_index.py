@@ -0,0 +1,287 @@
+import bisect
+import math
+import os
+import struct
+from array import array
+from typing import Callable, Iterator, List, Optional, Tuple
+
+MAX_TOP_LEVEL_BOXES = 64
+
+
+class Mp4Index:
+    """
+    Sample tables of the first video track of an MP4/MOV file.
+
+    Samples are indexed in decode order (0-based). Everything needed to map
+    a frame to the bytes that must be fetched to decode it comes from the
+    moov box, without touching mdat.
+    """
+
+    def __init__(self):
+        self.timescale = 0
+        self.duration = 0
+        self.width = 0
+        self.height = 0
+        self.rotation = 0
+        self.offsets = array('q')
+        self.sizes = array('q')
+        self.dts = array('q')
+        self.pts = array('q')
+        self.sync_samples: List[int] = []
+        self.moov_start = 0
+        self.moov_end = 0
+        self.mdat_start = 0
+        self.header_end = 0  # End of ftyp/moov/mdat box headers: everything a demuxer reads before samples
+        self._presentation = None  # (sample of each frame, furthest sample any frame <= n needs, keyframe pts)
+
+    @property
+    def sample_count(self) -> int:
+        return len(self.sizes)
+
+    @property
+    def fps(self) -> float:
+        if not self.duration or not self.timescale:
+            return 0.0
+        return self.sample_count * self.timescale / self.duration
+
+    @property
+    def display_size(self) -> Tuple[int, int]:
+        """(width, height) after applying the track rotation, as OpenCV reports them"""
+        if self.rotation % 180:
+            return self.height, self.width
+        return self.width, self.height
+
+    def keyframe_before(self, sample: int) -> int:
+        """Index of the last sync sample at or before sample"""
+        if not self.sync_samples:
+            return 0  # No stss box: every sample is a sync sample
+        i = bisect.bisect_right(self.sync_samples, sample) - 1
+        return self.sync_samples[max(i, 0)]
+
+    def keyframe_after(self, sample: int) -> int:
+        """Index of the first sync sample after sample (sample_count if none)"""
+        if not self.sync_samples:
+            return min(sample + 1, self.sample_count)
+        i = bisect.bisect_right(self.sync_samples, sample)
+        return self.sync_samples[i] if i < len(self.sync_samples) else self.sample_count
+
+    def _presentation_tables(self):
+        if self._presentation is None:
+            order = sorted(range(self.sample_count), key=self.pts.__getitem__)
+            reach = array('q', order)
+            for n in range(1, len(reach)):
+                reach[n] = max(reach[n], reach[n - 1])
+            syncs = self.sync_samples or range(self.sample_count)
+            keyframes = sorted((self.pts[s], s) for s in syncs if s < self.sample_count)
+            self._presentation = (order, reach, keyframes)
+        return self._presentation
+
+    def decode_window(self, first: int, last: int, output_delay: int) -> Tuple[int, int]:
+        """
+        (first, last) samples a decoder reads to output frames first..last
+        (presentation order) after seeking to the keyframe preceding first.
+
+        Seeks land on the last keyframe whose pts is at or before the
+        target's, which for open GOPs can precede the target's own GOP in
+        decode order. The last sample is the furthest any frame up to last
+        is stored at (B-frame reordering), plus output_delay samples the
+        decoder buffers before emitting a frame.
+        """
+        order, reach, keyframes = self._presentation_tables()
+        first = max(0, min(first, self.sample_count - 1))
+        last = max(first, min(last, self.sample_count - 1))
+        i = bisect.bisect_right(keyframes, (self.pts[order[first]], math.inf)) - 1
+        start = keyframes[i][1] if i >= 0 else 0
+        return min(start, order[first]), min(reach[last] + output_delay, self.sample_count - 1)
+
+    def byte_range(self, first: int, last: int) -> Tuple[int, int]:
+        """[start, end) byte range covering samples first..last inclusive"""
+        last = min(last, self.sample_count - 1)
+        start = min(self.offsets[first:last + 1])
+        end = max(o + s for o, s in zip(self.offsets[first:last + 1], self.sizes[first:last + 1]))
+        return start, end
+
+
+def _iter_boxes(data: bytes, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Yield (type, payload_start, box_end) for the boxes in data[start:end]"""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield box_type, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _find(data: bytes, start: int, end: int, path: List[bytes]) -> Optional[Tuple[int, int]]:
+    """(payload_start, box_end) of the first box matching a type path, e.g. [b'mdia', b'mdhd']"""
+    for box_type, payload, box_end in _iter_boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return payload, box_end
+            found = _find(data, payload, box_end, path[1:])
+            if found:
+                return found
+    return None
+
+
+def _parse_video_trak(data: bytes, start: int, end: int) -> Optional[Mp4Index]:
+    hdlr = _find(data, start, end, [b'mdia', b'hdlr'])
+    if hdlr is None or data[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+        return None
+
+    index = Mp4Index()
+
+    tkhd = _find(data, start, end, [b'tkhd'])
+    if tkhd:
+        p = tkhd[0]
+        p += 4 + (32 if data[p] == 1 else 20) + 16  # version/flags, times/ids, reserved..volume
+        a, b = struct.unpack_from('>ii', data, p)
+        index.rotation = int(round(math.degrees(math.atan2(b / 65536, a / 65536)))) % 360
+
+    p = _find(data, start, end, [b'mdia', b'mdhd'])[0]
+    if data[p] == 1:
+        index.timescale, index.duration = struct.unpack_from('>IQ', data, p + 20)
+    else:
+        index.timescale, index.duration = struct.unpack_from('>II', data, p + 12)
+
+    stbl = _find(data, start, end, [b'mdia', b'minf', b'stbl'])
+    tables = {box_type: (payload, box_end) for box_type, payload, box_end
+              in _iter_boxes(data, stbl[0], stbl[1])}
+
+    # Visual sample entry: 8-byte box header, 6 reserved, 2 dref, 16 pre-defined, then width/height
+    stsd = tables[b'stsd'][0]
+    index.width, index.height = struct.unpack_from('>HH', data, stsd + 8 + 8 + 24)
+
+    p = tables[b'stsz'][0]
+    sample_size, count = struct.unpack_from('>II', data, p + 4)
+    if sample_size:
+        index.sizes = array('q', [sample_size] * count)
+    else:
+        index.sizes = array('q', struct.unpack_from(f'>{count}I', data, p + 12))
+
+    if b'stco' in tables:
+        p = tables[b'stco'][0]
+        n = struct.unpack_from('>I', data, p + 4)[0]
+        chunk_offsets = struct.unpack_from(f'>{n}I', data, p + 8)
+    else:
+        p = tables[b'co64'][0]
+        n = struct.unpack_from('>I', data, p + 4)[0]
+        chunk_offsets = struct.unpack_from(f'>{n}Q', data, p + 8)
+
+    p = tables[b'stsc'][0]
+    n = struct.unpack_from('>I', data, p + 4)[0]
+    stsc = [struct.unpack_from('>III', data, p + 8 + i * 12)[:2] for i in range(n)]
+
+    # Expand chunk offsets + samples-per-chunk runs into per-sample offsets
+    offsets = array('q')
+    sample = 0
+    for run, (first_chunk, per_chunk) in enumerate(stsc):
+        last_chunk = stsc[run + 1][0] - 1 if run + 1 < len(stsc) else len(chunk_offsets)
+        for chunk in range(first_chunk - 1, last_chunk):
+            offset = chunk_offsets[chunk]
+            for _ in range(per_chunk):
+                if sample >= count:
+                    break
+                offsets.append(offset)
+                offset += index.sizes[sample]
+                sample += 1
+    index.offsets = offsets
+
+    p = tables[b'stts'][0]
+    n = struct.unpack_from('>I', data, p + 4)[0]
+    t = 0
+    for i in range(n):
+        run, delta = struct.unpack_from('>II', data, p + 8 + i * 8)
+        for _ in range(run):
+            index.dts.append(t)
+            t += delta
+
+    index.pts = array('q', index.dts)
+    if b'ctts' in tables:
+        p = tables[b'ctts'][0]
+        fmt = '>Ii' if data[p] == 1 else '>II'
+        n = struct.unpack_from('>I', data, p + 4)[0]
+        sample = 0
+        for i in range(n):
+            run, offset = struct.unpack_from(fmt, data, p + 8 + i * 8)
+            for _ in range(run):
+                if sample < len(index.pts):
+                    index.pts[sample] += offset
+                sample += 1
+
+    if b'stss' in tables:
+        p = tables[b'stss'][0]
+        n = struct.unpack_from('>I', data, p + 4)[0]
+        index.sync_samples = [s - 1 for s in struct.unpack_from(f'>{n}I', data, p + 8)]
+
+    return index
+
+
+def parse_mp4(read: Callable[[int, int], bytes], size: int,
+              require_faststart: bool = True) -> Optional[Mp4Index]:
+    """
+    Index an MP4 using ranged reads (read(offset, length) -> bytes).
+
+    With require_faststart, returns None when moov comes after mdat, since
+    indexing it over the network would mean reading to the end of the file
+    anyway. Local files can be indexed either way.
+    """
+    offset = 0
+    moov = None
+    mdat = None
+    for _ in range(MAX_TOP_LEVEL_BOXES):
+        if offset + 8 > size:
+            break
+        header = read(offset, 16)
+        box_size, box_type = struct.unpack_from('>I4s', header)
+        header_len = 8
+        if box_size == 1:
+            box_size = struct.unpack_from('>Q', header, 8)[0]
+            header_len = 16
+        elif box_size == 0:
+            box_size = size - offset
+
+        if box_type == b'moov':
+            moov = (offset, offset + box_size, read(offset, box_size))
+        elif box_type == b'mdat' and mdat is None:
+            if moov is None and require_faststart:
+                return None
+            mdat = (offset, header_len)
+        if moov is not None and mdat is not None:
+            break
+        offset += box_size
+
+    if moov is None or mdat is None:
+        return None
+
+    moov_start, moov_end, data = moov
+    for box_type, payload, box_end in _iter_boxes(data, 8, len(data)):
+        if box_type == b'trak':
+            index = _parse_video_trak(data, payload, box_end)
+            if index is not None:
+                index.moov_start = moov_start
+                index.moov_end = moov_end
+                index.mdat_start = mdat[0]
+                index.header_end = mdat[0] + mdat[1]
+                return index
+    return None
+
+
+def parse_mp4_file(path: str) -> Optional[Mp4Index]:
+    """Index a local MP4/MOV file (faststart or not); None for other containers"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        def read(offset, length):
+            f.seek(offset)
+            return f.read(length)
+        try:
+            return parse_mp4(read, size, require_faststart=False)
+        except (struct.error, KeyError, TypeError):
+            return None
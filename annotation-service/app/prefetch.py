@@ -0,0 +1,166 @@
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Set
+
+logger = logging.getLogger(__name__)
+
+
+class _VideoQueue:
+    """Pending prefetch work for one video"""
+
+    def __init__(self):
+        self.focus = 0  # Frame the annotator is currently on
+        self.pending: Set[int] = set()
+        self.in_flight: Set[int] = set()
+        self.queued = False  # In the scheduler's ready queue
+        self.active = False  # A worker is processing a batch for this video
+
+
+class PrefetchScheduler:
+    """
+    Per-process prefetch scheduler with a fixed pool of worker threads.
+
+    Each video has a set of pending frames prioritised by distance from the
+    annotator's current frame. Requests for frames already pending or in
+    flight are dropped, and a new position discards pending frames that are
+    now more than `window` frames away. Only one worker handles a video at a
+    time and it takes the nearest `batch_size` frames in ascending order, so
+    one decoder session keeps decoding forward instead of seeking per frame.
+
+    fetch(blob_name, frame_number) does the work and returns True if the
+    frame had to be extracted, False if it was already stored.
+    """
+
+    def __init__(self, fetch: Callable[[str, int], bool], workers: int = 2,
+                 window: int = 30, batch_size: int = 8, max_pending_per_video: int = 64):
+        self.fetch = fetch
+        self.window = window
+        self.batch_size = batch_size
+        self.max_pending_per_video = max_pending_per_video
+
+        self._videos: Dict[str, _VideoQueue] = {}
+        self._ready: deque = deque()
+        self._cond = threading.Condition()
+        self._counters = {
+            "scheduled": 0,
+            "deduplicated": 0,
+            "dropped_stale": 0,
+            "extracted": 0,
+            "already_cached": 0,
+            "wasted": 0,  # Extracted after the annotator had already moved away
+            "errors": 0
+        }
+        self._workers = [
+            threading.Thread(target=self._run, name=f'prefetch-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _is_stale(self, video: _VideoQueue, frame_number: int) -> bool:
+        return abs(frame_number - video.focus) > self.window
+
+    def _priority(self, video: _VideoQueue, frame_number: int):
+        # Nearest first; frames ahead win ties since annotators mostly step forward
+        return abs(frame_number - video.focus), frame_number < video.focus
+
+    def schedule(self, blob_name: str, current_frame: int, frames: Iterable[int]) -> List[int]:
+        """Move the video's focus to current_frame and queue frames; returns the frames newly queued"""
+        queued = []
+        with self._cond:
+            video = self._videos.setdefault(blob_name, _VideoQueue())
+            video.focus = current_frame
+
+            stale = {n for n in video.pending if self._is_stale(video, n)}
+            video.pending -= stale
+            self._counters["dropped_stale"] += len(stale)
+
+            for n in frames:
+                if n in video.pending or n in video.in_flight:
+                    self._counters["deduplicated"] += 1
+                elif not self._is_stale(video, n):
+                    video.pending.add(n)
+                    queued.append(n)
+            self._counters["scheduled"] += len(queued)
+
+            if len(video.pending) > self.max_pending_per_video:
+                keep = sorted(video.pending, key=lambda n: self._priority(video, n))
+                video.pending = set(keep[:self.max_pending_per_video])
+                self._counters["dropped_stale"] += len(keep) - len(video.pending)
+
+            if video.pending and not video.queued and not video.active:
+                video.queued = True
+                self._ready.append(blob_name)
+                self._cond.notify()
+        return queued
+
+    def _next_batch(self):
+        """Wait for a video with pending work and claim its nearest frames (decode order)"""
+        with self._cond:
+            while not self._ready:
+                self._cond.wait()
+            blob_name = self._ready.popleft()
+            video = self._videos[blob_name]
+            video.queued = False
+            video.active = True
+
+            nearest = sorted(video.pending, key=lambda n: self._priority(video, n))[:self.batch_size]
+            video.pending.difference_update(nearest)
+            video.in_flight.update(nearest)
+            return blob_name, video, sorted(nearest)
+
+    def _finish_batch(self, blob_name: str, video: _VideoQueue):
+        with self._cond:
+            video.active = False
+            if video.pending:
+                video.queued = True
+                self._ready.append(blob_name)
+                self._cond.notify()
+            elif not video.in_flight:
+                self._videos.pop(blob_name, None)
+
+    def _run(self):
+        while True:
+            blob_name, video, batch = self._next_batch()
+            try:
+                for n in batch:
+                    with self._cond:
+                        if self._is_stale(video, n):
+                            video.in_flight.discard(n)
+                            self._counters["dropped_stale"] += 1
+                            continue
+
+                    try:
+                        extracted = self.fetch(blob_name, n)
+                        error = False
+                    except Exception as e:
+                        logger.error(f"Error prefetching frame {n} of {blob_name}: {e}")
+                        extracted, error = False, True
+
+                    with self._cond:
+                        video.in_flight.discard(n)
+                        if error:
+                            self._counters["errors"] += 1
+                        elif extracted:
+                            self._counters["extracted"] += 1
+                            if self._is_stale(video, n):
+                                self._counters["wasted"] += 1
+                        else:
+                            self._counters["already_cached"] += 1
+            finally:
+                with self._cond:
+                    video.in_flight.difference_update(batch)
+                self._finish_batch(blob_name, video)
+
+    def stats(self) -> dict:
+        with self._cond:
+            extracted = self._counters["extracted"]
+            return {
+                **self._counters,
+                "queue_depth": sum(len(v.pending) for v in self._videos.values()),
+                "in_flight": sum(len(v.in_flight) for v in self._videos.values()),
+                "videos": len(self._videos),
+                "workers": len(self._workers),
+                "wasted_ratio": round(self._counters["wasted"] / extracted, 4) if extracted else 0
+            }
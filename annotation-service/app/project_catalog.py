@@ -0,0 +1,351 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+CATALOG_BLOB = 'catalog/videos.json'
+VIDEO_PREFIX = 'raw-videos/'
+MAX_WRITE_ATTEMPTS = 10
+
+
+def project_of(blob_name: str) -> Optional[str]:
+    """Project name from a video blob path (raw-videos/project1/video.mp4 -> project1), or None"""
+    parts = blob_name.split('/')
+    return parts[1] if len(parts) >= 2 else None
+
+
+def video_entry(blob) -> dict:
+    """Catalog entry for a listed video blob (or its BlobProperties)"""
+    return {
+        'fileName': blob.name.split('/')[-1],
+        'blobName': blob.name,
+        'size': blob.size,
+        'lastModified': blob.last_modified.isoformat()
+    }
+
+
+class ProjectCatalog:
+    """
+    Project/video catalog kept as one compact blob next to the videos, so
+    /api/projects never lists the container:
+
+        {"reconciledAt": 1768500943.2, "videos": [[blobName, size, lastModified], ...]}
+
+    Every process holds the catalog in memory, sorted by blob name, and
+    answers queries from there: a page starts with a binary search for the
+    cursor, so it costs O(log n + page size), but a search filter scans names
+    from the cursor until the page fills, up to O(n). Upload-complete and
+    deletion update memory at once and queue the change; queued changes are
+    written back within `flush_delay` seconds in one conditional write
+    (merged onto the latest copy and retried on an ETag conflict), so a bulk
+    upload costs one write per second rather than one per video. Changes
+    made by other processes are picked up by a background ETag check at most
+    every `refresh_interval` seconds.
+
+    Uploads that never call upload-complete, or videos deleted straight from
+    storage, are repaired by reconcile(): a full listing diffed against the
+    catalog, run in the background once `reconcile_interval` seconds have
+    passed since any process last reconciled.
+    """
+
+    def __init__(self, container_client, refresh_interval: float = 5.0, flush_delay: float = 1.0,
+                 reconcile_interval: float = 3600.0):
+        self.container_client = container_client
+        self.refresh_interval = refresh_interval
+        self.flush_delay = flush_delay
+        self.reconcile_interval = reconcile_interval
+
+        self._videos: Dict[str, dict] = {}
+        self._order: List[str] = []  # All blob names, sorted
+        self._projects: Dict[str, List[str]] = {}  # Project -> its blob names, sorted
+        self._etag: Optional[str] = None
+        self._reconciled_at = 0.0
+        self._checked_at: Optional[float] = None  # monotonic time of the last remote check
+
+        # Changes not yet written back: blob name -> entry, or None for a deletion
+        self._pending: Dict[str, Optional[dict]] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()  # _load() may reconcile()
+        self._flush_scheduled = False
+        self._refreshing = False
+
+    # In-memory index
+
+    def _set(self, blob_name: str, entry: Optional[dict]):
+        """Add, update (entry) or remove (None) one video; caller holds _lock"""
+        project = project_of(blob_name)
+        if project is None:
+            return
+        exists = blob_name in self._videos
+        if entry is not None:
+            self._videos[blob_name] = entry
+            if not exists:
+                bisect.insort(self._order, blob_name)
+                bisect.insort(self._projects.setdefault(project, []), blob_name)
+        elif exists:
+            del self._videos[blob_name]
+            del self._order[bisect.bisect_left(self._order, blob_name)]
+            names = self._projects[project]
+            del names[bisect.bisect_left(names, blob_name)]
+            if not names:
+                del self._projects[project]
+
+    def _install(self, videos: Dict[str, dict], reconciled_at: float, etag: Optional[str]):
+        """Replace the in-memory catalog with a stored copy, keeping changes not yet written back"""
+        videos = dict(videos)
+        with self._lock:
+            for blob_name, entry in self._pending.items():
+                if entry is None:
+                    videos.pop(blob_name, None)
+                else:
+                    videos[blob_name] = entry
+            self._videos = {}
+            self._order = []
+            self._projects = {}
+            for blob_name in sorted(videos):
+                project = project_of(blob_name)
+                if project is not None:
+                    self._videos[blob_name] = videos[blob_name]
+                    self._order.append(blob_name)
+                    self._projects.setdefault(project, []).append(blob_name)
+            self._etag = etag
+            self._reconciled_at = reconciled_at
+            self._checked_at = time.monotonic()
+
+    # Stored copy
+
+    def _blob_client(self):
+        return self.container_client.get_blob_client(CATALOG_BLOB)
+
+    def _read(self) -> Tuple[Optional[Dict[str, dict]], float, Optional[str]]:
+        """(videos, reconciledAt, ETag) of the stored catalog; videos is None if there is none"""
+        try:
+            download_stream = self._blob_client().download_blob()
+        except ResourceNotFoundError:
+            return None, 0.0, None
+        document = json.loads(download_stream.readall())
+        videos = {
+            blob_name: {'fileName': blob_name.split('/')[-1], 'blobName': blob_name,
+                        'size': size, 'lastModified': last_modified}
+            for blob_name, size, last_modified in document.get('videos', [])
+        }
+        return videos, document.get('reconciledAt', 0.0), download_stream.properties.etag
+
+    def _write(self, videos: Dict[str, dict], reconciled_at: float, etag: Optional[str]) -> str:
+        """Upload the catalog only over etag (or only if none exists when etag is None); returns the new ETag"""
+        if etag is None:
+            kwargs = {'etag': '*', 'match_condition': MatchConditions.IfMissing}
+        else:
+            kwargs = {'etag': etag, 'match_condition': MatchConditions.IfNotModified}
+        document = {
+            "reconciledAt": reconciled_at,
+            "videos": [[name, videos[name]['size'], videos[name]['lastModified']] for name in sorted(videos)]
+        }
+        result = self._blob_client().upload_blob(
+            json.dumps(document, separators=(',', ':')), overwrite=True, **kwargs)
+        return result['etag']
+
+    def _load(self):
+        """First use in this process: read the catalog, building it with a full listing if there is none"""
+        videos, reconciled_at, etag = self._read()
+        if videos is None:
+            self.reconcile()
+        else:
+            self._install(videos, reconciled_at, etag)
+
+    def _refresh(self):
+        try:
+            missing = False
+            try:
+                etag = self._blob_client().get_blob_properties().etag
+                if etag != self._etag:
+                    videos, reconciled_at, etag = self._read()
+                    missing = videos is None
+                    if not missing:
+                        self._install(videos, reconciled_at, etag)
+                else:
+                    with self._lock:
+                        self._checked_at = time.monotonic()
+            except ResourceNotFoundError:
+                missing = True
+            if missing or (self.reconcile_interval and
+                           time.time() - self._reconciled_at > self.reconcile_interval):
+                self.reconcile()
+        except Exception as e:
+            logger.warning(f"Could not refresh project catalog: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _ensure_current(self):
+        """Load on first use; afterwards refresh in the background, never on the request path"""
+        if self._checked_at is None:
+            with self._write_lock:
+                if self._checked_at is None:
+                    self._load()
+            return
+
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._checked_at < self.refresh_interval:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    # Updates
+
+    def _queue(self, blob_name: str, entry: Optional[dict]):
+        with self._lock:
+            self._set(blob_name, entry)
+            self._pending[blob_name] = entry
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        timer = threading.Timer(self.flush_delay, self._flush_in_background)
+        timer.daemon = True
+        timer.start()
+
+    def put(self, blob) -> dict:
+        """Record an uploaded video (a BlobProperties or listing item)"""
+        entry = video_entry(blob)
+        self._queue(blob.name, entry)
+        return entry
+
+    def remove(self, blob_name: str):
+        """Record a deleted video"""
+        self._queue(blob_name, None)
+
+    def _flush_in_background(self):
+        with self._lock:
+            self._flush_scheduled = False
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error writing project catalog: {e}")
+            with self._lock:
+                retry = bool(self._pending) and not self._flush_scheduled
+                self._flush_scheduled = self._flush_scheduled or retry
+            if retry:
+                timer = threading.Timer(self.flush_delay * 5, self._flush_in_background)
+                timer.daemon = True
+                timer.start()
+
+    def flush(self):
+        """Write queued changes back, merged onto the latest stored catalog"""
+        with self._write_lock:
+            for _ in range(MAX_WRITE_ATTEMPTS):
+                with self._lock:
+                    changes = dict(self._pending)
+                if not changes:
+                    return
+                videos, reconciled_at, etag = self._read()
+                videos = videos or {}
+                for blob_name, entry in changes.items():
+                    if entry is None:
+                        videos.pop(blob_name, None)
+                    else:
+                        videos[blob_name] = entry
+                try:
+                    new_etag = self._write(videos, reconciled_at, etag)
+                except (ResourceModifiedError, ResourceExistsError):
+                    continue  # Another process wrote in between; merge onto its copy
+
+                with self._lock:
+                    for blob_name, entry in changes.items():
+                        if self._pending.get(blob_name, ...) is entry:
+                            del self._pending[blob_name]
+                self._install(videos, reconciled_at, new_etag)
+                logger.info(f"Wrote {len(changes)} changes to the project catalog ({len(videos)} videos)")
+                return
+            raise RuntimeError(f"Project catalog still changing after {MAX_WRITE_ATTEMPTS} attempts")
+
+    def reconcile(self) -> dict:
+        """Repair drift between the catalog and the videos actually in storage (one full listing)"""
+        with self._write_lock:
+            started = datetime.now(timezone.utc)
+            listed = {blob.name: video_entry(blob)
+                      for blob in self.container_client.list_blobs(name_starts_with=VIDEO_PREFIX)}
+
+            for _ in range(MAX_WRITE_ATTEMPTS):
+                stored, _, etag = self._read()
+                stored = stored or {}
+                videos = dict(listed)
+                # Keep entries recorded after the listing began; the next reconcile checks them
+                for blob_name, entry in stored.items():
+                    if blob_name not in listed and datetime.fromisoformat(entry['lastModified']) >= started:
+                        videos[blob_name] = entry
+                added = sum(1 for name in videos if name not in stored)
+                removed = sum(1 for name in stored if name not in videos)
+                updated = sum(1 for name, entry in videos.items() if name in stored and stored[name] != entry)
+                reconciled_at = time.time()
+                try:
+                    new_etag = self._write(videos, reconciled_at, etag)
+                except (ResourceModifiedError, ResourceExistsError):
+                    continue
+
+                self._install(videos, reconciled_at, new_etag)
+                logger.info(f"Reconciled project catalog: {len(videos)} videos "
+                            f"({added} added, {removed} removed, {updated} updated)")
+                return {"videos": len(videos), "added": added, "removed": removed, "updated": updated}
+            raise RuntimeError(f"Project catalog still changing after {MAX_WRITE_ATTEMPTS} attempts")
+
+    # Queries
+
+    def videos(self, project: str) -> List[str]:
+        """Blob names of a project's videos, sorted"""
+        self._ensure_current()
+        with self._lock:
+            return list(self._projects.get(project, []))
+
+    def query(self, project: Optional[str] = None, search: Optional[str] = None,
+              limit: Optional[int] = 200, cursor: Optional[str] = None) -> dict:
+        """
+        One page of videos, sorted by blob name and grouped by project.
+        project restricts to one project, search to blob names containing
+        it (case-insensitive); cursor is the nextCursor of the previous page.
+        limit None returns every match on one page.
+        """
+        self._ensure_current()
+        needle = search.lower() if search else None
+        with self._lock:
+            names = self._projects.get(project, []) if project is not None else self._order
+            start = bisect.bisect_right(names, cursor) if cursor else 0
+            page = []
+            position = start
+            while position < len(names) and (limit is None or len(page) < limit):
+                blob_name = names[position]
+                if needle is None or needle in blob_name.lower():
+                    page.append(self._videos[blob_name])
+                position += 1
+            more = position < len(names)
+
+            projects = []
+            for entry in page:
+                name = project_of(entry['blobName'])
+                if not projects or projects[-1]['name'] != name:
+                    projects.append({"name": name, "videoCount": len(self._projects[name]), "videos": []})
+                projects[-1]['videos'].append(entry)
+
+            return {
+                "projects": projects,
+                "nextCursor": page[-1]['blobName'] if more and page else None,
+                "totalProjects": len(self._projects),
+                "totalVideos": len(self._order)
+            }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "projects": len(self._projects),
+                "videos": len(self._order),
+                "pendingChanges": len(self._pending),
+                "reconciledAt": self._reconciled_at,
+                "lastChecked": round(time.monotonic() - self._checked_at, 1) if self._checked_at else None
+            }
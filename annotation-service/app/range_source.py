@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.mp4_index import Mp4Index, parse_mp4
+from app.video_cache import SingleFlight, VideoCache, entry_name, file_lock
+
+logger = logging.getLogger(__name__)
+
+HEADER_PREFETCH = 256 * 1024  # One read usually covers ftyp + a small moov
+DECODE_MARGIN = 16  # Samples a decoder may buffer before emitting a frame (H.264/HEVC DPB limit)
+PROBE_SECONDS = 2  # Samples fetched up front for the demuxer's stream probing
+
+
+def _merge(intervals: List[List[int]]) -> List[List[int]]:
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _missing(intervals: List[List[int]], start: int, end: int) -> List[Tuple[int, int]]:
+    """Sub-ranges of [start, end) not covered by the (merged) intervals"""
+    gaps = []
+    pos = start
+    for s, e in intervals:
+        if e <= pos:
+            continue
+        if s >= end:
+            break
+        if s > pos:
+            gaps.append((pos, s))
+        pos = max(pos, e)
+    if pos < end:
+        gaps.append((pos, end))
+    return gaps
+
+
+class RangeVideoSource:
+    """
+    A sparse local copy of a faststart video that is filled in on demand.
+
+    The file has the blob's full size, with the container header written up
+    front and only the GOPs needed for requested frames fetched by ranged
+    reads. Demuxers seek through the moov index, so OpenCV can decode any
+    frame whose bytes are present without ever reading the holes.
+    """
+
+    def __init__(self, blob_client, path: str, index: Mp4Index, download_concurrency: int):
+        self.blob_client = blob_client
+        self.path = path
+        self.index = index
+        self.download_concurrency = download_concurrency
+        self._ranges_path = path + '.ranges'
+        self._fetched: List[List[int]] = self._load_ranges()
+        self._lock = threading.Lock()
+
+    def _load_ranges(self) -> List[List[int]]:
+        try:
+            with open(self._ranges_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def _fetch(self, start: int, end: int):
+        download = self.blob_client.download_blob(
+            offset=start, length=end - start, max_concurrency=self.download_concurrency)
+        with open(self.path, 'r+b') as f:
+            f.seek(start)
+            download.readinto(f)
+
+    def ensure_bytes(self, start: int, end: int):
+        """Make sure [start, end) is present in the local file"""
+        with self._lock:
+            if not _missing(self._fetched, start, end):
+                return
+
+            with file_lock(self.path + '.lock'):
+                # Pick up ranges other workers have already fetched
+                self._fetched = _merge(self._fetched + self._load_ranges())
+            gaps = _missing(self._fetched, start, end)
+
+            for gap_start, gap_end in gaps:
+                self._fetch(gap_start, gap_end)
+
+            with file_lock(self.path + '.lock'):
+                self._fetched = _merge(self._fetched + self._load_ranges() + [list(g) for g in gaps])
+                with open(self._ranges_path + '.tmp', 'w') as f:
+                    json.dump(self._fetched, f)
+                os.replace(self._ranges_path + '.tmp', self._ranges_path)
+
+        if gaps:
+            logger.info(f"Fetched {sum(e - s for s, e in gaps) / 1024:.0f} KB of {os.path.basename(self.path)}")
+
+    def ensure_frames(self, first: int, last: int):
+        """Fetch everything needed to decode frames first..last after seeking to first's keyframe"""
+        if self.index.sample_count == 0:
+            return
+        start_sample, end_sample = self.index.decode_window(first, last, DECODE_MARGIN)
+        start, end = self.index.byte_range(start_sample, end_sample)
+        self.ensure_bytes(start, end)
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class RangeVideoSources:
+    """Creates and tracks range-backed sources, falling back (None) for non-faststart files"""
+
+    def __init__(self, container_client, video_cache: VideoCache, cache_dir: str,
+                 max_bytes: int, download_concurrency: int = 4, max_open: int = 32,
+                 min_age: int = 60, on_close: Optional[Callable[[str], None]] = None):
+        self.container_client = container_client
+        self.video_cache = video_cache
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.download_concurrency = download_concurrency
+        self.max_open = max_open
+        self.min_age = min_age
+        self.on_close = on_close  # Called with the path when a source is dropped
+
+        self._sources: "OrderedDict[str, Optional[RangeVideoSource]]" = OrderedDict()
+        self._by_path: Dict[str, RangeVideoSource] = {}
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, blob_name: str) -> Optional[RangeVideoSource]:
+        """Range-backed source for the blob's current version, or None if it is not faststart"""
+        etag, size = self.video_cache.blob_version(blob_name)
+        key = f"{blob_name}@{etag}"
+        with self._lock:
+            if key in self._sources:
+                self._sources.move_to_end(key)
+                return self._sources[key]
+
+        return self._flight.do(key, lambda: self._register(key, blob_name, etag, size))
+
+    def _register(self, key: str, blob_name: str, etag: str, size: int) -> Optional[RangeVideoSource]:
+        source = self._open(blob_name, etag, size)
+
+        closed = []
+        with self._lock:
+            self._sources[key] = source
+            if source is not None:
+                self._by_path[source.path] = source
+            while len(self._sources) > self.max_open:
+                _, old = self._sources.popitem(last=False)
+                if old is not None:
+                    self._by_path.pop(old.path, None)
+                    closed.append(old.path)
+
+        # Decoders must not keep reading a file nobody is filling in any more
+        if self.on_close:
+            for path in closed:
+                self.on_close(path)
+        return source
+
+    def _open(self, blob_name: str, etag: str, size: int) -> Optional[RangeVideoSource]:
+        blob_client = self.container_client.get_blob_client(blob_name)
+        prefetched = {}
+
+        def read(offset, length):
+            # Serve header probes from a single prefetched block where possible
+            if 'data' not in prefetched:
+                prefetched['data'] = blob_client.download_blob(
+                    offset=0, length=min(HEADER_PREFETCH, size)).readall()
+            data = prefetched['data']
+            if offset + length <= len(data):
+                return data[offset:offset + length]
+            return blob_client.download_blob(
+                offset=offset, length=min(length, size - offset)).readall()
+
+        index = parse_mp4(read, size)
+        if index is None:
+            logger.info(f"{blob_name} is not faststart, range reads disabled")
+            return None
+
+        path = os.path.join(self.cache_dir, entry_name(blob_name, etag))
+
+        with file_lock(path + '.lock'):
+            if not os.path.exists(path):
+                part_path = f"{path}.{os.getpid()}.part"
+                with open(part_path, 'wb') as f:
+                    f.truncate(size)  # Sparse: holes cost no disk until fetched
+                    f.seek(0)
+                    f.write(read(0, index.header_end))
+                with open(path + '.ranges', 'w') as f:
+                    json.dump([[0, index.header_end]], f)
+                os.replace(part_path, path)
+
+        source = RangeVideoSource(blob_client, path, index, self.download_concurrency)
+
+        # Demuxer probing on open reads the first packets of every stream
+        probe_frames = max(1, int(index.fps * PROBE_SECONDS))
+        probe_end = index.byte_range(0, probe_frames)[1]
+        source.ensure_bytes(index.header_end, probe_end)
+        logger.info(f"Opened range-backed source for {blob_name} ({index.sample_count} frames)")
+        return source
+
+    def prepare(self, video_path: str, first: int, last: int):
+        """DecoderPool hook: fetch the bytes a decode of first..last will read"""
+        with self._lock:
+            source = self._by_path.get(video_path)
+        if source is not None:
+            source.ensure_frames(first, last)
+
+    def is_range_backed(self, video_path: str) -> bool:
+        with self._lock:
+            return video_path in self._by_path
+
+    def evict(self):
+        """Evict least recently used partial files until their real (allocated) size fits max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(('.lock', '.part', '.ranges', '.tmp')):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, st.st_blocks * 512, st.st_mtime))
+
+        total = sum(size for _, size, _ in entries)
+        cutoff = time.time() - self.min_age
+        for path, size, mtime in sorted(entries, key=lambda e: e[2]):
+            if total <= self.max_bytes:
+                break
+            if mtime > cutoff:
+                continue
+            with self._lock:
+                if path in self._by_path:
+                    continue  # Still open in this worker
+            with file_lock(path + '.lock'):
+                for p in (path, path + '.ranges'):
+                    if os.path.exists(p):
+                        os.unlink(p)
+            total -= size
@@ -0,0 +1,129 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+from azure.storage.blob import generate_blob_sas
+
+logger = logging.getLogger(__name__)
+
+# Longest user delegation key Azure issues, less a margin in case this host's
+# clock runs ahead of the storage service's (an expiry past 7 days is rejected)
+MAX_KEY_LIFETIME = timedelta(days=7) - timedelta(minutes=15)
+
+
+class DelegationKeyCache:
+    """
+    Shares one user delegation key across every SAS the process issues.
+
+    Fetching a key is an AAD-authenticated round trip to storage, so it is
+    done once per `ttl`. When the key has less than `refresh_ahead` left it
+    is replaced in the background while callers keep using the current one;
+    callers only wait if no key is valid for as long as their SAS needs.
+
+    A SAS that must outlive any shared key (e.g. a 24 h export link) is
+    signed with a separate long-lived key (just under Azure's 7-day maximum),
+    cached on its own so the shared key is never replaced for it.
+    """
+
+    def __init__(self, blob_service_client, ttl: timedelta = timedelta(hours=6),
+                 refresh_ahead: timedelta = timedelta(hours=3)):
+        self.blob_service_client = blob_service_client
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self._key = None
+        self._expiry = None
+        self._long_key = None
+        self._long_expiry = None
+        self._lock = threading.Lock()  # Held while a request for a new key is in progress
+        self._refreshing = False
+        self._refreshing_lock = threading.Lock()
+        self.fetches = 0
+
+    def _request_key(self, lifetime: timedelta):
+        start_time = datetime.utcnow()
+        expiry_time = start_time + lifetime
+        key = self.blob_service_client.get_user_delegation_key(
+            key_start_time=start_time,
+            key_expiry_time=expiry_time
+        )
+        self.fetches += 1
+        logger.info(f"Fetched user delegation key (expires {expiry_time.isoformat()})")
+        return key, expiry_time
+
+    def _fetch(self):
+        self._key, self._expiry = self._request_key(self.ttl)
+
+    def _get_long_lived(self, min_valid: timedelta):
+        """A key valid for min_valid, for SAS lifetimes the shared key cannot cover"""
+        if min_valid > MAX_KEY_LIFETIME:
+            raise ValueError(f"SAS lifetime {min_valid} exceeds the longest delegation key ({MAX_KEY_LIFETIME})")
+        with self._lock:
+            if self._long_key is None or self._long_expiry - datetime.utcnow() <= min_valid:
+                self._long_key, self._long_expiry = self._request_key(MAX_KEY_LIFETIME)
+            return self._long_key
+
+    def _remaining(self, now: datetime) -> timedelta:
+        return self._expiry - now if self._key is not None else timedelta(0)
+
+    def _refresh_in_background(self):
+        try:
+            with self._lock:
+                self._fetch()
+        except Exception as e:
+            logger.warning(f"Background delegation key refresh failed: {e}")
+        finally:
+            self._refreshing = False
+
+    def get(self, min_valid: timedelta = timedelta(0)):
+        """A delegation key that stays valid for at least min_valid"""
+        if min_valid >= self.ttl - self.refresh_ahead:
+            return self._get_long_lived(min_valid)
+
+        remaining = self._remaining(datetime.utcnow())
+        if remaining <= min_valid:
+            with self._lock:
+                # Another thread may have fetched one while we waited
+                if self._remaining(datetime.utcnow()) <= min_valid:
+                    self._fetch()
+                return self._key
+
+        if remaining < self.refresh_ahead:
+            with self._refreshing_lock:
+                start_refresh = not self._refreshing
+                self._refreshing = True
+            if start_refresh:
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return self._key
+
+    def stats(self) -> dict:
+        return {
+            "fetches": self.fetches,
+            "expiresAt": self._expiry.isoformat() if self._expiry else None,
+            "longLivedExpiresAt": self._long_expiry.isoformat() if self._long_expiry else None
+        }
+
+
+class SasIssuer:
+    """Builds user-delegation SAS URLs for blobs using a shared DelegationKeyCache"""
+
+    def __init__(self, account_name: str, keys: DelegationKeyCache):
+        self.account_name = account_name
+        self.keys = keys
+
+    def blob_url(self, container_name: str, blob_name: str) -> str:
+        return f"https://{self.account_name}.blob.core.windows.net/{container_name}/{quote(blob_name)}"
+
+    def sas_url(self, container_name: str, blob_name: str, permission,
+                expiry: datetime, **kwargs) -> str:
+        """SAS URL valid until expiry; kwargs are passed to generate_blob_sas (e.g. cache_control)"""
+        sas_token = generate_blob_sas(
+            account_name=self.account_name,
+            container_name=container_name,
+            blob_name=blob_name,
+            user_delegation_key=self.keys.get(expiry - datetime.utcnow()),
+            permission=permission,
+            expiry=expiry,
+            **kwargs
+        )
+        return f"{self.blob_url(container_name, blob_name)}?{sas_token}"
@@ -0,0 +1,267 @@
+import cv2
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+from azure.core.exceptions import ResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+STALE_STATUS_SECONDS = 120  # A running job's status blob not updated for this long belongs to a stopped worker
+
+
+class SpriteJob:
+    """Progress of one video's sprite sheet generation at one stride"""
+
+    def __init__(self, blob_name: str, stride: int):
+        self.blob_name = blob_name
+        self.stride = stride
+        self.status = 'queued'
+        self.total_frames = 0
+        self.decoded = 0
+        self.tiles = 0
+        self.sheets = 0
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "blobName": self.blob_name,
+                "stride": self.stride,
+                "status": self.status,
+                "totalFrames": self.total_frames,
+                "decodedFrames": self.decoded,
+                "tiles": self.tiles,
+                "sheets": self.sheets,
+                "progress": round(self.decoded / self.total_frames, 4) if self.total_frames else 0,
+                "error": self.error,
+                "createdAt": self.created_at,
+                "startedAt": self.started_at,
+                "updatedAt": time.time(),
+                "finishedAt": self.finished_at
+            }
+
+
+class SpriteSheets:
+    """
+    Timeline sprite sheets: every `stride`-th frame of a video as a small
+    tile, `columns` x `rows` tiles to a JPEG sheet, plus a JSON index of
+    the layout. A scrub bar over a 100k-frame video at stride 30 needs 34
+    sheets instead of thousands of frame requests.
+
+    Sheets are built in one linear decode pass: frames between samples are
+    only grabbed (no colour conversion), and finished sheets are encoded
+    and uploaded on a separate thread while decoding continues. The index
+    is written last and names the video ETag it was built from, so a
+    sheet set is visible only once complete and goes stale if the video
+    is replaced.
+
+    Layout in the frames container, next to the video's frames:
+
+        {video}/sprites/s30_w160/index.json
+        {video}/sprites/s30_w160/sheet_0000.jpg
+        {video}/sprites/s30_w160/status.json  (job progress, for other workers)
+    """
+
+    def __init__(self, container_client, get_video_path: Callable[[str], str],
+                 get_video_etag: Callable[[str], str], columns: int = 10, rows: int = 10,
+                 tile_width: int = 160, quality: int = 70, max_concurrent_jobs: int = 1,
+                 status_interval: float = 5.0):
+        self.container_client = container_client
+        self.get_video_path = get_video_path
+        self.get_video_etag = get_video_etag
+        self.columns = columns
+        self.rows = rows
+        self.tile_width = tile_width
+        self.quality = quality
+        self.status_interval = status_interval
+
+        self._jobs: Dict[Tuple[str, int], SpriteJob] = {}
+        self._jobs_lock = threading.Lock()
+        self._job_pool = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix='sprite-job')
+        self._upload_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='sprite-upload')
+
+    def sheet_dir(self, blob_name: str, stride: int) -> str:
+        return f"{blob_name}/sprites/s{stride}_w{self.tile_width}"
+
+    def sheet_name(self, blob_name: str, stride: int, sheet: int) -> str:
+        return f"{self.sheet_dir(blob_name, stride)}/sheet_{sheet:04d}.jpg"
+
+    def load_index(self, blob_name: str, stride: int) -> Optional[dict]:
+        """The sheet index, or None if the sheets were never built, or built from an older video or layout"""
+        try:
+            index = json.loads(self.container_client.get_blob_client(
+                f"{self.sheet_dir(blob_name, stride)}/index.json").download_blob().readall())
+        except ResourceNotFoundError:
+            return None
+        if index.get('videoEtag') != self.get_video_etag(blob_name) \
+                or (index.get('columns'), index.get('rows')) != (self.columns, self.rows):
+            return None
+        return index
+
+    def read_sheet(self, blob_name: str, stride: int, sheet: int) -> Optional[bytes]:
+        """A sheet's JPEG bytes, or None if it does not exist or belongs to an older version of the video"""
+        index = self.load_index(blob_name, stride)
+        if index is None or not 0 <= sheet < len(index['sheets']):
+            return None
+        try:
+            return self.container_client.get_blob_client(
+                self.sheet_name(blob_name, stride, sheet)).download_blob().readall()
+        except ResourceNotFoundError:
+            return None
+
+    def submit(self, blob_name: str, stride: int) -> SpriteJob:
+        """Queue sprite generation for a video at a stride (no-op if it is already queued or running)"""
+        key = (blob_name, stride)
+        with self._jobs_lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.done:
+                return job
+            job = SpriteJob(blob_name, stride)
+            self._jobs[key] = job
+
+        self._write_status(job)
+        self._job_pool.submit(self._run, job)
+        logger.info(f"Queued sprite sheets for {blob_name} (stride {stride})")
+        return job
+
+    def get_status(self, blob_name: str, stride: int) -> Optional[dict]:
+        """Job status from this process, falling back to the shared status blob ('interrupted' if its worker stopped)"""
+        with self._jobs_lock:
+            job = self._jobs.get((blob_name, stride))
+        if job is not None:
+            return job.to_dict()
+        try:
+            status = json.loads(self.container_client.get_blob_client(
+                f"{self.sheet_dir(blob_name, stride)}/status.json").download_blob().readall())
+        except ResourceNotFoundError:
+            return None
+        if status['status'] not in ('completed', 'failed') \
+                and time.time() - status.get('updatedAt', 0) > max(STALE_STATUS_SECONDS, 4 * self.status_interval):
+            status['status'] = 'interrupted'
+        return status
+
+    def _write_status(self, job: SpriteJob):
+        try:
+            self.container_client.get_blob_client(f"{self.sheet_dir(job.blob_name, job.stride)}/status.json") \
+                .upload_blob(json.dumps(job.to_dict()), overwrite=True)
+        except Exception as e:
+            logger.warning(f"Could not write sprite status for {job.blob_name}: {e}")
+
+    def _upload_sheet(self, job: SpriteJob, sheet: int, mosaic: np.ndarray):
+        _, buffer = cv2.imencode('.jpg', mosaic, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        self.container_client.get_blob_client(self.sheet_name(job.blob_name, job.stride, sheet)) \
+            .upload_blob(buffer.tobytes(), overwrite=True)
+        with job.lock:
+            job.sheets += 1
+
+    def _run(self, job: SpriteJob):
+        with job.lock:
+            job.status = 'running'
+            job.started_at = time.time()
+        self._write_status(job)
+
+        try:
+            video_etag = self.get_video_etag(job.blob_name)
+            cap = cv2.VideoCapture(self.get_video_path(job.blob_name))
+            with job.lock:
+                job.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            fps = cap.get(cv2.CAP_PROP_FPS)
+
+            per_sheet = self.columns * self.rows
+            tile_height = 0
+            mosaic = None
+            uploads = []
+            sheets = []
+            frame_number = 0
+            last_status = time.time()
+
+            def finish_sheet(tiles: int):
+                # A partial last sheet keeps only the rows it uses
+                used_rows = -(-tiles // self.columns)
+                image = mosaic[:used_rows * tile_height]
+                sheets.append({"sheet": len(sheets), "firstFrame": len(sheets) * per_sheet * job.stride,
+                               "tiles": tiles, "width": image.shape[1], "height": image.shape[0]})
+                uploads.append(self._upload_pool.submit(self._upload_sheet, job, len(sheets) - 1, image))
+
+            try:
+                while True:
+                    if frame_number % job.stride:
+                        if not cap.grab():
+                            break
+                    else:
+                        ret, frame = cap.read()
+                        if not ret:
+                            break
+                        if mosaic is None:
+                            height, width = frame.shape[:2]
+                            tile_height = max(2, round(height * self.tile_width / width / 2) * 2)
+                        tile = job.tiles % per_sheet
+                        if tile == 0:
+                            mosaic = np.zeros((self.rows * tile_height, self.columns * self.tile_width, 3), np.uint8)
+                        row, column = divmod(tile, self.columns)
+                        mosaic[row * tile_height:(row + 1) * tile_height,
+                               column * self.tile_width:(column + 1) * self.tile_width] = cv2.resize(
+                            frame, (self.tile_width, tile_height), interpolation=cv2.INTER_AREA)
+                        with job.lock:
+                            job.tiles += 1
+                        if tile == per_sheet - 1:
+                            finish_sheet(per_sheet)
+
+                    frame_number += 1
+                    with job.lock:
+                        job.decoded = frame_number
+                    if time.time() - last_status > self.status_interval:
+                        self._write_status(job)
+                        last_status = time.time()
+            finally:
+                cap.release()
+
+            if job.tiles % per_sheet:
+                finish_sheet(job.tiles % per_sheet)
+            for upload in uploads:
+                upload.result()
+
+            index = {
+                "blobName": job.blob_name,
+                "videoEtag": video_etag,
+                "stride": job.stride,
+                "frameCount": frame_number,
+                "fps": fps,
+                "columns": self.columns,
+                "rows": self.rows,
+                "tileWidth": self.tile_width,
+                "tileHeight": tile_height,
+                "tiles": job.tiles,
+                "sheets": sheets
+            }
+            self.container_client.get_blob_client(f"{self.sheet_dir(job.blob_name, job.stride)}/index.json") \
+                .upload_blob(json.dumps(index), overwrite=True)
+
+            with job.lock:
+                job.total_frames = frame_number
+                job.status = 'completed'
+                job.finished_at = time.time()
+            logger.info(f"Built {job.sheets} sprite sheets ({job.tiles} tiles) for {job.blob_name} "
+                        f"in {job.finished_at - job.started_at:.1f}s")
+
+        except Exception as e:
+            logger.error(f"Sprite sheet generation failed for {job.blob_name}: {e}")
+            with job.lock:
+                job.status = 'failed'
+                job.error = str(e)
+                job.finished_at = time.time()
+
+        self._write_status(job)
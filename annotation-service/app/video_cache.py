@@ -0,0 +1,267 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import stat
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATS_FILE = 'stats.json'
+INDEX_LOCK = '.index.lock'
+COUNTERS = ('hits', 'misses', 'evictions', 'bytes_downloaded', 'bytes_evicted')
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()[:24]
+
+
+def entry_name(blob_name: str, etag: str) -> str:
+    """File name for one version of a blob: blob digest, ETag digest, original extension"""
+    ext = os.path.splitext(blob_name)[1] or '.mp4'
+    return f"{_digest(blob_name)}-{_digest(etag)}{ext}"
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """Advisory lock on path, held across processes (and across threads, since each call opens its own fd)"""
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one; other callers wait for its result"""
+
+    def __init__(self):
+        self._calls: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+
+class VideoCache:
+    """
+    On-disk video cache shared by every worker process on the instance.
+
+    Entries are keyed by blob name plus ETag, so a re-uploaded blob is never
+    served stale. Loads are single-flight per entry: threads in a process
+    share one in-flight call and a per-entry file lock makes sure only one
+    worker downloads a given blob. Nothing is held across entries, so a cold
+    download never delays hits or downloads for other videos. The directory
+    is kept under a byte budget by evicting least recently used entries.
+    """
+
+    def __init__(self, container_client, cache_dir: str, max_bytes: int,
+                 download_concurrency: int = 4, revalidate_interval: int = 60,
+                 min_age: int = 60, on_evict: Optional[Callable[[str], None]] = None):
+        self.container_client = container_client
+        self.download_concurrency = download_concurrency
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.revalidate_interval = revalidate_interval
+        self.min_age = min_age  # Never evict entries used this recently
+        self.on_evict = on_evict
+
+        self._versions: Dict[str, Tuple[str, int, float]] = {}
+        self._versions_lock = threading.Lock()
+        self._flight = SingleFlight()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, blob_name: str, etag: str) -> str:
+        return os.path.join(self.cache_dir, entry_name(blob_name, etag))
+
+    def blob_version(self, blob_name: str) -> Tuple[str, int]:
+        """Current (ETag, size) of the blob, revalidated at most every revalidate_interval seconds"""
+        now = time.time()
+        with self._versions_lock:
+            cached = self._versions.get(blob_name)
+        if cached and now - cached[2] < self.revalidate_interval:
+            return cached[0], cached[1]
+
+        def revalidate():
+            properties = self.container_client.get_blob_client(blob_name).get_blob_properties()
+            version = (properties.etag.strip('"'), properties.size)
+            with self._versions_lock:
+                self._versions[blob_name] = (*version, time.time())
+            return version
+
+        return self._flight.do(f"version:{blob_name}", revalidate)
+
+    def peek(self, blob_name: str) -> Optional[str]:
+        """
+        Local path of the blob's current version if it is already cached,
+        without downloading. Called on every frame decode, so it only
+        touches the entry; hits are counted per get_path() lookup.
+        """
+        path = self._entry_path(blob_name, self.blob_version(blob_name)[0])
+        return path if self._touch(path) else None
+
+    def get_path(self, blob_name: str) -> str:
+        """Local path of the blob's current version, downloading it on a miss"""
+        path = self.peek(blob_name)
+        if path is not None:
+            self._bump(hits=1)
+            return path
+
+        path = self._entry_path(blob_name, self.blob_version(blob_name)[0])
+        return self._flight.do(path, lambda: self._load(blob_name, path))
+
+    def _load(self, blob_name: str, path: str) -> str:
+        """Download an entry, at most once across every process on the instance"""
+        with file_lock(path + '.lock'):
+            # Another worker may have finished the download while we waited
+            if self._touch(path):
+                self._bump(hits=1)
+                return path
+
+            logger.info(f"Video cache miss for {blob_name}, downloading...")
+            size = self._download(blob_name, path)
+            self._bump(misses=1, bytes_downloaded=size)
+
+        self._remove_stale_versions(blob_name, path)
+        self.evict()
+        return path
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """Mark an entry as used (mtime doubles as the LRU timestamp); False if it is not cached"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _download(self, blob_name: str, path: str) -> int:
+        """
+        Stream the blob to disk with parallel ranged GETs.
+
+        Memory stays around download_concurrency * chunk size (set by the
+        container client's max_chunk_get_size) whatever the video size.
+        """
+        part_path = f"{path}.{os.getpid()}.part"
+        try:
+            start = time.time()
+            download_stream = self.container_client.get_blob_client(blob_name).download_blob(
+                max_concurrency=self.download_concurrency)
+            with open(part_path, 'wb') as f:
+                download_stream.readinto(f)
+            os.replace(part_path, path)
+            elapsed = time.time() - start
+            size = os.path.getsize(path)
+            logger.info(
+                f"Downloaded {blob_name} ({size / (1024*1024):.1f} MB) in {elapsed:.1f}s "
+                f"({size / (1024*1024) / max(elapsed, 1e-6):.1f} MB/s)")
+        finally:
+            if os.path.exists(part_path):
+                os.unlink(part_path)
+        return size
+
+    def _entries(self):
+        """(path, size, mtime) of every complete cache entry"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('.') or name.endswith(('.lock', '.part', '.tmp')) or name == STATS_FILE:
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _remove_stale_versions(self, blob_name: str, current_path: str):
+        """Drop entries for older ETags of a blob that has been re-uploaded"""
+        prefix = os.path.join(self.cache_dir, _digest(blob_name) + '-')
+        for path, size, _ in self._entries():
+            if path.startswith(prefix) and path != current_path:
+                self._remove(path, size)
+
+    def _remove(self, path: str, size: int):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        if self.on_evict:
+            self.on_evict(path)
+        self._bump(evictions=1, bytes_evicted=size)
+        logger.info(f"Evicted cached video {os.path.basename(path)} ({size / (1024*1024):.1f} MB)")
+
+    def evict(self):
+        """Evict least recently used entries until the cache fits its byte budget"""
+        with file_lock(os.path.join(self.cache_dir, INDEX_LOCK)):
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            cutoff = time.time() - self.min_age
+
+            for path, size, mtime in entries:
+                if total <= self.max_bytes:
+                    break
+                if mtime > cutoff:
+                    continue
+                self._remove(path, size)
+                total -= size
+
+    def _bump(self, **deltas):
+        """Add to the shared counters file (all workers report into one set of counters)"""
+        stats_path = os.path.join(self.cache_dir, STATS_FILE)
+        with file_lock(stats_path + '.lock'):
+            counters = self._read_counters(stats_path)
+            for key, value in deltas.items():
+                counters[key] = counters.get(key, 0) + value
+            with open(stats_path + '.tmp', 'w') as f:
+                json.dump(counters, f)
+            os.replace(stats_path + '.tmp', stats_path)
+
+    @staticmethod
+    def _read_counters(stats_path: str) -> dict:
+        try:
+            with open(stats_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {key: 0 for key in COUNTERS}
+
+    def stats(self) -> dict:
+        counters = self._read_counters(os.path.join(self.cache_dir, STATS_FILE))
+        entries = self._entries()
+        lookups = counters.get('hits', 0) + counters.get('misses', 0)
+        return {
+            **{key: counters.get(key, 0) for key in COUNTERS},
+            "hit_ratio": round(counters.get('hits', 0) / lookups, 4) if lookups else 0,
+            "entries": len(entries),
+            "bytes_on_disk": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes
+        }
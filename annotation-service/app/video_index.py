@@ -0,0 +1,250 @@
+import base64
+import bisect
+import json
+import logging
+import shutil
+import subprocess
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from fractions import Fraction
+from typing import Callable, List, Optional, Tuple
+
+from app.mp4_index import Mp4Index
+from app.video_cache import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+INDEX_BLOB_SUFFIX = 'index.json'
+INDEX_FORMAT_VERSION = 2
+
+
+def _pack_ints(values) -> str:
+    """Delta-encode and deflate an int sequence (constant frame rates compress to a few bytes)"""
+    deltas = array('q', values)
+    for i in range(len(deltas) - 1, 0, -1):
+        deltas[i] -= deltas[i - 1]
+    return base64.b64encode(zlib.compress(deltas.tobytes())).decode()
+
+
+def _unpack_ints(packed: str) -> array:
+    values = array('q')
+    values.frombytes(zlib.decompress(base64.b64decode(packed)))
+    for i in range(1, len(values)):
+        values[i] += values[i - 1]
+    return values
+
+
+class VideoIndex:
+    """
+    Metadata for one version (ETag) of a video: what /info returns, plus
+    keyframe positions and per-frame presentation timestamps. Frame numbers
+    are in presentation order, matching OpenCV's CAP_PROP_POS_FRAMES; pts
+    are in the stream's own time base (1 / timescale).
+    """
+
+    def __init__(self, etag: str, fps: float, frame_count: int, width: int, height: int,
+                 rotation: int = 0, timescale: int = 0, pts: Optional[array] = None,
+                 keyframes: Optional[List[int]] = None, keyframe_offsets: Optional[List[int]] = None):
+        self.etag = etag
+        self.fps = fps
+        self.frame_count = frame_count
+        self.width = width
+        self.height = height
+        self.rotation = rotation
+        self.timescale = timescale
+        self.pts = pts if pts is not None else array('q')
+        self.keyframes = keyframes or []
+        self.keyframe_offsets = keyframe_offsets or []
+
+    @classmethod
+    def from_mp4(cls, etag: str, index: Mp4Index) -> 'VideoIndex':
+        width, height = index.display_size
+        # Presentation rank of every sample, so keyframes are expressed as frame numbers
+        order = sorted(range(index.sample_count), key=index.pts.__getitem__)
+        rank = array('q', bytes(8 * index.sample_count))
+        for frame, sample in enumerate(order):
+            rank[sample] = frame
+        sync = index.sync_samples or list(range(index.sample_count))
+        keyframes = sorted((rank[s], index.offsets[s]) for s in sync)
+        return cls(
+            etag=etag,
+            fps=index.fps,
+            frame_count=index.sample_count,
+            width=width,
+            height=height,
+            rotation=index.rotation,
+            timescale=index.timescale,
+            pts=array('q', (index.pts[s] for s in order)),
+            keyframes=[frame for frame, _ in keyframes],
+            keyframe_offsets=[offset for _, offset in keyframes]
+        )
+
+    @classmethod
+    def from_packets(cls, etag: str, stream: dict, packets: List[dict]) -> 'VideoIndex':
+        """Build from an ffprobe packet scan (any container ffmpeg can demux)"""
+        time_base = Fraction(stream['time_base'])
+        frames = sorted(
+            (int(p['pts']), int(p.get('pos', -1)), 'K' in p.get('flags', ''))
+            for p in packets if p.get('pts') not in (None, 'N/A')
+        )
+        rate = stream.get('avg_frame_rate', '0/1')
+        fps = float(Fraction(rate)) if rate not in ('0/0', '') else 0.0
+        rotation = 0
+        for side_data in stream.get('side_data_list', []):
+            if 'rotation' in side_data:
+                rotation = int(-float(side_data['rotation'])) % 360
+        width, height = int(stream['width']), int(stream['height'])
+        if rotation % 180:
+            width, height = height, width
+        return cls(
+            etag=etag,
+            fps=fps,
+            frame_count=len(frames),
+            width=width,
+            height=height,
+            rotation=rotation,
+            timescale=time_base.denominator if time_base.numerator == 1 else 0,
+            pts=array('q', (pts for pts, _, _ in frames)),
+            keyframes=[i for i, (_, _, key) in enumerate(frames) if key],
+            keyframe_offsets=[pos for _, pos, key in frames if key]
+        )
+
+    @property
+    def seekable(self) -> bool:
+        """True when frames can be located by keyframe + pts rather than OpenCV's frame-number seek"""
+        return bool(self.keyframes) and len(self.pts) == self.frame_count > 0
+
+    @property
+    def duration(self) -> float:
+        return self.frame_count / self.fps if self.fps > 0 else 0
+
+    def info(self) -> dict:
+        return {
+            "fps": self.fps,
+            "frameCount": self.frame_count,
+            "duration": self.duration,
+            "width": self.width,
+            "height": self.height
+        }
+
+    def timestamp(self, frame_number: int) -> float:
+        """Presentation time of a frame in seconds"""
+        if self.timescale and frame_number < len(self.pts):
+            return (self.pts[frame_number] - self.pts[0]) / self.timescale
+        return frame_number / self.fps if self.fps > 0 else 0
+
+    def keyframe_before(self, frame_number: int) -> Tuple[int, int]:
+        """(frame number, byte offset) of the last keyframe at or before frame_number; offset -1 if unknown"""
+        if not self.keyframes:
+            return 0, -1
+        i = max(bisect.bisect_right(self.keyframes, frame_number) - 1, 0)
+        offset = self.keyframe_offsets[i] if i < len(self.keyframe_offsets) else -1
+        return self.keyframes[i], offset
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "formatVersion": INDEX_FORMAT_VERSION,
+            "etag": self.etag,
+            **self.info(),
+            "rotation": self.rotation,
+            "timescale": self.timescale,
+            "pts": _pack_ints(self.pts),
+            "keyframes": _pack_ints(self.keyframes),
+            "keyframeOffsets": _pack_ints(self.keyframe_offsets)
+        })
+
+    @classmethod
+    def from_json(cls, data: str) -> Optional['VideoIndex']:
+        record = json.loads(data)
+        if record.get('formatVersion') != INDEX_FORMAT_VERSION:
+            return None
+        return cls(
+            etag=record['etag'],
+            fps=record['fps'],
+            frame_count=record['frameCount'],
+            width=record['width'],
+            height=record['height'],
+            rotation=record['rotation'],
+            timescale=record['timescale'],
+            pts=_unpack_ints(record['pts']),
+            keyframes=list(_unpack_ints(record['keyframes'])),
+            keyframe_offsets=list(_unpack_ints(record['keyframeOffsets']))
+        )
+
+
+def probe_packets(path: str, etag: str) -> Optional[VideoIndex]:
+    """Packet-level scan of the first video stream with ffprobe; None if ffprobe is unavailable"""
+    if not shutil.which('ffprobe'):
+        return None
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'stream=width,height,time_base,avg_frame_rate:stream_side_data=rotation'
+         ':packet=pts,pos,flags',
+         '-of', 'json', path],
+        capture_output=True, check=True, text=True)
+    data = json.loads(result.stdout)
+    if not data.get('streams'):
+        return None
+    return VideoIndex.from_packets(etag, data['streams'][0], data.get('packets', []))
+
+
+class VideoIndexStore:
+    """
+    Persists VideoIndex records as sidecar blobs in the frames container,
+    with an in-process LRU in front. A record is only trusted while its ETag
+    matches the video's current one, so re-uploads are probed again.
+    Loads are single-flight per video version, so concurrent cold requests
+    share one sidecar read and at most one probe.
+    """
+
+    def __init__(self, frames_container_client, get_etag: Callable[[str], str],
+                 probe: Callable[[str, str], VideoIndex], max_memory_entries: int = 256):
+        self.frames_container_client = frames_container_client
+        self.get_etag = get_etag
+        self.probe = probe
+        self.max_memory_entries = max_memory_entries
+        self._memory: "OrderedDict[str, VideoIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def _blob_client(self, blob_name: str):
+        return self.frames_container_client.get_blob_client(f"{blob_name}/{INDEX_BLOB_SUFFIX}")
+
+    def _remember(self, blob_name: str, index: VideoIndex):
+        with self._lock:
+            self._memory[blob_name] = index
+            self._memory.move_to_end(blob_name)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, blob_name: str) -> VideoIndex:
+        """Index for the video's current version, probing and persisting it on first use"""
+        etag = self.get_etag(blob_name)
+
+        with self._lock:
+            index = self._memory.get(blob_name)
+        if index is not None and index.etag == etag:
+            return index
+
+        return self._flight.do(f"{blob_name}@{etag}", lambda: self._load(blob_name, etag))
+
+    def _load(self, blob_name: str, etag: str) -> VideoIndex:
+        blob_client = self._blob_client(blob_name)
+        try:
+            index = VideoIndex.from_json(blob_client.download_blob().readall())
+        except Exception:
+            index = None  # Missing or unreadable sidecar: probe again
+
+        if index is None or index.etag != etag:
+            logger.info(f"Probing video metadata for {blob_name}")
+            index = self.probe(blob_name, etag)
+            blob_client.upload_blob(index.to_json(), overwrite=True)
+
+        self._remember(blob_name, index)
+        return index
+
+    def invalidate(self, blob_name: str):
+        with self._lock:
+            self._memory.pop(blob_name, None)
@@ -0,0 +1,104 @@
+"""
+Annotation storage formats: size and parse time.
+
+Builds a synthetic video's annotations (default 100k boxes over 30k
+frames) and compares the pretty-printed JSON the service used to store,
+compact JSON, and the columnar binary shard format of
+app.annotation_format. Reports stored size (raw and gzip), encode time,
+parse time (to columns and back to the JSON `frames` dict), and YOLO
+export time from each.
+
+Usage (from annotation-service/):
+    python benchmarks/bench_annotation_format.py --boxes 100000 --frames 30000
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+
+import common  # noqa: F401 (puts app/ on the path)
+from app.annotation_format import (columns_from_frames, columns_to_frames, decode_columns,
+                                   encode_columns, yolo_rows, yolo_text)
+
+WIDTH, HEIGHT = 1920, 1080
+
+
+def make_frames(boxes, frames, seed=0):
+    rng = random.Random(seed)
+    document = {}
+    for _ in range(boxes):
+        width, height = rng.uniform(8, 400), rng.uniform(8, 400)
+        document.setdefault(str(rng.randrange(frames)), {"objects": []})["objects"].append({
+            "class_id": rng.randrange(10),
+            "bbox": {"x": rng.uniform(0, WIDTH - width), "y": rng.uniform(0, HEIGHT - height),
+                     "width": width, "height": height}
+        })
+    return document
+
+
+def yolo_from_dict(document):
+    """The export loop the service used before columns"""
+    lines = []
+    for frame_data in document['frames'].values():
+        for obj in frame_data.get('objects', []):
+            bbox = obj['bbox']
+            lines.append(f"{obj.get('class_id', 0)} {(bbox['x'] + bbox['width'] / 2) / WIDTH} "
+                         f"{(bbox['y'] + bbox['height'] / 2) / HEIGHT} "
+                         f"{bbox['width'] / WIDTH} {bbox['height'] / HEIGHT}")
+    return '\n'.join(lines).encode()
+
+
+def yolo_from_columns(columns):
+    return yolo_text(yolo_rows(columns, WIDTH, HEIGHT))
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--boxes', type=int, default=100_000)
+    parser.add_argument('--frames', type=int, default=30_000)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement (best is reported)')
+    args = parser.parse_args()
+
+    frames = make_frames(args.boxes, args.frames)
+    document = {"video_width": WIDTH, "video_height": HEIGHT, "frames": frames}
+    print(f"{args.boxes} boxes on {len(frames)} annotated frames (best of {args.repeat})\n")
+
+    formats = {
+        'json (indent=2)': (lambda: json.dumps(document, indent=2).encode(), json.loads),
+        'json (compact)': (lambda: json.dumps(document, separators=(',', ':')).encode(), json.loads),
+        'binary': (lambda: encode_columns(columns_from_frames(frames)), decode_columns),
+    }
+
+    print(f"{'format':>16} {'size MB':>8} {'gzip MB':>8} {'encode ms':>10} {'parse ms':>9} "
+          f"{'to dict ms':>11} {'export ms':>10}")
+    for name, (encode, parse) in formats.items():
+        encode_time, data = timed(encode, args.repeat)
+        parse_time, parsed = timed(lambda: parse(data), args.repeat)
+        if name == 'binary':
+            dict_time, _ = timed(lambda: columns_to_frames(decode_columns(data)), args.repeat)
+            export_time, _ = timed(lambda: yolo_from_columns(decode_columns(data)), args.repeat)
+        else:
+            dict_time = parse_time
+            export_time, _ = timed(lambda: yolo_from_dict(json.loads(data)), args.repeat)
+        print(f"{name:>16} {len(data) / 1e6:8.2f} {len(gzip.compress(data)) / 1e6:8.2f} "
+              f"{encode_time * 1000:10.1f} {parse_time * 1000:9.1f} {dict_time * 1000:11.1f} "
+              f"{export_time * 1000:10.1f}")
+
+    # Round trip: the binary shard gives back exactly the frames it was built from
+    restored = columns_to_frames(decode_columns(encode_columns(columns_from_frames(frames))))
+    assert restored == frames
+    print("\nRound trip OK (identical frames dict)")
+
+
+if __name__ == '__main__':
+    main()
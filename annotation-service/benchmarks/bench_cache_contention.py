@@ -0,0 +1,89 @@
+"""
+Video cache contention load test.
+
+Starts a cold download of a large video A (throttled in-process stand-in
+storage) and, while it runs, measures cache-hit latency for an unrelated,
+already cached video B from several threads. With per-key single-flight B's
+latency stays flat; --baseline emulates the old global cache_lock held for
+the whole download for comparison.
+
+Usage (from annotation-service/):
+    python benchmarks/bench_cache_contention.py --size-mb 512 --rate-mb 64
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from common import StandInContainer
+from app.video_cache import VideoCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=512, help='size of the cold video A')
+    parser.add_argument('--rate-mb', type=int, default=64, help='stand-in download rate (MB/s)')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--baseline', action='store_true', help='emulate a global lock held during downloads')
+    args = parser.parse_args()
+
+    container = StandInContainer({
+        'raw-videos/bench/a.mp4': os.urandom(args.size_mb * 1024 * 1024),
+        'raw-videos/bench/b.mp4': os.urandom(8 * 1024 * 1024),
+    }, bytes_per_sec=args.rate_mb * 1024 * 1024)
+
+    cache_dir = tempfile.mkdtemp()
+    cache = VideoCache(container, cache_dir, max_bytes=4 * args.size_mb * 1024 * 1024)
+    global_lock = threading.Lock()
+
+    def get_path(blob_name):
+        if args.baseline:
+            with global_lock:
+                return cache.get_path(blob_name)
+        return cache.get_path(blob_name)
+
+    get_path('raw-videos/bench/b.mp4')  # Warm B
+
+    latencies = []
+    downloading = threading.Event()
+    downloading.set()
+
+    def hit_worker():
+        while downloading.is_set():
+            start = time.perf_counter()
+            get_path('raw-videos/bench/b.mp4')
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    def cold_download():
+        get_path('raw-videos/bench/a.mp4')
+        downloading.clear()
+
+    cold = threading.Thread(target=cold_download)
+    cold.start()
+    time.sleep(0.05)  # Let A take its locks first
+    workers = [threading.Thread(target=hit_worker) for _ in range(args.threads)]
+    for w in workers:
+        w.start()
+
+    start = time.perf_counter()
+    cold.join()
+    download_time = time.perf_counter() - start
+    for w in workers:
+        w.join()
+
+    latencies.sort()
+    ms = [latency * 1000 for latency in latencies]
+    print(f"mode={'global-lock' if args.baseline else 'single-flight'} "
+          f"A download={download_time:.1f}s B hits={len(ms)}")
+    print(f"B hit latency ms: p50={statistics.median(ms):.2f} "
+          f"p99={ms[int(len(ms) * 0.99) - 1]:.2f} max={ms[-1]:.2f}")
+
+    shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+/api/projects: container listing vs. the project catalog.
+
+For several project sizes, compares what the endpoint used to do (list
+every blob under raw-videos/ and group them, against an in-process
+container whose listing returns 5000 blobs per page with a fixed
+round-trip latency) with ProjectCatalog: loading the catalog blob once,
+then serving a page (default 200 videos), a single project's page and a
+filtered page from memory, and recording one upload.
+
+Usage (from annotation-service/):
+    python benchmarks/bench_catalog.py --videos 1000 10000 100000 --page-latency-ms 40
+"""
+import argparse
+import time
+import types
+from datetime import datetime, timedelta, timezone
+
+import common  # noqa: F401 (puts app/ on the path)
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from app.project_catalog import ProjectCatalog, project_of
+
+LIST_PAGE_SIZE = 5000  # Most results Blob Storage returns per listing call
+VIDEOS_PER_PROJECT = 50
+
+
+class _StandInBlob:
+    def __init__(self, container, name):
+        self.container = container
+        self.name = name
+
+    def download_blob(self):
+        if self.name not in self.container.documents:
+            raise ResourceNotFoundError(self.name)
+        data, etag = self.container.documents[self.name]
+        return types.SimpleNamespace(readall=lambda: data, properties=types.SimpleNamespace(etag=etag))
+
+    def get_blob_properties(self):
+        return self.download_blob().properties
+
+    def upload_blob(self, data, overwrite=False, etag=None, match_condition=None):
+        current = self.container.documents.get(self.name)
+        if match_condition == MatchConditions.IfMissing and current is not None:
+            raise ResourceExistsError(self.name)
+        if match_condition == MatchConditions.IfNotModified and (current is None or current[1] != etag):
+            raise ResourceModifiedError(self.name)
+        self.container.version += 1
+        self.container.documents[self.name] = (data, f'"{self.container.version}"')
+        return {"etag": f'"{self.container.version}"'}
+
+
+class StandInVideos:
+    """Videos container stand-in: paged listings with a round-trip latency, plus the catalog blob"""
+
+    def __init__(self, count, page_latency):
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        self.videos = sorted(
+            (types.SimpleNamespace(name=f"raw-videos/project{i // VIDEOS_PER_PROJECT:05d}/{i:07d}_clip.mp4",
+                                   size=250_000_000 + i, last_modified=start + timedelta(seconds=i))
+             for i in range(count)),
+            key=lambda blob: blob.name)
+        self.page_latency = page_latency
+        self.documents = {}
+        self.version = 0
+
+    def list_blobs(self, name_starts_with=''):
+        for offset in range(0, len(self.videos), LIST_PAGE_SIZE):
+            time.sleep(self.page_latency)
+            yield from (blob for blob in self.videos[offset:offset + LIST_PAGE_SIZE]
+                        if blob.name.startswith(name_starts_with))
+
+    def get_blob_client(self, name):
+        return _StandInBlob(self, name)
+
+
+def list_and_group(container):
+    """The listing and grouping /api/projects used to do on every call"""
+    projects = {}
+    for blob in container.list_blobs(name_starts_with='raw-videos/'):
+        projects.setdefault(project_of(blob.name), []).append({
+            'fileName': blob.name.split('/')[-1],
+            'blobName': blob.name,
+            'size': blob.size,
+            'lastModified': blob.last_modified.isoformat()
+        })
+    return [{"name": name, "videos": videos} for name, videos in projects.items()]
+
+
+def timed_ms(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', type=int, nargs='+', default=[1000, 10_000, 100_000])
+    parser.add_argument('--page-latency-ms', type=float, default=40, help='round trip per listing page')
+    parser.add_argument('--limit', type=int, default=200, help='videos per /api/projects page')
+    args = parser.parse_args()
+
+    print(f"{'videos':>8} {'listing ms':>11} {'catalog KB':>11} {'load ms':>8} {'page ms':>8} "
+          f"{'project ms':>11} {'search ms':>10} {'upload ms':>10}")
+    for count in args.videos:
+        container = StandInVideos(count, args.page_latency_ms / 1000)
+        listing = timed_ms(lambda: list_and_group(container), repeat=1)
+
+        ProjectCatalog(container).reconcile()  # Builds the catalog blob
+        catalog_kb = len(container.documents['catalog/videos.json'][0]) / 1024
+        load = timed_ms(lambda: ProjectCatalog(container, reconcile_interval=0).query(limit=args.limit), repeat=3)
+
+        catalog = ProjectCatalog(container, refresh_interval=3600, reconcile_interval=0)
+        catalog.query()
+        middle = container.videos[count // 2]
+        page = timed_ms(lambda: catalog.query(limit=args.limit, cursor=middle.name))
+        project = timed_ms(lambda: catalog.query(project=project_of(middle.name), limit=args.limit))
+        search = timed_ms(lambda: catalog.query(search='9_clip', limit=args.limit))
+
+        def upload():
+            catalog.put(types.SimpleNamespace(name='raw-videos/new/clip.mp4', size=1,
+                                              last_modified=datetime.now(timezone.utc)))
+            catalog.flush()
+        recorded = timed_ms(upload, repeat=3)
+
+        print(f"{count:8d} {listing:11.1f} {catalog_kb:11.1f} {load:8.1f} {page:8.2f} "
+              f"{project:11.2f} {search:10.2f} {recorded:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Frame extraction benchmark: per-request seek vs. DecoderPool sessions.
+
+Generates a synthetic video locally (re-encoded as long-GOP H.264 when ffmpeg
+is on PATH) and reports frames/sec for sequential, random and backwards
+access patterns.
+
+Usage (from annotation-service/):
+    python benchmarks/bench_decoder.py --frames 600 --gop 250
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import cv2
+
+from common import make_video
+from app.frame_decoder import DecoderPool
+
+
+def read_per_request(path, frame_number):
+    """Baseline: the original open/seek/read/release per frame"""
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+    ret, frame = cap.read()
+    cap.release()
+    return frame if ret else None
+
+
+def run(label, reader, order):
+    start = time.perf_counter()
+    for n in order:
+        if reader(n) is None:
+            raise RuntimeError(f"{label}: failed to read frame {n}")
+    elapsed = time.perf_counter() - start
+    return len(order) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--gop', type=int, default=250)
+    parser.add_argument('--samples', type=int, default=150)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'bench.mp4')
+    make_video(path, args.frames, args.width, args.height, args.fps, args.gop)
+
+    samples = min(args.samples, args.frames)
+    rng = random.Random(42)
+    patterns = {
+        'sequential': list(range(samples)),
+        'random': [rng.randrange(args.frames) for _ in range(samples)],
+        'backwards': list(range(args.frames - 1, args.frames - 1 - samples, -1)),
+    }
+
+    print(f"{'pattern':<12}{'per-request fps':>18}{'pool fps':>12}{'speedup':>10}")
+    for name, order in patterns.items():
+        baseline = run(name, lambda n: read_per_request(path, n), order)
+        pool = DecoderPool()
+        pooled = run(name, lambda n: pool.read_frame(path, n), order)
+        pool.close_video(path)
+        print(f"{name:<12}{baseline:>18.1f}{pooled:>12.1f}{pooled / baseline:>9.1f}x")
+
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
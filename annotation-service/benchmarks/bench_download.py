@@ -0,0 +1,95 @@
+"""
+Video download benchmark: readall() into memory vs. streamed ranged download.
+
+Uploads a random blob of --size-mb to a local Azurite stand-in, then
+downloads it into a VideoCache in a fresh process per mode and reports
+throughput and peak RSS. Start Azurite first (see docs/development.md).
+
+Usage (from annotation-service/):
+    python benchmarks/bench_download.py --size-mb 1024 --chunk-mb 8 --concurrency 4
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from common import blob_service_client, ensure_container
+
+BLOB_NAME = 'raw-videos/bench/download-bench.bin'
+
+
+def upload_fixture(size_mb):
+    container = ensure_container(blob_service_client(), 'videos')
+    blob = container.get_blob_client(BLOB_NAME)
+    if blob.exists() and blob.get_blob_properties().size == size_mb * 1024 * 1024:
+        return
+
+    def chunks():
+        for _ in range(size_mb):
+            yield os.urandom(1024 * 1024)
+    blob.upload_blob(chunks(), length=size_mb * 1024 * 1024, overwrite=True, max_concurrency=4)
+
+
+def run_mode(mode, chunk_mb, concurrency, results):
+    from azure.storage.blob import BlobServiceClient
+    from common import AZURITE_CONNECTION_STRING
+    from app.video_cache import VideoCache
+
+    chunk = chunk_mb * 1024 * 1024
+    service = BlobServiceClient.from_connection_string(
+        os.getenv('BENCH_STORAGE_CONNECTION_STRING', AZURITE_CONNECTION_STRING),
+        max_single_get_size=chunk, max_chunk_get_size=chunk)
+    container = service.get_container_client('videos')
+    cache_dir = tempfile.mkdtemp()
+    cache = VideoCache(container, cache_dir, max_bytes=1 << 40, download_concurrency=concurrency)
+
+    if mode == 'readall':
+        # Previous behaviour: buffer the whole blob before writing it out
+        def download_readall(blob_name, path):
+            data = container.get_blob_client(blob_name).download_blob().readall()
+            with open(path, 'wb') as f:
+                f.write(data)
+            return len(data)
+        cache._download = download_readall
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    path = cache.get_path(BLOB_NAME)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+
+    results[mode] = {
+        'mb_per_s': os.path.getsize(path) / (1024 * 1024) / elapsed,
+        'peak_rss_mb': peak / 1024,
+        'rss_growth_mb': (peak - rss_before) / 1024,
+    }
+    shutil.rmtree(cache_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=1024)
+    parser.add_argument('--chunk-mb', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    upload_fixture(args.size_mb)
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Manager().dict()
+    for mode in ('readall', 'streaming'):
+        p = ctx.Process(target=run_mode, args=(mode, args.chunk_mb, args.concurrency, results))
+        p.start()
+        p.join()
+
+    print(f"{args.size_mb} MB blob, {args.chunk_mb} MB chunks, concurrency {args.concurrency}")
+    print(f"{'mode':<12}{'MB/s':>10}{'peak RSS MB':>14}{'RSS growth MB':>16}")
+    for mode, r in results.items():
+        print(f"{mode:<12}{r['mb_per_s']:>10.1f}{r['peak_rss_mb']:>14.1f}{r['rss_growth_mb']:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Frame resize/encode throughput vs. worker process count.
+
+Decodes a synthetic 1080p video once, then resizes and JPEG-encodes its
+frames repeatedly: first inline on request-style threads (workers 0, what
+the service did before), then through FrameProcessPool with shared-memory
+hand-off at each worker count. Reports frames/sec for each setting.
+
+Usage (from annotation-service/):
+    python benchmarks/bench_encode_workers.py --frames 60 --encodes 1200 --workers 0 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import make_video
+from app.frame_workers import FrameProcessPool
+
+MAX_WIDTH = 1280
+
+
+def decode_all(path, frames):
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    decoded = []
+    while len(decoded) < frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        decoded.append(frame)
+    cap.release()
+    return decoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=60, help='distinct decoded frames kept in memory')
+    parser.add_argument('--encodes', type=int, default=1200, help='encodes per setting')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=16, help='concurrent callers (request threads)')
+    parser.add_argument('--shm-mb', type=int, default=24, help='shared memory budget per pool (FRAME_SHM_MB)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.mp4')
+        make_video(path, args.frames)
+        frames = decode_all(path, args.frames)
+
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}, "
+          f"{args.encodes} encodes from {args.threads} threads, {os.cpu_count()} CPUs")
+
+    for workers in args.workers:
+        pool = FrameProcessPool(workers=workers, max_shm_bytes=args.shm_mb * 1024 * 1024)
+        pool.encode(frames[0], MAX_WIDTH)  # Start processes outside the timed run
+        slots = pool.stats()['slots']
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as callers:
+            sizes = list(callers.map(lambda i: len(pool.encode(frames[i % len(frames)], MAX_WIDTH)),
+                                     range(args.encodes)))
+        elapsed = time.perf_counter() - start
+        pool.close()
+
+        label = 'inline' if workers == 0 else f"{workers} proc"
+        print(f"{label:>8}: {args.encodes / elapsed:8.1f} frames/s  "
+              f"(avg {sum(sizes) / len(sizes) / 1024:.0f} KB, {slots} shared slots)")
+
+
+if __name__ == '__main__':
+    main()
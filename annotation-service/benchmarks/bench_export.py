@@ -0,0 +1,83 @@
+"""
+Project dataset export: throughput and memory.
+
+Builds a synthetic project (default 500k boxes over 10 videos, 5 boxes per
+annotated frame) held as columns in memory, and streams it through
+DatasetExporter as tar and zip, with and without frame images (stand-in
+JPEG bytes from an in-process reader with a fixed per-read latency). The
+archive is discarded as it is produced; the peak RSS growth during each
+run shows whether memory stays flat in the size of the export.
+
+Usage (from annotation-service/):
+    python benchmarks/bench_export.py --boxes 500000 --videos 10 --image-kb 40 --read-latency-ms 5
+"""
+import argparse
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import common  # noqa: F401 (puts app/ on the path)
+from app.annotation_format import FrameColumns
+from app.dataset_export import DatasetExporter
+
+WIDTH, HEIGHT = 1920, 1080
+BOXES_PER_FRAME = 5
+
+
+def make_columns(boxes, seed):
+    rng = np.random.default_rng(seed)
+    frames = np.arange(0, boxes // BOXES_PER_FRAME * 2, 2, dtype=np.int32)
+    sizes = rng.uniform(8, 400, (len(frames) * BOXES_PER_FRAME, 2))
+    origins = rng.uniform(0, 1, sizes.shape) * ([WIDTH, HEIGHT] - sizes)
+    return FrameColumns(frames, np.full(len(frames), BOXES_PER_FRAME, np.int32),
+                        rng.integers(0, 10, len(sizes)).astype(np.int32),
+                        np.hstack([origins, sizes]).astype(np.float32))
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--boxes', type=int, default=500_000)
+    parser.add_argument('--videos', type=int, default=10)
+    parser.add_argument('--image-kb', type=int, default=40, help='size of each stand-in frame image')
+    parser.add_argument('--read-latency-ms', type=float, default=5, help='simulated frame read latency')
+    parser.add_argument('--io-workers', type=int, default=16)
+    args = parser.parse_args()
+
+    videos = [f"raw-videos/bench/video_{i}.mp4" for i in range(args.videos)]
+    columns = {video: make_columns(args.boxes // args.videos, i) for i, video in enumerate(videos)}
+    image = b'\xff\xd8' + bytes(args.image_kb * 1024)
+
+    def read_frame(blob_name, frame_number):
+        time.sleep(args.read_latency_ms / 1000)
+        return image
+
+    exporter = DatasetExporter(
+        list_videos=lambda project: videos,
+        load_columns=lambda blob_name: ({"video_width": WIDTH, "video_height": HEIGHT}, columns[blob_name]),
+        load_classes=lambda project: [{"id": i, "name": f"class_{i}"} for i in range(10)],
+        read_frame=read_frame,
+        exports_container_client=None,
+        sign_url=None,
+        io_pool=ThreadPoolExecutor(max_workers=args.io_workers)
+    )
+
+    print(f"{args.boxes} boxes on {sum(len(c.frames) for c in columns.values())} frames "
+          f"in {args.videos} videos\n")
+    print(f"{'archive':>8} {'images':>7} {'seconds':>8} {'MB':>9} {'MB/s':>7} {'boxes/s':>10} {'RSS +MB':>8}")
+    for archive, images in [('tar', False), ('zip', False), ('tar', True), ('zip', True)]:
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        total = sum(len(chunk) for chunk in exporter.stream('bench', archive, images))
+        elapsed = time.perf_counter() - start
+        print(f"{archive:>8} {str(images):>7} {elapsed:8.2f} {total / 1e6:9.1f} {total / 1e6 / elapsed:7.1f} "
+              f"{args.boxes / elapsed:10.0f} {peak_rss_mb() - rss_before:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
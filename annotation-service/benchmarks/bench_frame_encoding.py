@@ -0,0 +1,81 @@
+"""
+Bytes per frame and encode time for each frame variant: resolution tier
+(thumbnail, standard, full) x format (JPEG, WebP, AVIF).
+
+Decodes frames from a synthetic 1080p video (or --video, a real clip gives
+more representative sizes), then encodes every frame in every variant the
+local OpenCV/Pillow build supports, with the tier widths and qualities the
+service uses. Reports mean KB and ms per frame, and size relative to the
+standard JPEG the service always produced.
+
+Usage (from annotation-service/):
+    python benchmarks/bench_frame_encoding.py --frames 30
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import make_video
+from app.frame_decoder import encodable_formats, encode_image
+from app.frame_variants import FORMATS, TIERS, FrameVariants
+
+STANDARD_WIDTH = 1280
+STANDARD_QUALITY = 85
+
+
+def decode_frames(path, frames):
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    decoded = []
+    while len(decoded) < frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        decoded.append(frame)
+    cap.release()
+    return decoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=30)
+    parser.add_argument('--video', help='encode frames of this file instead of a synthetic video')
+    parser.add_argument('--thumbnail-width', type=int, default=320)
+    args = parser.parse_args()
+
+    if args.video:
+        frames = decode_frames(args.video, args.frames)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.mp4')
+            make_video(path, args.frames)
+            frames = decode_frames(path, args.frames)
+
+    available = encodable_formats()
+    variants = FrameVariants(STANDARD_WIDTH, STANDARD_QUALITY, args.thumbnail_width,
+                             formats=list(FORMATS), encodable=available)
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}; "
+          f"formats without an encoder here: {', '.join(sorted(set(FORMATS) - set(available))) or 'none'}")
+    print(f"{'tier':<10} {'format':<6} {'width':>6} {'quality':>8} {'KB/frame':>9} {'ms/frame':>9} {'vs std JPEG':>12}")
+
+    standard = variants.standard
+    baseline = sum(len(encode_image(frame, standard.max_width, standard.quality))
+                   for frame in frames) / len(frames) / 1024
+    for tier in TIERS:
+        for fmt in FORMATS:
+            if fmt not in available:
+                continue
+            variant = variants.variant(tier, fmt)
+            encode_image(frames[0], variant.max_width, variant.quality, fmt)  # Warm up the codec
+            start = time.perf_counter()
+            size = sum(len(encode_image(frame, variant.max_width, variant.quality, fmt)) for frame in frames)
+            elapsed = time.perf_counter() - start
+            kb = size / len(frames) / 1024
+            print(f"{tier:<10} {fmt:<6} {variant.max_width or frames[0].shape[1]:6d} {variant.quality:8d} "
+                  f"{kb:9.1f} {elapsed / len(frames) * 1000:9.2f} {kb / baseline:11.2f}x")
+
+
+if __name__ == '__main__':
+    main()
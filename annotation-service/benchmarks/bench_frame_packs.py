@@ -0,0 +1,170 @@
+"""
+Storage transactions per annotated minute: one blob per frame vs. frame packs.
+
+Replays one minute of annotation against an in-process frames container
+that counts requests by kind. The minute covers:
+- pre-extracting the minute of video;
+- stepping through every frame (single-frame GETs, plus the prefetch
+  existence check for the frame entering the lookahead window; frames
+  already prefetched are in the hot cache);
+- loading the same frames in /frames batch windows;
+- one retention listing and delete of the minute's frames.
+
+The per-frame side issues the requests main.py makes without FRAME_PACKS.
+The pack side runs FramePackStore from a cold header cache.
+
+Usage (from annotation-service/):
+    python benchmarks/bench_frame_packs.py --fps 30 --window 30 --pack-size 256
+"""
+import argparse
+import types
+from collections import Counter
+
+import common  # noqa: F401 (puts app/ on the path)
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+from app.frame_packs import FramePackStore
+
+VIDEO = 'raw-videos/bench/clip.mp4'
+LIST_PAGE_SIZE = 5000  # Most results Blob Storage returns per listing call
+DELETE_BATCH_SIZE = 256
+
+
+class _StandInBlob:
+    def __init__(self, container, name):
+        self.container = container
+        self.name = name
+
+    def exists(self):
+        self.container.requests['HEAD'] += 1
+        return self.name in self.container.blobs
+
+    def download_blob(self, offset=None, length=None, etag=None, match_condition=None):
+        self.container.requests['GET'] += 1
+        if self.name not in self.container.blobs:
+            raise ResourceNotFoundError(self.name)
+        data, blob_etag = self.container.blobs[self.name][:2]
+        if match_condition == MatchConditions.IfNotModified and etag != blob_etag:
+            raise ResourceModifiedError(self.name)
+        if offset is not None:
+            data = data[offset:offset + length]
+        self.container.bytes_read += len(data)
+        return types.SimpleNamespace(readall=lambda: data, properties=types.SimpleNamespace(etag=blob_etag))
+
+    def upload_blob(self, data, overwrite=False, metadata=None):
+        self.container.requests['PUT'] += 1
+        self.container.version += 1
+        self.container.blobs[self.name] = (bytes(data), f'"{self.container.version}"', metadata or {})
+        return {"etag": f'"{self.container.version}"'}
+
+
+class CountingFrames:
+    """Frames container stand-in that counts requests (a blob batch counts once)"""
+
+    def __init__(self):
+        self.blobs = {}
+        self.version = 0
+        self.requests = Counter()
+        self.bytes_read = 0
+
+    def get_blob_client(self, name):
+        return _StandInBlob(self, name)
+
+    def list_blobs(self, name_starts_with=''):
+        names = sorted(name for name in self.blobs if name.startswith(name_starts_with))
+        self.requests['LIST'] += max(1, -(-len(names) // LIST_PAGE_SIZE))
+        return [types.SimpleNamespace(name=name, size=len(self.blobs[name][0])) for name in names]
+
+    def delete_blobs(self, *names):
+        self.requests['BATCH'] += 1
+        for name in names:
+            self.blobs.pop(name, None)
+
+
+def frame_bytes(n, size):
+    return n.to_bytes(4, 'little') * (size // 4)
+
+
+def per_frame_minute(frames, frame_size, window, lookahead):
+    container = CountingFrames()
+    phases = {}
+
+    def phase(name):
+        phases[name] = sum(container.requests.values()) - sum(phases.values())
+
+    for n in range(frames):
+        container.get_blob_client(f"{VIDEO}/frame_{n:06d}.jpg").upload_blob(frame_bytes(n, frame_size))
+    phase('ingest')
+    for n in range(frames):
+        container.get_blob_client(f"{VIDEO}/frame_{n:06d}.jpg").download_blob().readall()
+        if n + lookahead < frames:
+            container.get_blob_client(f"{VIDEO}/frame_{n + lookahead:06d}.jpg").exists()
+    phase('step')
+    for start in range(0, frames, window):
+        for n in range(start, min(start + window, frames)):
+            container.get_blob_client(f"{VIDEO}/frame_{n:06d}.jpg").download_blob().readall()
+    phase('batches')
+    names = [blob.name for blob in container.list_blobs(f"{VIDEO}/")]
+    for start in range(0, len(names), DELETE_BATCH_SIZE):
+        container.delete_blobs(*names[start:start + DELETE_BATCH_SIZE])
+    phase('retention')
+    return phases, container
+
+
+def packed_minute(frames, frame_size, window, lookahead, pack_size):
+    container = CountingFrames()
+    phases = {}
+
+    def phase(name):
+        phases[name] = sum(container.requests.values()) - sum(phases.values())
+
+    writer = FramePackStore(container, pack_size=pack_size)
+    for index in range(-(-frames // pack_size)):
+        writer.write_pack(VIDEO, index, {n: frame_bytes(n, frame_size)
+                                         for n in range(index * pack_size, min((index + 1) * pack_size, frames))})
+    phase('ingest')
+    reader = FramePackStore(container, pack_size=pack_size)  # Another process: cold header cache
+    for n in range(frames):
+        reader.read_frame(VIDEO, n)
+        if n + lookahead < frames:
+            reader.contains(VIDEO, n + lookahead)
+    phase('step')
+    reader = FramePackStore(container, pack_size=pack_size)
+    for start in range(0, frames, window):
+        reader.read_frames(VIDEO, range(start, min(start + window, frames)))
+    phase('batches')
+    names = [blob.name for blob in container.list_blobs(f"{VIDEO}/")]
+    for start in range(0, len(names), DELETE_BATCH_SIZE):
+        container.delete_blobs(*names[start:start + DELETE_BATCH_SIZE])
+    phase('retention')
+    return phases, container
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--window', type=int, default=30, help='frames per /frames batch')
+    parser.add_argument('--lookahead', type=int, default=10, help='prefetch window ahead of the current frame')
+    parser.add_argument('--pack-size', type=int, default=256)
+    parser.add_argument('--frame-kb', type=int, default=90, help='average JPEG size')
+    args = parser.parse_args()
+
+    frames = args.fps * 60
+    frame_size = args.frame_kb * 1024
+    per_frame, per_frame_container = per_frame_minute(frames, frame_size, args.window, args.lookahead)
+    packed, packed_container = packed_minute(frames, frame_size, args.window, args.lookahead, args.pack_size)
+
+    print(f"One annotated minute: {frames} frames at {args.fps} fps, {args.frame_kb} KB per frame, "
+          f"{args.pack_size}-frame packs")
+    print(f"{'phase':<12} {'per-frame':>10} {'packs':>8} {'ratio':>8}")
+    for name in per_frame:
+        print(f"{name:<12} {per_frame[name]:10d} {packed[name]:8d} {per_frame[name] / max(packed[name], 1):7.1f}x")
+    total_per_frame, total_packed = sum(per_frame.values()), sum(packed.values())
+    print(f"{'total':<12} {total_per_frame:10d} {total_packed:8d} {total_per_frame / total_packed:7.1f}x")
+    for label, container in (('per-frame', per_frame_container), ('packs', packed_container)):
+        kinds = ', '.join(f"{kind} {count}" for kind, count in sorted(container.requests.items()))
+        print(f"{label:<10} {kinds}; {container.bytes_read / (1024 ** 2):.1f} MB read")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Bulk frame pre-extraction benchmark against a local blob-storage stand-in.
+
+Runs FrameIngestor over a synthetic video, uploading into an Azurite
+'frames' container, and reports end-to-end frames/sec. Start Azurite first:
+
+    docker run -p 10000:10000 mcr.microsoft.com/azure-storage/azurite azurite-blob --blobHost 0.0.0.0
+
+Usage (from annotation-service/):
+    python benchmarks/bench_ingest.py --frames 900 --encode-workers 4 --upload-concurrency 16
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from common import blob_service_client, ensure_container, make_video
+from app.frame_decoder import encode_jpeg
+from app.frame_ingest import FrameIngestor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=900)
+    parser.add_argument('--encode-workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--upload-concurrency', type=int, default=16)
+    parser.add_argument('--max-width', type=int, default=1280)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    video_path = os.path.join(workdir, 'bench.mp4')
+    make_video(video_path, args.frames)
+
+    frames_container = ensure_container(blob_service_client(), 'frames')
+    blob_name = f"raw-videos/bench/{int(time.time())}_bench.mp4"
+
+    ingestor = FrameIngestor(
+        frames_container_client=frames_container,
+        get_video_path=lambda _: video_path,
+        encode_frame=lambda frame: encode_jpeg(frame, args.max_width),
+        frame_blob_name=lambda name, n: f"{name}/frame_{n:06d}.jpg",
+        encode_workers=args.encode_workers,
+        upload_concurrency=args.upload_concurrency
+    )
+
+    start = time.perf_counter()
+    job = ingestor.submit(blob_name)
+    while not job.done:
+        time.sleep(0.2)
+    elapsed = time.perf_counter() - start
+
+    status = job.to_dict()
+    print(f"status={status['status']} uploaded={status['uploadedFrames']} "
+          f"skipped={status['skippedFrames']} in {elapsed:.1f}s "
+          f"({status['uploadedFrames'] / elapsed:.1f} frames/s)")
+    if status['error']:
+        print(f"error: {status['error']}")
+
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
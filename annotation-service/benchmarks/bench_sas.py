@@ -0,0 +1,81 @@
+"""
+SAS issuance micro-benchmark.
+
+Issues read SAS URLs from several threads, either fetching a user
+delegation key per URL (what the endpoints used to do) or through the
+shared DelegationKeyCache, against an in-process key service with a fixed
+AAD round-trip latency. Reports URLs/sec, latency percentiles and how many
+keys were requested.
+
+Usage (from annotation-service/):
+    python benchmarks/bench_sas.py --urls 2000 --threads 16 --key-latency-ms 80
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from common import StandInKeyService
+from azure.storage.blob import BlobSasPermissions, generate_blob_sas
+from app.sas import DelegationKeyCache, SasIssuer
+
+ACCOUNT = 'benchaccount'
+
+
+def run(name, issue, urls, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def one(i):
+        start = time.perf_counter()
+        issue(f"raw-videos/bench/video_{i}.mp4")
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(urls)))
+    total = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{name:>10}: {urls / total:10.0f} URLs/s  "
+          f"p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--urls', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--key-latency-ms', type=float, default=80)
+    args = parser.parse_args()
+
+    service = StandInKeyService(latency=args.key_latency_ms / 1000)
+
+    def per_request(blob_name):
+        start_time = datetime.utcnow()
+        expiry_time = start_time + timedelta(hours=2)
+        key = service.get_user_delegation_key(key_start_time=start_time, key_expiry_time=expiry_time)
+        generate_blob_sas(account_name=ACCOUNT, container_name='videos', blob_name=blob_name,
+                          user_delegation_key=key, permission=BlobSasPermissions(read=True),
+                          expiry=expiry_time)
+
+    run('per-request', per_request, args.urls, args.threads)
+    print(f"{'':>10}  key requests: {service.calls}")
+
+    service.calls = 0
+    issuer = SasIssuer(ACCOUNT, DelegationKeyCache(service))
+
+    def cached(blob_name):
+        issuer.sas_url('videos', blob_name, permission=BlobSasPermissions(read=True),
+                       expiry=datetime.utcnow() + timedelta(hours=2))
+
+    run('cached', cached, args.urls, args.threads)
+    print(f"{'':>10}  key requests: {service.calls}")
+
+
+if __name__ == '__main__':
+    main()
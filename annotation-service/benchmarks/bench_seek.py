@@ -0,0 +1,84 @@
+"""
+Worst-case random seek latency: OpenCV frame-number seek vs. keyframe index.
+
+Builds a long-GOP clip, indexes it with the MP4 parser, then seeks (in
+shuffled order) to the last frame of every GOP - the frame furthest from
+its keyframe - through an OpenCV DecoderSession and an index-guided
+KeyframeDecoderSession (PyAV). Each result is compared against a linear
+decode to count frames that landed on the wrong picture.
+
+Usage (from annotation-service/):
+    python benchmarks/bench_seek.py --frames 1500 --gop 300
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from common import make_video
+from app.frame_decoder import DecoderSession, KeyframeDecoderSession, av
+from app.mp4_index import parse_mp4_file
+from app.video_index import VideoIndex
+
+
+def measure(session, targets, truth):
+    latencies, wrong = [], 0
+    for n in targets:
+        start = time.perf_counter()
+        # max_forward_skip=0 forces every read to seek
+        frame = session.read(n, max_forward_skip=0)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if frame is None or np.abs(frame.astype(np.int16) - truth[n]).mean() > 2:
+            wrong += 1
+    session.release()
+    latencies.sort()
+    return latencies, wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=1500)
+    parser.add_argument('--gop', type=int, default=300)
+    args = parser.parse_args()
+
+    if av is None:
+        raise SystemExit('PyAV is required for the index-guided decoder (pip install av)')
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'long-gop.mp4')
+    make_video(path, args.frames, gop=args.gop)
+
+    index = VideoIndex.from_mp4('bench', parse_mp4_file(path))
+    targets = [k - 1 for k in index.keyframes[1:]] + [index.frame_count - 1]
+    random.Random(7).shuffle(targets)
+
+    # Ground truth from one linear decode
+    wanted, truth = set(targets), {}
+    cap = cv2.VideoCapture(path)
+    for n in range(index.frame_count):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if n in wanted:
+            truth[n] = frame.astype(np.int16)
+    cap.release()
+
+    print(f"{index.frame_count} frames, {len(index.keyframes)} keyframes, {len(targets)} worst-case seeks")
+    print(f"{'decoder':<22}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'wrong':>8}")
+    for label, session in (('opencv frame seek', DecoderSession(path)),
+                           ('keyframe index', KeyframeDecoderSession(path, index))):
+        latencies, wrong = measure(session, targets, truth)
+        p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+        print(f"{label:<22}{statistics.median(latencies):>10.1f}{p99:>10.1f}{latencies[-1]:>10.1f}{wrong:>8}")
+
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
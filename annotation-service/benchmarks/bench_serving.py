@@ -0,0 +1,102 @@
+"""
+Serving-mode load test: gunicorn sync workers vs. the ASGI mode.
+
+Simulates many concurrent annotators against a running annotation service.
+Each virtual annotator loops over a realistic request mix (steps through
+cached frames, reloads annotations and classes, lists projects) with no
+think time, and the run reports throughput and latency percentiles per
+endpoint. Browser caches are not simulated (no If-None-Match), so every
+request reaches the server.
+
+Start the service in each mode against the same storage account, warm the
+frames first (e.g. POST /api/videos/<blob>/ingest), then run:
+
+    gunicorn --bind 0.0.0.0:5000 --workers 2 --timeout 120 app.main:app
+    python benchmarks/bench_serving.py --video raw-videos/bench/video.mp4 --users 200
+
+    gunicorn --bind 0.0.0.0:5000 --workers 2 --timeout 120 \\
+        -k uvicorn.workers.UvicornWorker app.asgi:app
+    python benchmarks/bench_serving.py --video raw-videos/bench/video.mp4 --users 200
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+
+import aiohttp
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def annotator(session, base_url, video, frames, deadline, results):
+    project = video.split('/')[1]
+    frame = random.randrange(frames)
+    requests = [
+        ('frame', lambda: f"/api/videos/{video}/frame/{frame}"),
+        ('frame', lambda: f"/api/videos/{video}/frame/{frame}"),
+        ('frame', lambda: f"/api/videos/{video}/frame/{frame}"),
+        ('annotations', lambda: f"/api/annotations/{video}"),
+        ('classes', lambda: f"/api/projects/{project}/classes"),
+        ('projects', lambda: "/api/projects?limit=200"),
+    ]
+    while time.perf_counter() < deadline:
+        name, path = random.choice(requests)
+        start = time.perf_counter()
+        try:
+            async with session.get(base_url + path()) as response:
+                await response.read()
+                ok = response.status < 500
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            ok = False
+        results[name].append((time.perf_counter() - start, ok))
+        if name == 'frame':
+            frame = (frame + 1) % frames
+
+
+async def run(args):
+    results = defaultdict(list)
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(
+            annotator(session, args.url, args.video, args.frames, deadline, results)
+            for _ in range(args.users)
+        ))
+        elapsed = time.perf_counter() - start
+
+    total = sum(len(r) for r in results.values())
+    print(f"{args.users} annotators, {elapsed:.1f}s: {total / elapsed:.0f} req/s")
+    print(f"{'endpoint':>12} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    all_latencies = []
+    for name, samples in sorted(results.items()):
+        latencies = [latency for latency, _ in samples]
+        all_latencies += latencies
+        errors = sum(1 for _, ok in samples if not ok)
+        print(f"{name:>12} {len(samples):9d} {errors:7d} "
+              f"{statistics.median(latencies) * 1000:8.1f} {percentile(latencies, 0.99) * 1000:8.1f} "
+              f"{max(latencies) * 1000:8.1f}")
+    print(f"{'all':>12} {len(all_latencies):9d} {'':>7} "
+          f"{statistics.median(all_latencies) * 1000:8.1f} {percentile(all_latencies, 0.99) * 1000:8.1f} "
+          f"{max(all_latencies) * 1000:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--video', required=True, help='blob name of a video with extracted frames')
+    parser.add_argument('--frames', type=int, default=300, help='frames to cycle through')
+    parser.add_argument('--users', type=int, default=200, help='concurrent annotators')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--timeout', type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
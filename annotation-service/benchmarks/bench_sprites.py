@@ -0,0 +1,127 @@
+"""
+Timeline sprite sheets: generation cost, and requests and bytes to scrub a
+whole video with sprites vs. per-frame thumbnails.
+
+Builds the sprite sheets of a synthetic video (or --video) with
+SpriteSheets against an in-process container, timing the single decode
+pass. It then compares scrubbing the whole timeline two ways:
+- sprites: the index plus every sheet;
+- thumbnails: one tier=thumbnail request for every frame the slider lands
+  on (every --scrub-step-th frame). The size is measured from a sample of
+  frames encoded as the service would.
+
+Usage (from annotation-service/):
+    python benchmarks/bench_sprites.py --frames 3000 --stride 30
+"""
+import argparse
+import os
+import tempfile
+import time
+import types
+from collections import Counter
+
+from common import make_video
+from azure.core.exceptions import ResourceNotFoundError
+from app.frame_decoder import encode_image
+from app.sprite_sheets import SpriteSheets
+
+VIDEO = 'raw-videos/bench/clip.mp4'
+
+
+class _StandInBlob:
+    def __init__(self, container, name):
+        self.container = container
+        self.name = name
+
+    def download_blob(self):
+        self.container.requests['GET'] += 1
+        if self.name not in self.container.blobs:
+            raise ResourceNotFoundError(self.name)
+        data = self.container.blobs[self.name]
+        return types.SimpleNamespace(readall=lambda: data)
+
+    def upload_blob(self, data, overwrite=False):
+        self.container.requests['PUT'] += 1
+        self.container.blobs[self.name] = data.encode() if isinstance(data, str) else bytes(data)
+
+
+class CountingFrames:
+    """Frames container stand-in that counts requests"""
+
+    def __init__(self):
+        self.blobs = {}
+        self.requests = Counter()
+
+    def get_blob_client(self, name):
+        return _StandInBlob(self, name)
+
+
+def thumbnail_kb(path, samples, width):
+    """Mean KB of a tier=thumbnail JPEG over evenly spaced frames"""
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    sizes = []
+    for n in range(0, total, max(1, total // samples)):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, n)
+        ret, frame = cap.read()
+        if not ret:
+            break
+        sizes.append(len(encode_image(frame, width, 70)))
+    cap.release()
+    return sum(sizes) / len(sizes) / 1024
+
+
+def run(path, args):
+    container = CountingFrames()
+    sprites = SpriteSheets(container, get_video_path=lambda blob_name: path,
+                           get_video_etag=lambda blob_name: '"bench"', columns=args.columns,
+                           rows=args.rows, tile_width=args.tile_width, status_interval=3600)
+    start = time.perf_counter()
+    job = sprites.submit(VIDEO, args.stride)
+    while not job.done:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    if job.status != 'completed':
+        raise SystemExit(f"sprite generation failed: {job.error}")
+
+    index = sprites.load_index(VIDEO, args.stride)
+    sheet_bytes = sum(len(container.blobs[sprites.sheet_name(VIDEO, args.stride, sheet['sheet'])])
+                      for sheet in index['sheets'])
+    print(f"{index['frameCount']} frames, stride {args.stride}: {index['tiles']} tiles of "
+          f"{index['tileWidth']}x{index['tileHeight']} on {len(index['sheets'])} sheets "
+          f"({sheet_bytes / 1024:.0f} KB) in {elapsed:.2f}s "
+          f"({index['frameCount'] / elapsed:.0f} frames/s decoded)")
+
+    positions = -(-index['frameCount'] // args.scrub_step)
+    per_thumbnail = thumbnail_kb(path, 20, args.thumbnail_width)
+    print(f"\nScrubbing the whole timeline (slider lands on every {args.scrub_step}th frame):")
+    print(f"{'':<12} {'requests':>9} {'KB':>9}")
+    print(f"{'sprites':<12} {1 + len(index['sheets']):9d} {sheet_bytes / 1024:9.0f}")
+    print(f"{'thumbnails':<12} {positions:9d} {positions * per_thumbnail:9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=3000)
+    parser.add_argument('--video', help='build sprites of this file instead of a synthetic video')
+    parser.add_argument('--stride', type=int, default=30)
+    parser.add_argument('--columns', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--tile-width', type=int, default=160)
+    parser.add_argument('--thumbnail-width', type=int, default=320)
+    parser.add_argument('--scrub-step', type=int, default=1, help='frames between slider positions')
+    args = parser.parse_args()
+
+    if args.video:
+        run(args.video, args)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.mp4')
+            make_video(path, args.frames)
+            run(path, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Shared helpers for the annotation-service benchmarks"""
+import os
+import shutil
+import subprocess
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Well-known Azurite development account (https://learn.microsoft.com/azure/storage/common/storage-use-azurite)
+AZURITE_CONNECTION_STRING = (
+    "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+    "AccountKey=Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw==;"
+    "BlobEndpoint=http://127.0.0.1:10000/devstoreaccount1;"
+)
+
+
+def make_video(path, frames, width=1920, height=1080, fps=30, gop=250):
+    """Write a synthetic moving-gradient video, re-encoded with a long GOP if ffmpeg is available"""
+    import cv2
+    import numpy as np
+
+    raw_path = path + '.raw.mp4'
+    writer = cv2.VideoWriter(raw_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    x = np.linspace(0, 255, width, dtype=np.uint8)
+    for i in range(frames):
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        frame[:, :, 0] = np.roll(x, i * 4)
+        frame[:, :, 1] = (i * 3) % 256
+        cv2.putText(frame, str(i), (50, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 255), 8)
+        writer.write(frame)
+    writer.release()
+
+    if shutil.which('ffmpeg'):
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-i', raw_path,
+                        '-c:v', 'libx264', '-g', str(gop), '-keyint_min', str(gop),
+                        '-sc_threshold', '0', '-pix_fmt', 'yuv420p',
+                        '-movflags', '+faststart', path], check=True)
+        os.unlink(raw_path)
+    else:
+        print('ffmpeg not found, using OpenCV mp4v encoding (short GOP)')
+        os.replace(raw_path, path)
+
+
+def blob_service_client():
+    """BlobServiceClient for a local Azurite stand-in (override with BENCH_STORAGE_CONNECTION_STRING)"""
+    from azure.storage.blob import BlobServiceClient
+    return BlobServiceClient.from_connection_string(
+        os.getenv('BENCH_STORAGE_CONNECTION_STRING', AZURITE_CONNECTION_STRING))
+
+
+def ensure_container(service_client, name):
+    container_client = service_client.get_container_client(name)
+    if not container_client.exists():
+        container_client.create_container()
+    return container_client
+
+
+class _StandInDownload:
+    """Subset of StorageStreamDownloader backed by in-memory bytes, throttled to a fixed rate"""
+
+    def __init__(self, data, bytes_per_sec, chunk_size=4 * 1024 * 1024):
+        self.data = data
+        self.size = len(data)
+        self.bytes_per_sec = bytes_per_sec
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        for offset in range(0, self.size, self.chunk_size):
+            chunk = self.data[offset:offset + self.chunk_size]
+            time.sleep(len(chunk) / self.bytes_per_sec)
+            yield chunk
+
+    def readall(self):
+        return b''.join(self.chunks())
+
+    def readinto(self, stream):
+        for chunk in self.chunks():
+            stream.write(chunk)
+        return self.size
+
+
+class _StandInBlob:
+    def __init__(self, container, name):
+        self.container = container
+        self.name = name
+
+    def get_blob_properties(self):
+        data = self.container.blobs[self.name]
+        return types.SimpleNamespace(etag=f'"{hash(data) & 0xffffffff:x}"', size=len(data))
+
+    def download_blob(self, offset=None, length=None, **kwargs):
+        data = self.container.blobs[self.name]
+        if offset is not None:
+            data = data[offset:offset + length if length else None]
+        return _StandInDownload(data, self.container.bytes_per_sec)
+
+
+class StandInContainer:
+    """In-process container client stand-in with throttled downloads, for contention tests"""
+
+    def __init__(self, blobs, bytes_per_sec=50 * 1024 * 1024):
+        self.blobs = blobs
+        self.bytes_per_sec = bytes_per_sec
+
+    def get_blob_client(self, name):
+        return _StandInBlob(self, name)
+
+
+class StandInKeyService:
+    """Stand-in for BlobServiceClient.get_user_delegation_key with a fixed AAD round-trip latency"""
+
+    def __init__(self, latency=0.08):
+        self.latency = latency
+        self.calls = 0
+
+    def get_user_delegation_key(self, key_start_time, key_expiry_time):
+        import base64
+        from azure.storage.blob import UserDelegationKey
+
+        time.sleep(self.latency)
+        self.calls += 1
+        key = UserDelegationKey()
+        key.signed_oid = key.signed_tid = '00000000-0000-0000-0000-000000000000'
+        key.signed_start = key_start_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+        key.signed_expiry = key_expiry_time.strftime('%Y-%m-%dT%H:%M:%SZ')
+        key.signed_service = 'b'
+        key.signed_version = '2023-11-03'
+        key.value = base64.b64encode(os.urandom(32)).decode()
+        return key
@@ -64,7 +64,7 @@ const VideoUpload = ({ onUploadComplete }) => {
         contentType: selectedFile.type
       })
 
-      const { sasUrl, blobUrl } = sasResponse.data
+      const { sasUrl, blobUrl, blobName } = sasResponse.data
 
       // Step 2: Upload directly to Azure Blob Storage
       await axios.put(sasUrl, selectedFile, {
@@ -85,6 +85,7 @@ const VideoUpload = ({ onUploadComplete }) => {
         projectName: projectName.trim(),
         fileName: selectedFile.name,
         blobUrl,
+        blobName,
         fileSize: selectedFile.size
       })
 